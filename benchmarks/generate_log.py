@@ -0,0 +1,544 @@
+#!/usr/bin/env python3
+"""
+Synthetic raid log generator for the benchmarks.
+
+Writes logs of any size using the line formats AdvancedLogger.lua writes, either the regular combat log that
+format_log_for_upload.py formats or the raw log (unit GUIDs instead of names) that wasted_sunders_raw.py reads:
+cast lines with raid marks, COMBATANT_INFO records with pets, AGGRO/MARK/MODEL_UPDATE/CHAT_MSG/LOOT/ZONE_INFO
+lines, "You ..." lines of the logging player, pet, totem and summoned pet lines, and Sunder Armor cast/miss/afflicted
+sequences.  The same seed always gives the same log.
+
+Usage: python benchmarks/generate_log.py <output> <size, e.g. 10MB> [--raw] [--seed N]
+"""
+
+import argparse
+import random
+from datetime import datetime, timedelta
+
+# the player whose client wrote the log, pass this name to format_log_for_upload.py
+LOGGING_PLAYER = "Qcb"
+
+marks = ["Star", "Circle", "Diamond", "Triangle", "Moon", "Square", "Cross", "Skull"]
+
+# name, class, pet
+roster = [
+    ("Qcb", "WARRIOR", None), ("Khoni", "WARRIOR", None), ("Ehawne", "WARRIOR", None), ("Brakk", "WARRIOR", None),
+    ("Gorrim", "WARRIOR", None), ("Thazz", "WARRIOR", None), ("Ulgrak", "WARRIOR", None), ("Morvok", "WARRIOR", None),
+    ("Sneakz", "ROGUE", None), ("Vexa", "ROGUE", None), ("Shivv", "ROGUE", None), ("Kelthar", "ROGUE", None),
+    ("Pepopo", "MAGE", None), ("Iseut", "MAGE", None), ("Jäina", "MAGE", None), ("Frostwick", "MAGE", None),
+    ("Zalmar", "MAGE", None), ("Lockz", "WARLOCK", "Kzaal"), ("Dotbot", "WARLOCK", "Dotbot"),
+    ("Feldra", "WARLOCK", "Grubnik"), ("Nethis", "WARLOCK", "Zhar'kaan"), ("Hunterx", "HUNTER", "Wolfie"),
+    ("Arrowyn", "HUNTER", "Broken Tooth"), ("Shino", "HUNTER", "Shino"), ("Milkpress", "PRIEST", None),
+    ("Halowen", "PRIEST", None), ("Lightra", "PRIEST", None), ("Mendis", "PRIEST", None), ("Umbrel", "PRIEST", None),
+    ("Thrall", "SHAMAN", None), ("Stormka", "SHAMAN", None), ("Rakkir", "SHAMAN", None), ("Volju", "SHAMAN", None),
+    ("Barkley", "DRUID", None), ("Oakhorn", "DRUID", None), ("Mooncalf", "DRUID", None), ("Thornis", "DRUID", None),
+    ("Gazlowe", "WARRIOR", None), ("Krexx", "ROGUE", None), ("Sylvane", "MAGE", None),
+]
+
+# tanks get the aggro and are the usual targets of mob melee
+tank_names = ["Khoni", "Ehawne"]
+
+# spell name, spell id, rank, cast time in ms (0 for instant, None for channelled), school
+class_spells = {
+    "WARRIOR": [("Heroic Strike", 25286, "Rank 9", 0, "Physical"), ("Bloodthirst", 23894, "Rank 4", 0, "Physical"),
+                ("Whirlwind", 1680, "", 0, "Physical"), ("Battle Shout", 25289, "Rank 7", 0, None),
+                ("Bloodrage", 2687, "", 0, None), ("Execute", 20662, "Rank 5", 0, "Physical")],
+    "ROGUE": [("Sinister Strike", 11294, "Rank 8", 0, "Physical"), ("Eviscerate", 31016, "Rank 9", 0, "Physical"),
+              ("Slice and Dice", 6774, "Rank 2", 0, None), ("Backstab", 25300, "Rank 9", 0, "Physical")],
+    "MAGE": [("Frostbolt", 10181, "Rank 11", 3000, "Frost"), ("Fireball", 25306, "Rank 12", 3500, "Fire"),
+             ("Arcane Explosion", 10202, "Rank 6", 0, "Arcane"), ("Evocation", 12051, "", None, None)],
+    "WARLOCK": [("Shadow Bolt", 25307, "Rank 10", 3000, "Shadow"), ("Corruption", 25311, "Rank 7", 0, "Shadow"),
+                ("Life Tap", 11689, "Rank 6", 0, None), ("Drain Life", 11700, "Rank 6", None, "Shadow")],
+    "HUNTER": [("Aimed Shot", 20904, "Rank 6", 3000, "Physical"), ("Multi-Shot", 25294, "Rank 5", 0, "Physical"),
+               ("Arcane Shot", 14287, "Rank 8", 0, "Arcane"), ("Auto Shot", 75, "", 0, "Physical")],
+    "PRIEST": [("Greater Heal", 25314, "Rank 5", 2500, None), ("Flash Heal", 10917, "Rank 7", 1500, None),
+               ("Renew", 25315, "Rank 10", 0, None), ("Power Word: Shield", 10901, "Rank 10", 0, None),
+               ("Mind Flay", 18807, "Rank 6", None, "Shadow")],
+    "SHAMAN": [("Chain Heal", 10623, "Rank 3", 2500, None), ("Healing Wave", 25357, "Rank 10", 3000, None),
+               ("Earth Shock", 10414, "Rank 7", 0, "Nature"), ("Windfury Totem", 10614, "Rank 3", 0, None)],
+    "DRUID": [("Healing Touch", 9889, "Rank 11", 3500, None), ("Rejuvenation", 25299, "Rank 11", 0, None),
+              ("Regrowth", 9858, "Rank 9", 2000, None), ("Moonfire", 9835, "Rank 10", 0, "Arcane")],
+}
+
+# stacking armor and vulnerability debuffs: caster class, cast spell, id, rank, debuff name, max stacks
+debuff_spells = [
+    ("WARLOCK", "Curse of Recklessness", 11717, "Rank 4", "Curse of Recklessness", 1),
+    ("DRUID", "Faerie Fire", 9907, "Rank 4", "Faerie Fire", 1),
+    ("ROGUE", "Expose Armor", 11198, "Rank 5", "Expose Armor", 1),
+    ("MAGE", "Scorch", 10207, "Rank 7", "Fire Vulnerability", 5),
+    ("PRIEST", "Mind Blast", 10947, "Rank 9", "Shadow Weaving", 5),
+]
+
+buffs = ["Battle Shout", "Power Word: Fortitude", "Arcane Intellect", "Mark of the Wild", "Blessing of Might",
+         "Renew", "Rejuvenation", "Flask of the Titans", "Juju Power", "Windfury Totem", "Sartura's Blessing"]
+
+totems = ["Searing Totem V", "Magma Totem IV", "Windfury Totem III", "Mana Spring Totem IV", "Tremor Totem"]
+totem_attacks = {"Searing Totem V": "Attack", "Magma Totem IV": "Fire Nova"}
+summoned_pets = ["Greater Feral Spirit", "Battle Chicken", "Arcanite Dragonling", "Explosive Trap III"]
+ignored_pets = ["Razorgore the Untamed", "Deathknight Understudy"]
+
+# instance name, instance id, trash, bosses with a yell
+instances = [
+    ("Molten Core", 409, ["Core Hound", "Molten Giant", "Firelord", "Lava Surger", "Flamewaker Protector"],
+     [("Lucifron", "Impudent whelps! You've rushed headlong to your own deaths!"),
+      ("Magmadar", "Magmadar goes into a killing frenzy!"),
+      ("Garr", "Garr's fury courses through you!"),
+      ("Ragnaros", "BY FIRE BE PURGED!")]),
+    ("Blackwing Lair", 469, ["Blackwing Legionnaire", "Death Talon Wyrmguard", "Blackwing Warlock"],
+     [("Razorgore the Untamed", "Foolish mortals! You will not escape!"),
+      ("Vaelastrasz the Corrupt", "Too late... friends. Nefarius' corruption has taken hold."),
+      ("Chromaggus", "Chromaggus goes into a killing frenzy!"),
+      ("Nefarian", "BURN! You wretches! BURN!")]),
+    ("Ahn'Qiraj", 531, ["Anubisath Defender", "Qiraji Champion", "Obsidian Eradicator", "Sartura's Royal Guard"],
+     [("The Prophet Skeram", "Are you so eager to die? I will be happy to accommodate you."),
+      ("Battleguard Sartura", "I sentence you to death!"),
+      ("Princess Huhuran", "Princess Huhuran goes into a frenzy!"),
+      ("Ouro", "Ouro begins to submerge!")]),
+    ("Naxxramas", 533, ["Plagued Ghoul", "Necro Knight", "Sorrow Spinner", "Naxxramas Worshipper"],
+     [("Anub'Rekhan", "Just a little taste..."),
+      ("Grand Widow Faerlina", "Kneel before me, worm!"),
+      ("Instructor Razuvious", "Do as I taught you!"),
+      ("Patchwerk", "Patchwerk want to play!")]),
+]
+
+loot_items = [(17076, "Bonereaver's Edge"), (16901, "Stormrage Legguards"), (19019, "Thunderfury, Blessed Blade"),
+              (21126, "Death's Sting"), (22691, "Corrupted Ashbringer"), (18814, "Choker of the Fire Lord")]
+
+pull_gap = (30000, 150000)  # ms between pulls
+raid_night_length = 3 * 3600 * 1000 + 1800 * 1000
+
+
+def parse_size(text):
+    """Parse a size like 10MB, 1GB, 512KB or a plain byte count"""
+    text = text.strip().upper()
+    for suffix, factor in (("GB", 1024 ** 3), ("MB", 1024 ** 2), ("KB", 1024), ("B", 1)):
+        if text.endswith(suffix):
+            return int(float(text[:-len(suffix)]) * factor)
+    return int(text)
+
+
+class Unit:
+    """A player, pet, totem or mob in the generated log"""
+
+    def __init__(self, name, guid, unit_class=None, owner=None):
+        self.name = name
+        self.guid = guid
+        self.unit_class = unit_class
+        self.owner = owner
+        self.mark = None
+        # pets show up with their owner's name in the log
+        self.log_name = f"{name} ({owner.name})" if owner else name
+
+
+class LogGenerator:
+    """Writes a synthetic raid log, one raid night after another until the requested size is reached"""
+
+    def __init__(self, raw=False, seed=1):
+        self.raw = raw
+        self.random = random.Random(seed)
+        self.start = datetime(2024, 11, 27, 19, 30)
+        self.clock = 0  # ms since start
+        self.second = None
+        self.prefix = ""
+        self.size = 0
+        self.limit = 0
+        self.lines = 0
+        self.buffer = []
+        self.output = None
+        self.next_guid = 0x2A0000
+
+        self.players = []
+        for index, (name, unit_class, pet_name) in enumerate(roster):
+            player = Unit(name, f"0x{0x440A00 + index:016X}", unit_class)
+            player.pet = Unit(pet_name, self.new_guid(0xF140), owner=player) if pet_name else None
+            self.players.append(player)
+        self.me = next(player for player in self.players if player.name == LOGGING_PLAYER)
+        self.tanks = [player for player in self.players if player.name in tank_names]
+        self.by_class = {}
+        for player in self.players:
+            self.by_class.setdefault(player.unit_class, []).append(player)
+        self.warriors = self.by_class["WARRIOR"]
+        self.pets = [player.pet for player in self.players if player.pet]
+
+        self.events = []
+        for event, weight in ((self.melee_event, 14), (self.spell_damage_event, 10), (self.cast_event, 12),
+                              (self.heal_event, 8), (self.aura_event, 8), (self.you_event, 10), (self.pet_event, 6),
+                              (self.totem_event, 3), (self.summoned_pet_event, 1), (self.mob_attack_event, 8),
+                              (self.sunder_event, 3), (self.debuff_event, 4), (self.misc_event, 2)):
+            self.events.extend([event] * weight)
+
+    def new_guid(self, high):
+        self.next_guid += 1
+        return f"0x{high:04X}{self.random.randrange(0x1000, 0xFFFF):06X}{self.next_guid:06X}"
+
+    def timestamp(self):
+        second = self.clock // 1000
+        if second != self.second:
+            self.second = second
+            moment = self.start + timedelta(seconds=second)
+            self.prefix = f"{moment.month}/{moment.day} {moment.hour}:{moment.minute:02d}:{moment.second:02d}."
+        return f"{self.prefix}{self.clock % 1000:03d}  "
+
+    def emit(self, body):
+        line = self.timestamp() + body + "\n"
+        self.buffer.append(line)
+        self.size += len(line)
+        self.lines += 1
+        if len(self.buffer) >= 4096:
+            self.flush()
+
+    def flush(self):
+        self.output.write("".join(self.buffer))
+        self.buffer = []
+
+    @property
+    def done(self):
+        return self.size >= self.limit
+
+    def tick(self, low=0, high=90):
+        self.clock += self.random.randint(low, high)
+
+    def date_stamp(self):
+        moment = self.start + timedelta(milliseconds=self.clock)
+        return moment.strftime("%d.%m.%y %H:%M:%S")
+
+    # how units appear in the regular combat messages, GUIDs in the raw log
+    def ref(self, unit):
+        return unit.guid if self.raw else unit.log_name
+
+    # how units appear in AdvancedLogger's cast lines
+    def cast_name(self, unit):
+        name = f"{unit.log_name}({unit.mark})" if unit.mark else unit.log_name
+        return f"{unit.guid}({name})" if self.raw else name
+
+    def display(self, unit):
+        mark = f"({unit.mark})" if unit.mark else ""
+        text = f"{unit.name}({unit.guid}){mark}"
+        if unit.owner:
+            text += f" owner {unit.owner.name}({unit.owner.guid})"
+        return text
+
+    def cast_line(self, caster, verb, spell, spell_id, rank, target=None):
+        rank_text = f"({rank})" if rank else ""
+        target_text = f" on {self.cast_name(target)}" if target else ""
+        return f"{self.cast_name(caster)} {verb} {spell}({spell_id}){rank_text}{target_text}."
+
+    def write(self, filename, size):
+        """Write a log of about size bytes to filename, returns the number of lines"""
+        self.limit = size
+        with open(filename, "w", encoding="utf-8", newline="") as self.output:
+            while not self.done:
+                self.raid_night()
+            self.flush()
+        return self.lines
+
+    def raid_night(self):
+        night_start = self.clock
+        instance, instance_id, trash, bosses = self.random.choice(instances)
+        self.emit(f"ZONE_INFO: {self.date_stamp()}&{instance}&{instance_id}")
+        for player in self.players:
+            self.combatant_info(player)
+        boss_index = 0
+        while not self.done and self.clock - night_start < raid_night_length:
+            self.tick(*pull_gap)
+            if self.random.random() < 0.3 and boss_index < len(bosses):
+                self.pull([bosses[boss_index][0]], bosses[boss_index][1])
+                boss_index += 1
+            else:
+                self.pull(self.random.sample(trash, self.random.randint(1, min(4, len(trash)))))
+        # next raid two or three days later
+        moment = self.start + timedelta(milliseconds=self.clock)
+        next_night = (moment + timedelta(days=self.random.choice([2, 3]))).replace(hour=19, minute=30, second=0)
+        self.clock = int((next_night - self.start).total_seconds() * 1000)
+
+    def combatant_info(self, player):
+        gear = "&".join(f"{self.random.randint(10000, 23000)}:0:0:0" if slot != 3 else "nil" for slot in range(19))
+        talents = "}".join("".join(str(self.random.randint(0, 5)) for _ in range(16)) for _ in range(3))
+        pet = player.pet.name if player.pet else "nil"
+        self.emit(f"COMBATANT_INFO: {self.date_stamp()}&{player.name}&{player.unit_class}&Orc&2&{pet}&Benchmark"
+                  f"&Raider&3&{gear}&{talents if player is self.me else 'nil'}")
+
+    def pull(self, mob_names, yell=None):
+        self.mobs = []
+        for name in mob_names:
+            for _ in range(1 if yell else self.random.randint(1, 3)):
+                self.mobs.append(Unit(name, self.new_guid(0xF130)))
+        self.stacks = {}
+        self.marked_players = []
+
+        for mob, mark in zip(self.mobs, reversed(marks)):
+            if self.random.random() < 0.7:
+                mob.mark = mark
+                self.emit(f"MARK: {mob.name}({mob.guid}) is {mark}")
+                self.tick(0, 5)
+        if self.random.random() < 0.1:
+            tank = self.random.choice(self.tanks)
+            tank.mark = "Diamond"
+            self.marked_players.append(tank)
+            self.emit(f"MARK: {tank.name}({tank.guid}) is Diamond")
+        if yell:
+            self.emit(f"CHAT_MSG: CHAT_MSG_MONSTER_YELL&{mob_names[0]}&{yell}")
+        for mob in self.mobs:
+            target = self.display(self.random.choice(self.tanks)) if self.random.random() < 0.95 else "no_target"
+            self.emit(f"AGGRO: {self.display(mob)} aggro {target}")
+            self.tick(0, 20)
+
+        length = self.random.randint(2000, 8000) if yell else self.random.randint(300, 1500)
+        for _ in range(length):
+            if self.done:
+                return
+            self.random.choice(self.events)()
+            self.tick()
+            if self.random.random() < 0.002:
+                mob = self.random.choice(self.mobs)
+                self.emit(f"MODEL_UPDATE: {mob.name}({mob.guid})")
+            if yell and self.random.random() < 0.001:
+                self.emit(f"CHAT_MSG: CHAT_MSG_RAID_BOSS_EMOTE&{mob_names[0]}&{yell}")
+
+        for mob in self.mobs:
+            if self.random.random() < 0.3:
+                self.emit(f"You have slain {self.ref(mob)}!")
+            else:
+                self.emit(f"{self.ref(mob)} dies.")
+            self.tick(0, 300)
+        if yell:
+            for _ in range(self.random.randint(1, 3)):
+                item_id, item = self.random.choice(loot_items)
+                link = f"|cffa335ee|Hitem:{item_id}:0:0:0|h[{item}]|h|r"
+                looter = self.random.choice(self.players)
+                if looter is self.me:
+                    self.emit(f"LOOT: {self.date_stamp()}&You receive loot: {link}.")
+                else:
+                    self.emit(f"LOOT: {self.date_stamp()}&{looter.name} receives loot: {link}.")
+            if self.random.random() < 0.2:
+                self.emit(f"LOOT_TRADE: {self.date_stamp()}&{self.random.choice(self.players).name} trades item "
+                          f"{self.random.choice(loot_items)[1]} to {self.random.choice(self.players).name}.")
+        for unit in self.mobs + self.marked_players:
+            unit.mark = None
+
+    def melee_event(self):
+        player = self.random.choice(self.players)
+        mob = self.random.choice(self.mobs)
+        roll = self.random.random()
+        if player is self.me:
+            if roll < 0.6:
+                self.emit(f"You hit {self.ref(mob)} for {self.random.randint(200, 900)}.")
+            elif roll < 0.85:
+                self.emit(f"You crit {self.ref(mob)} for {self.random.randint(500, 1800)}.")
+            else:
+                self.emit(f"You miss {self.ref(mob)}.")
+        elif roll < 0.6:
+            self.emit(f"{self.ref(player)} hits {self.ref(mob)} for {self.random.randint(200, 900)}.")
+        elif roll < 0.8:
+            self.emit(f"{self.ref(player)} crits {self.ref(mob)} for {self.random.randint(500, 1800)}.")
+        elif roll < 0.9:
+            self.emit(f"{self.ref(player)} misses {self.ref(mob)}.")
+        else:
+            self.emit(f"{self.ref(player)} attacks. {self.ref(mob)} {self.random.choice(['parries', 'dodges'])}.")
+
+    def spell_damage_event(self):
+        player = self.random.choice(self.players)
+        spell, _, _, _, school = self.random.choice([s for s in class_spells[player.unit_class] if s[4]])
+        mob = self.random.choice(self.mobs)
+        amount = self.random.randint(100, 3000)
+        damage = "" if school == "Physical" else f" {school} damage"
+        roll = self.random.random()
+        if player is self.me:
+            self.emit(f"Your {spell} {'crits' if roll < 0.2 else 'hits'} {self.ref(mob)} for {amount}{damage}.")
+        elif roll < 0.1:
+            self.emit(f"{self.ref(player)}'s {spell} was resisted by {self.ref(mob)}.")
+        elif roll < 0.25:
+            self.emit(f"{self.ref(mob)} suffers {amount}{damage or ' Physical damage'} from "
+                      f"{self.ref(player)}'s {spell}.")
+        elif roll < 0.3:
+            # DPSMate writes a space before the 's
+            self.emit(f"{self.ref(player)} 's {spell} hits {self.ref(mob)} for {amount}{damage}.")
+        else:
+            self.emit(f"{self.ref(player)}'s {spell} {'crits' if roll < 0.45 else 'hits'} {self.ref(mob)} "
+                      f"for {amount}{damage}.")
+
+    def cast_event(self):
+        player = self.random.choice(self.players)
+        spell, spell_id, rank, cast_time, school = self.random.choice(class_spells[player.unit_class])
+        target = self.random.choice(self.mobs) if school else self.random.choice(self.players)
+        if cast_time is None:
+            self.emit(self.cast_line(player, "channels", spell, spell_id, rank, target if school else None))
+            return
+        if cast_time:
+            self.emit(self.cast_line(player, "begins to cast", spell, spell_id, rank, target))
+            self.tick(0, cast_time // 10)
+            if self.random.random() < 0.05:
+                self.emit(self.cast_line(player, "fails casting", spell, spell_id, rank, target))
+                if player is self.me:
+                    self.emit(f"You fail to cast {spell}: Interrupted.")
+                return
+        self.emit(self.cast_line(player, "casts", spell, spell_id, rank, target if school or cast_time else None))
+
+    def heal_event(self):
+        healer = self.random.choice(self.by_class[self.random.choice(["PRIEST", "SHAMAN", "DRUID"])])
+        spell = self.random.choice([s[0] for s in class_spells[healer.unit_class] if s[4] is None])
+        target = self.random.choice(self.tanks + self.players[:10])
+        amount = self.random.randint(300, 3500)
+        verb = "critically heals" if self.random.random() < 0.15 else "heals"
+        if target is self.me:
+            self.emit(f"{self.ref(healer)}'s {spell} {verb} you for {amount}.")
+        elif self.random.random() < 0.3:
+            self.emit(f"{self.ref(target)} gains {amount} health from {self.ref(healer)}'s {spell}.")
+        else:
+            self.emit(f"{self.ref(healer)}'s {spell} {verb} {self.ref(target)} for {amount}.")
+
+    def aura_event(self):
+        player = self.random.choice(self.players)
+        buff = self.random.choice(buffs)
+        roll = self.random.random()
+        if player is self.me:
+            self.emit(f"You gain {buff} (1)." if roll < 0.6 else f"{buff} fades from you.")
+        elif roll < 0.6:
+            self.emit(f"{self.ref(player)} gains {buff} (1).")
+        else:
+            self.emit(f"{buff} fades from {self.ref(player)}.")
+
+    def you_event(self):
+        mob = self.random.choice(self.mobs)
+        roll = self.random.random()
+        if roll < 0.3:
+            self.emit(f"{self.ref(mob)} hits you for {self.random.randint(300, 2500)}.")
+        elif roll < 0.45:
+            self.emit(f"You gain {self.random.randint(5, 25)} Rage from {self.random.choice(['Bloodrage', 'Unbridled Wrath'])}.")
+        elif roll < 0.55:
+            self.emit(f"{self.ref(mob)} attacks. You {self.random.choice(['parry', 'dodge', 'block'])}.")
+        elif roll < 0.65:
+            self.emit(f"You are afflicted by {self.random.choice(['Sunder Armor', 'Living Bomb', 'Deep Wound'])} (1).")
+        elif roll < 0.75:
+            self.emit(f"You suffer {self.random.randint(100, 900)} Fire damage from {self.ref(mob)}'s Flame Breath.")
+        elif roll < 0.8:
+            self.emit("You fail to perform Execute: Not enough rage.")
+        elif roll < 0.85:
+            self.emit(f"You fall and lose {self.random.randint(100, 600)} health.")
+        else:
+            self.emit(f"Your Heroic Strike hits {self.ref(mob)} for {self.random.randint(400, 1200)}.")
+
+    def pet_event(self):
+        pet = self.random.choice(self.pets)
+        mob = self.random.choice(self.mobs)
+        roll = self.random.random()
+        if roll < 0.5:
+            self.emit(f"{self.ref(pet)} {'crits' if roll < 0.1 else 'hits'} {self.ref(mob)} for {self.random.randint(50, 400)}.")
+        elif roll < 0.7:
+            attack = "Firebolt" if pet.owner.unit_class == "WARLOCK" else "Claw"
+            self.emit(f"{self.ref(pet)}'s {attack} hits {self.ref(mob)} for {self.random.randint(50, 400)}.")
+        elif roll < 0.8:
+            self.emit(f"{self.ref(pet)} misses {self.ref(mob)}.")
+        elif roll < 0.9:
+            self.emit(f"{self.ref(mob)} hits {self.ref(pet)} for {self.random.randint(100, 1200)}.")
+        elif roll < 0.97:
+            self.emit(f"{self.ref(pet)} gains {self.random.choice(['Frenzy', 'Blood Pact', 'Paranoia'])} (1).")
+        else:
+            self.emit(f"{self.ref(pet)} dies.")
+
+    def totem_event(self):
+        shaman = self.random.choice(self.by_class["SHAMAN"])
+        totem = self.random.choice(totems)
+        mob = self.random.choice(self.mobs)
+        if totem in totem_attacks:
+            name = self.ref(Unit(totem, shaman.guid, owner=shaman)) if not self.raw else self.new_guid(0xF130)
+            separator = " 's" if self.random.random() < 0.3 else "'s"
+            self.emit(f"{name}{separator} {totem_attacks[totem]} hits {self.ref(mob)} for "
+                      f"{self.random.randint(40, 200)} Fire damage.")
+        else:
+            self.emit(self.cast_line(shaman, "casts", totem.rsplit(" ", 1)[0], 10614, "Rank 3"))
+
+    def summoned_pet_event(self):
+        mob = self.random.choice(self.mobs)
+        if self.random.random() < 0.2:
+            # mind controlled by priests
+            owner = self.random.choice(self.by_class["PRIEST"])
+            pet = Unit(self.random.choice(ignored_pets), self.new_guid(0xF130), owner=owner)
+        else:
+            owner = self.random.choice(self.by_class["HUNTER"] + self.by_class["SHAMAN"])
+            pet = Unit(self.random.choice(summoned_pets), self.new_guid(0xF130), owner=owner)
+        self.emit(f"{self.ref(pet)} hits {self.ref(mob)} for {self.random.randint(20, 300)}.")
+
+    def mob_attack_event(self):
+        mob = self.random.choice(self.mobs)
+        target = self.random.choice(self.tanks) if self.random.random() < 0.8 else self.random.choice(self.players)
+        roll = self.random.random()
+        if target is self.me:
+            self.emit(f"{self.ref(mob)} hits you for {self.random.randint(300, 2500)}.")
+        elif roll < 0.5:
+            self.emit(f"{self.ref(mob)} hits {self.ref(target)} for {self.random.randint(300, 2500)}.")
+        elif roll < 0.7:
+            self.emit(f"{self.ref(mob)} attacks. {self.ref(target)} {self.random.choice(['parries', 'dodges', 'blocks'])}.")
+        elif roll < 0.85:
+            self.emit(f"{self.ref(mob)}'s Cleave hits {self.ref(target)} for {self.random.randint(800, 3000)}.")
+        elif roll < 0.95:
+            self.emit(self.cast_line(mob, "casts", "Knock Away", 18813, "", target))
+        else:
+            self.emit(f"{self.ref(mob)} misses {self.ref(target)}.")
+
+    def sunder_event(self):
+        mob = self.mobs[0] if self.random.random() < 0.6 else self.random.choice(self.mobs)
+        # sometimes several warriors sunder in the same moment
+        sunderers = self.random.sample(self.warriors, 2 if self.random.random() < 0.1 else 1)
+        for warrior in sunderers:
+            self.emit(self.cast_line(warrior, "casts", "Sunder Armor", 11597, "Rank 5", mob))
+        for warrior in sunderers:
+            roll = self.random.random()
+            if roll < 0.85:
+                self.stacks[mob] = min(5, self.stacks.get(mob, 0) + 1)
+                self.emit(f"{self.ref(mob)} is afflicted by Sunder Armor ({self.stacks[mob]}).")
+            else:
+                outcome = "was parried by" if roll < 0.9 else "was dodged by" if roll < 0.95 else "missed"
+                if warrior is self.me:
+                    self.emit(f"Your Sunder Armor {outcome} {self.ref(mob)}.")
+                else:
+                    self.emit(f"{self.ref(warrior)}'s Sunder Armor {outcome} {self.ref(mob)}.")
+
+    def debuff_event(self):
+        unit_class, spell, spell_id, rank, debuff, max_stacks = self.random.choice(debuff_spells)
+        caster = self.random.choice(self.by_class[unit_class])
+        mob = self.mobs[0] if self.random.random() < 0.6 else self.random.choice(self.mobs)
+        self.emit(self.cast_line(caster, "casts", spell, spell_id, rank, mob))
+        key = (mob, debuff)
+        if self.random.random() < 0.9:
+            self.stacks[key] = min(max_stacks, self.stacks.get(key, 0) + 1)
+            self.emit(f"{self.ref(mob)} is afflicted by {debuff} ({self.stacks[key]}).")
+        else:
+            self.emit(f"{self.ref(caster)}'s {spell} was resisted by {self.ref(mob)}.")
+
+    def misc_event(self):
+        roll = self.random.random()
+        player = self.random.choice(self.players)
+        if roll < 0.3:
+            self.emit(f"{self.ref(player)} suffers {self.random.randint(200, 900)} Shadow damage from "
+                      f"{self.ref(player)}'s Life Tap.")
+        elif roll < 0.5:
+            mob = self.random.choice(self.mobs)
+            self.emit(f"{self.ref(mob)} is immune to {self.ref(player)}'s Frostbolt.")
+        elif roll < 0.6:
+            self.emit(f"{self.ref(player)} dies.")
+        elif roll < 0.8:
+            self.emit(f"{self.ref(player)} gains {self.random.randint(100, 600)} Mana from {self.ref(player)}'s Life Tap.")
+        else:
+            self.emit(f"{self.ref(player)}'s Hellfire Effect hits {self.ref(player)} for {self.random.randint(100, 300)} Fire damage.")
+
+
+def generate_log(filename, size, raw=False, seed=1):
+    """Write a synthetic log of about size bytes, returns the number of lines written"""
+    return LogGenerator(raw, seed).write(filename, size)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Write a synthetic AdvancedLogger combat log for benchmarking.")
+    parser.add_argument("output", help="file to write")
+    parser.add_argument("size", help="approximate size, e.g. 10MB or 1GB")
+    parser.add_argument("--raw", action="store_true", help="write the raw log (GUIDs) instead of the regular one")
+    parser.add_argument("--seed", type=int, default=1, help="random seed, the same seed gives the same log")
+    args = parser.parse_args()
+
+    lines = generate_log(args.output, parse_size(args.size), args.raw, args.seed)
+    print(f"Wrote {lines} lines to {args.output}, logging player {LOGGING_PLAYER}")
+
+
+if __name__ == "__main__":
+    main()
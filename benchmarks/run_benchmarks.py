@@ -0,0 +1,200 @@
+#!/usr/bin/env python3
+"""
+Benchmarks for format_log_for_upload.py and wasted_sunders_raw.py.
+
+Generates synthetic logs (see generate_log.py) once per size and seed and keeps them in the data directory, then
+times each script on them in a fresh subprocess and reports MB/s, lines/s and peak RSS.  Results can be saved and
+compared against an earlier run to catch regressions.  --jobs 1,2,4 times the formatter with each number of worker
+processes and shows the speedup over the first, which only shows on a machine with that many CPUs.
+
+Usage: python benchmarks/run_benchmarks.py [--sizes 10MB,100MB,1GB] [--scripts format,sunders] [--jobs N[,N...]]
+                                           [--save results.json] [--compare baseline.json]
+"""
+
+import argparse
+import contextlib
+import json
+import os
+import shutil
+import subprocess
+import sys
+import time
+
+benchmarks_dir = os.path.dirname(os.path.abspath(__file__))
+repo_dir = os.path.dirname(benchmarks_dir)
+sys.path.insert(0, benchmarks_dir)
+sys.path.insert(0, repo_dir)
+
+from generate_log import LOGGING_PLAYER, generate_log, parse_size
+
+default_sizes = "10MB,100MB,1GB"
+scripts = ("format", "sunders")
+MB = 1024 * 1024
+
+
+def peak_rss():
+    """Peak resident set size of this process and its finished children in bytes, None where unsupported"""
+    try:
+        import resource
+    except ImportError:
+        return None
+    peak = max(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss, resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss)
+    # kilobytes everywhere but macOS
+    return peak if sys.platform == "darwin" else peak * 1024
+
+
+def measure(script, filename, jobs):
+    """Run one script on filename in this process, print the elapsed time and peak RSS as json"""
+    with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+        if script == "format":
+            import format_log_for_upload
+            start = time.perf_counter()
+            format_log_for_upload.replace_instances(LOGGING_PLAYER, filename, jobs=jobs, backup="none")
+        else:
+            import wasted_sunders_raw
+            start = time.perf_counter()
+            wasted_sunders_raw.analyze_guid_sunders(filename)
+        elapsed = time.perf_counter() - start
+    print(json.dumps({"seconds": elapsed, "peak_rss": peak_rss()}))
+
+
+def count_lines(filename):
+    lines = 0
+    with open(filename, "rb") as file:
+        for block in iter(lambda: file.read(MB), b""):
+            lines += block.count(b"\n")
+    return lines
+
+
+def benchmark_log(data_dir, size_label, raw, seed):
+    """Path to the synthetic log for this size, generating it the first time"""
+    kind = "raw" if raw else "regular"
+    filename = os.path.join(data_dir, f"bench_{size_label}_{kind}_seed{seed}.txt")
+    if not os.path.exists(filename):
+        print(f"Generating {size_label} {kind} log: {filename}")
+        partial = filename + ".partial"
+        generate_log(partial, parse_size(size_label), raw, seed)
+        os.replace(partial, filename)
+    return filename
+
+
+def run_benchmark(script, filename, work_dir, jobs):
+    """Time script on filename in a subprocess, returns the result dict"""
+    target = filename
+    if script == "format":
+        # the formatter rewrites the log in place, give it a copy
+        target = os.path.join(work_dir, "bench_format_work.txt")
+        shutil.copyfile(filename, target)
+    try:
+        completed = subprocess.run([sys.executable, os.path.abspath(__file__), "--measure", script, target,
+                                    "--jobs", str(jobs)], capture_output=True, text=True, check=True)
+    finally:
+        if target != filename:
+            os.remove(target)
+    measured = json.loads(completed.stdout.strip().splitlines()[-1])
+
+    size = os.path.getsize(filename)
+    lines = count_lines(filename)
+    seconds = measured["seconds"]
+    return {
+        "script": script,
+        "size": size,
+        "lines": lines,
+        "jobs": jobs,
+        "seconds": seconds,
+        "mb_per_second": size / MB / seconds,
+        "lines_per_second": lines / seconds,
+        "peak_rss": measured["peak_rss"],
+    }
+
+
+def print_result(result, baseline=None, reference=None):
+    rss = f"{result['peak_rss'] / MB:9.1f}" if result["peak_rss"] else "      n/a"
+    speedup = f"{reference['seconds'] / result['seconds']:7.2f}x" if reference else "        "
+    change = ""
+    if baseline:
+        change = f"  {(result['mb_per_second'] / baseline['mb_per_second'] - 1) * 100:+6.1f}%"
+    print(f"{result['script']:<8} {result['size'] / MB:9.1f} {result['lines']:>11} {result['jobs']:>4} "
+          f"{result['seconds']:9.2f} {result['mb_per_second']:8.2f} {result['lines_per_second']:11.0f} {rss} "
+          f"{speedup}{change}")
+
+
+def result_key(result):
+    return result["script"], result["size"], result["jobs"]
+
+
+def parse_jobs(value):
+    """--jobs N or a comma separated list of them"""
+    try:
+        jobs = [int(part) for part in value.split(",") if part.strip()]
+    except ValueError:
+        jobs = []
+    if not jobs or min(jobs) < 1:
+        raise argparse.ArgumentTypeError(f"expected numbers of worker processes like 1,2,4, got {value}")
+    return jobs
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark format_log_for_upload.py and wasted_sunders_raw.py "
+                                                 "on synthetic logs.")
+    parser.add_argument("--sizes", default=default_sizes, help=f"comma separated log sizes (default {default_sizes})")
+    parser.add_argument("--scripts", default=",".join(scripts), help="comma separated scripts to run: format, sunders")
+    parser.add_argument("--jobs", type=parse_jobs, default=[1],
+                        help="--jobs passed to the formatter, or a comma separated list of them to compare")
+    parser.add_argument("--seed", type=int, default=1, help="seed of the generated logs")
+    parser.add_argument("--data-dir", default=os.path.join(benchmarks_dir, "data"),
+                        help="where generated logs are kept between runs")
+    parser.add_argument("--save", metavar="FILE", help="write the results as json")
+    parser.add_argument("--compare", metavar="FILE", help="compare MB/s against results saved with --save")
+    parser.add_argument("--tolerance", type=float, default=0.1,
+                        help="with --compare, exit with 1 if MB/s dropped by more than this fraction (default 0.1)")
+    parser.add_argument("--measure", nargs=2, metavar=("SCRIPT", "LOGFILE"), help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.measure:
+        measure(args.measure[0], args.measure[1], args.jobs[0])
+        return
+
+    selected = [script.strip() for script in args.scripts.split(",") if script.strip()]
+    for script in selected:
+        if script not in scripts:
+            parser.error(f"unknown script {script}, expected one of {', '.join(scripts)}")
+    os.makedirs(args.data_dir, exist_ok=True)
+
+    baseline = {}
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as file:
+            baseline = {result_key(result): result for result in json.load(file)}
+
+    if max(args.jobs) > (os.cpu_count() or 1):
+        print(f"Only {os.cpu_count() or 1} CPUs, runs with more jobs than that can't be faster")
+    print(f"{'script':<8} {'MB':>9} {'lines':>11} {'jobs':>4} {'seconds':>9} {'MB/s':>8} {'lines/s':>11} {'RSS MB':>9} "
+          f"{'speedup':>8}")
+    results = []
+    for size_label in args.sizes.split(","):
+        size_label = size_label.strip()
+        for script in selected:
+            filename = benchmark_log(args.data_dir, size_label, script == "sunders", args.seed)
+            # only the formatter has worker processes
+            reference = None
+            for jobs in args.jobs if script == "format" else args.jobs[:1]:
+                result = run_benchmark(script, filename, args.data_dir, jobs)
+                results.append(result)
+                print_result(result, baseline.get(result_key(result)), reference)
+                reference = reference or result
+
+    if args.save:
+        with open(args.save, "w", encoding="utf-8") as file:
+            json.dump(results, file, indent=2)
+
+    regressions = [result for result in results if result_key(result) in baseline and
+                   result["mb_per_second"] < baseline[result_key(result)]["mb_per_second"] * (1 - args.tolerance)]
+    for result in regressions:
+        print(f"Regression: {result['script']} on {result['size'] / MB:.1f} MB is more than "
+              f"{args.tolerance:.0%} slower than the baseline")
+    if regressions:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
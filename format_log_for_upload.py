@@ -1,27 +1,250 @@
 #!/usr/bin/python3
 
+import argparse
+import contextlib
+import csv
+import glob
+import gzip
+import hashlib
+import io
+import json
 import os
 import re
 import shutil
+import sys
+import tempfile
 import time
 import zipfile
+from collections import OrderedDict, deque
+from concurrent.futures import ProcessPoolExecutor, as_completed
 
+import log_input
+import log_segments
 
-def handle_replacements(line, replacements):
-    for pattern, replacement in replacements.items():
-        try:
-            new_text, num_subs = re.subn(pattern, replacement, line, flags=re.IGNORECASE)
-        except Exception as e:
-            print(f"Error replacing pattern: {pattern} with replacement: {replacement}")
-            print(f"Line: {line}")
-            raise e
-        if num_subs:
-            return new_text
+try:
+    from re import _constants as sre_constants, _parser as sre_parse
+except ImportError:  # Python < 3.11
+    import sre_constants
+    import sre_parse
 
-    return line
+
+def substitute(regex, replacement, line):
+    try:
+        return regex.subn(replacement, line)
+    except Exception as e:
+        print(f"Error replacing pattern: {regex.pattern} with replacement: {replacement}")
+        print(f"Line: {line}")
+        raise e
+
+
+def scan_pattern(pattern):
+    """
+    Pattern used to find out whether a rule matches anywhere in a line.  A leading .* doesn't change whether
+    a search finds a match, but makes it try every start position, so it is dropped.
+    """
+    for wildcard in (".*?", ".*"):
+        if pattern.startswith(wildcard) and pattern[len(wildcard):len(wildcard) + 1] not in ("*", "+", "?", "{", ""):
+            return pattern[len(wildcard):]
+    return pattern
 
 
-def remove_raid_marks(target_name, marks_list):
+# characters that match an ASCII letter case-insensitively but don't lowercase to it
+casefold_table = str.maketrans({"\u0130": "i", "\u0131": "i", "\u017f": "s", "\u212a": "k"})
+
+
+def required_literal(pattern):
+    """
+    Longest run of ASCII characters that every match of the pattern contains, lowercased.  Returns None when
+    there is no such run with at least two characters besides spaces, every line has a double space anyway.
+    """
+    try:
+        parsed = sre_parse.parse(pattern)
+    except re.error:
+        return None
+
+    runs = []
+
+    def walk(items):
+        run = ""
+        for op, av in items:
+            if op == sre_constants.LITERAL and av < 128:
+                run += chr(av)
+                continue
+            runs.append(run)
+            run = ""
+            # groups are always matched, unlike repeats and branches
+            if op == sre_constants.SUBPATTERN:
+                walk(av[-1])
+        runs.append(run)
+
+    walk(parsed)
+    literal = max(runs, key=lambda run: len(run.strip()))
+    return literal.lower() if len(literal.strip()) >= 2 else None
+
+
+def trie_pattern(literals):
+    """Regex matching any of the literals, with common prefixes merged so each position is checked once"""
+    trie = {}
+    for literal in literals:
+        node = trie
+        for char in literal:
+            node = node.setdefault(char, {})
+        node[""] = {}
+
+    def build(node):
+        branches = [re.escape(char) + build(child) for char, child in sorted(node.items()) if char]
+        if not branches:
+            return ""
+        pattern = branches[0] if len(branches) == 1 else "(?:" + "|".join(branches) + ")"
+        return f"(?:{pattern})?" if "" in node else pattern
+
+    return build(trie)
+
+
+class LiteralScanner:
+    """Reports which of a set of literals occur in a line using a single regex scan"""
+
+    def __init__(self, literals, ignore_case=False):
+        literals = set(literals)
+        self.ignore_case = ignore_case
+        # a literal found inside a longer one isn't reported by the scan on its own
+        self.contained = {literal: {other for other in literals if other in literal} for literal in literals}
+        self.regex = re.compile(f"(?=({trie_pattern(literals)}))") if literals else None
+
+    def find(self, line):
+        found = set()
+        if self.regex is None:
+            return found
+        if self.ignore_case:
+            line = line.lower() if line.isascii() else line.translate(casefold_table).lower()
+        for literal in self.regex.findall(line):
+            if literal not in found:
+                found |= self.contained[literal]
+        return found
+
+
+class RuleGroup:
+    """
+    A dictionary of pattern -> replacement rules compiled once, applied with first-match-wins semantics.
+
+    Every pattern is matched case-insensitively.  If check is set, a rule only wins when its pattern also
+    matches case-sensitively and check(match) is true, this is used by the friendly fire and self damage rules.
+
+    Each rule is indexed by a literal that any match has to contain.  When replace is given the set of
+    literals found in the line, rules whose literal is missing are never tried.
+    """
+
+    def __init__(self, replacements, check=None):
+        self.patterns = []
+        self.rules = []
+        self.literals = {}
+        unindexed = []
+        for i, (pattern, replacement) in enumerate(replacements.items()):
+            try:
+                regex = re.compile(pattern, re.IGNORECASE)
+            except re.error as e:
+                print(f"Error replacing pattern: {pattern} with replacement: {replacement}")
+                raise e
+            check_regex = re.compile(pattern) if check else None
+            scan = scan_pattern(pattern)
+            scan_regex = re.compile(scan, re.IGNORECASE) if scan != pattern else None
+            self.patterns.append(scan)
+            self.rules.append((regex, replacement, check_regex, scan_regex))
+
+            literal = required_literal(scan)
+            if literal is None:
+                unindexed.append(i)
+            else:
+                self.literals.setdefault(literal, []).append(i)
+        self.check = check
+        self.unindexed = tuple(unindexed)
+        self.all_rules = tuple(range(len(self.rules)))
+        self.combined = {}
+
+    def combined_scan(self, candidates):
+        """
+        Merge the candidate rules into a single alternation so that one scan either rejects the line or reports
+        a rule that matches.  The first matching rule can't come after that one, so only the rules before it
+        need to be tried.
+        """
+        entry = self.combined.get(candidates)
+        if entry is None:
+            try:
+                regex = re.compile("|".join(f"(?P<r{i}>{self.patterns[i]})" for i in candidates), re.IGNORECASE)
+                entry = (regex, {regex.groupindex[f"r{i}"]: i for i in candidates})
+            except re.error:
+                entry = (None, None)
+            if len(self.combined) >= 256:
+                self.combined.clear()
+            self.combined[candidates] = entry
+        return entry
+
+    def replace(self, line, found=None):
+        if found is None:
+            candidates = self.all_rules
+        else:
+            candidates = self.unindexed
+            for literal in found:
+                indexed = self.literals.get(literal)
+                if indexed:
+                    candidates += tuple(indexed)
+            if not candidates:
+                return line
+            if len(candidates) > 1:
+                candidates = tuple(sorted(set(candidates)))
+
+        rules = self.rules
+        if self.check is not None:
+            # Not merged, the check is done on each rule's own first match
+            for i in candidates:
+                regex, replacement, check_regex, _ = rules[i]
+                match = check_regex.search(line)
+                if match and self.check(match):
+                    return substitute(regex, replacement, line)[0]
+            return line
+
+        if len(candidates) > 1:
+            combined, winners = self.combined_scan(candidates)
+            if combined is not None:
+                match = combined.search(line)
+                if match is None:
+                    return line
+                candidates = candidates[:candidates.index(winners[match.lastindex]) + 1]
+
+        for i in candidates:
+            regex, replacement, _, scan_regex = rules[i]
+            if scan_regex is not None and not scan_regex.search(line):
+                continue
+            new_text, num_subs = substitute(regex, replacement, line)
+            if num_subs:
+                return new_text
+
+        return line
+
+    def enable_profiling(self, name, profile):
+        """Time every regex call of the group's rules in profile, see FormatterProfile"""
+        def profiled(regex, pattern, search_hits=False):
+            if regex is None:
+                return None
+            return ProfiledRegex(regex, profile.counters(profile.patterns, (name, pattern)), search_hits)
+
+        self.rules = [(profiled(regex, regex.pattern), replacement, profiled(check_regex, regex.pattern),
+                       profiled(scan_regex, regex.pattern))
+                      for regex, replacement, check_regex, scan_regex in self.rules]
+
+        combined_scan = self.combined_scan
+        def profiled_combined_scan(candidates):
+            regex, winners = combined_scan(candidates)
+            return profiled(regex, "(combined scan)", search_hits=True), winners
+        self.combined_scan = profiled_combined_scan
+
+
+def is_self_damage(match):
+    # check that group 1 and 4 are equal meaning the player is hitting themselves
+    return match.group(1).strip() == match.group(4).strip()
+
+
+def remove_raid_marks(target_name):
     """Remove raid target marks from a target name"""
     if not target_name:
         return target_name
@@ -29,51 +252,141 @@ def remove_raid_marks(target_name, marks_list):
     # Remove period if present
     target_name = target_name.rstrip('.')
 
-    for mark in marks_list:
-        # Remove marks in parentheses like "(Cross)" from the end of names
-        target_name = re.sub(rf'\({mark}\)$', '', target_name)
+    # Remove marks in parentheses like "(Cross)" from the end of names
+    target_name = trailing_raid_mark_pattern.sub('', target_name)
 
     return target_name.strip()
 
 
-def replace_instances(player_name, filename):
-    player_name = player_name.strip().capitalize()
+# letter pattern including Unicode for unit names
+L = "a-zA-Z\\u00C0-\\u017F"
+
+# add quantity 1 to loot messages without quantity
+loot_replacements = {
+    r"\|h\|r\.$": "|h|rx1.",
+}
+loot_rules = RuleGroup(loot_replacements)
+
+ignored_pet_names = {"Razorgore the Untamed (", "Deathknight Understudy (", "Naxxramas Worshipper ("}
+
+# associate common summoned pets with their owners as well
+summoned_pet_names = {"Greater Feral Spirit", "Battle Chicken", "Arcanite Dragonling", "The Lost", "Minor Arcane Elemental", "Scytheclaw Pureborn", "Explosive Trap I", "Explosive Trap II", "Explosive Trap III"}
+summoned_pet_owner_regex = re.compile(rf"([{L}][{L} ]+[{L}]) \(([{L}]+)\)")
+summoned_pet_scanner = LiteralScanner(summoned_pet_names)
+
+# the lines the first pass can learn pets from, everything else is skipped without being decoded
+pet_line_pattern = re.compile(b"|".join(re.escape(name.encode()) for name in sorted(summoned_pet_names | {"COMBATANT_INFO"})))
+
+
+class PetState:
+    """Pet and owner names collected by the first pass over the log"""
+
+    def __init__(self):
+        self.pet_renames = set()  # rename pets that have the same name their owner
+        self.pet_names = set()
+        self.owner_names = set()
+        # Pet renames have next priority (for pets with same name as owner)
+        self.pet_rename_replacements = {}
+
+    def to_dict(self):
+        return {
+            "pet_renames": sorted(self.pet_renames),
+            "pet_names": sorted(self.pet_names),
+            "owner_names": sorted(self.owner_names),
+            # a list of pairs, the order of the replacements matters
+            "pet_rename_replacements": list(self.pet_rename_replacements.items()),
+        }
+
+    @classmethod
+    def from_dict(cls, data):
+        pet_state = cls()
+        pet_state.pet_renames = set(data["pet_renames"])
+        pet_state.pet_names = set(data["pet_names"])
+        pet_state.owner_names = set(data["owner_names"])
+        pet_state.pet_rename_replacements = dict(data["pet_rename_replacements"])
+        return pet_state
+
+    def name_scanner(self):
+        """Scanner reporting every owner, ignored pet and summoned pet name in a line in one pass"""
+        return LiteralScanner(self.owner_names | ignored_pet_names | summoned_pet_names)
+
+
+def prepare_line(line, pet_state=None):
+    """
+    Apply the first pass rewrites (DPSMate 's, COMBATANT_INFO pets, LOOT quantities) to a line.
+
+    When pet_state is given, pet and owner names found on the line are recorded in it.  The
+    rewrite itself does not depend on the state, so the second pass can repeat it while streaming.
+    """
+    # DPSMate logs have " 's" already which will break some of our parsing, remove the space
+    # But only for DPSMate-style logs that have extra spaces
+    if " 's" in line and not any(marker in line for marker in ["COMBATANT_INFO", "LOOT:", "ZONE_INFO"]):
+        line = line.replace(" 's", "'s")
+    if "COMBATANT_INFO" in line:
+        # 4/14 20:51:43.354  COMBATANT_INFO: 14.04.24 20:51:43&Hunter&HUNTER&Dwarf&2&PetName <- pet name
+        try:
+            line_parts = line.split("&")
+            pet_name = line_parts[5]
+            if pet_name != "nil" and pet_name not in ignored_pet_names:
+                owner_name = line_parts[1]
+                # rename pets that have the same name as their owner
+                if pet_name == owner_name:
+                    if pet_state is not None:
+                        pet_state.pet_renames.add(pet_name)
+                        pet_state.pet_rename_replacements[rf"{pet_name} \({owner_name}\)"] = f"{pet_name}Pet ({owner_name})"
+
+                    line_parts[5] = f"{pet_name}Pet"
+
+                if pet_state is not None:
+                    pet_state.pet_names.add(f"{pet_name}")
+                    pet_state.owner_names.add(f"({line_parts[1]})")
+            else:
+                # remove pet name from uploaded combatant info, can cause player to not appear in logs if pet name
+                # is a player name or ability name.  Don't even think legacy displays pet info anyways.
+                line_parts[5] = "nil"
+
+            line = "&".join(line_parts)
 
-    # letter pattern including Unicode for unit names
-    L = "a-zA-Z\\u00C0-\\u017F"
+        except Exception as e:
+            if pet_state is not None:
+                print(f"Error parsing pet name from line: {line}")
+                print(e)
+    elif "LOOT:" in line:
+        line = loot_rules.replace(line)
+    elif pet_state is not None:
+        found = summoned_pet_scanner.find(line)
+        if found:
+            match = summoned_pet_owner_regex.search(line)
+            if match:
+                pet_state.pet_names.update(found)
+                pet_state.owner_names.add(f"({match.group(2)})")
 
-    # Pet renames have next priority (for pets with same name as owner)
-    pet_rename_replacements = {}
+    return line
 
-    # Greylist: For spells that appear here, only the specified ID is accepted
-    # Other spells with same name but different IDs will be filtered out
-    spell_id_greylist = {
-        "Blood Fury": 20572,  # Only Blood Fury(20572) is kept, others like 23234 are filtered
-    }
 
-    # Raid target marks to remove from target names (from AdvancedLogger.lua)
-    raid_target_marks = {"Star", "Circle", "Diamond", "Triangle", "Moon", "Square", "Cross", "Skull"}
+class RuleSet:
+    """
+    All replacement groups used by the second pass, compiled once per run.
 
-    # Pattern to match cast lines with spell IDs - captures spell ID in group 3
-    cast_with_id_pattern = re.compile(r"(.* (?:casts|channels|begins to cast|fails casting) )(.+?)\((\d+)\)(?:\(Rank \d+\))?( .*)?")
+    The literals indexing every group's rules are found with one scan per line, the result is reused by the
+    following groups until a replacement changes the line.
+    """
 
-    # Patterns for filtering unwanted cast lines (non-greylist)
-    unwanted_cast_patterns = [
-        # These will be populated dynamically based on greylist
-    ]
+    def __init__(self, groups):
+        self.groups = groups
+        self.scanner = LiteralScanner({literal for group in groups.values() for literal in group.literals},
+                                      ignore_case=True)
+        self.scanned_line = None
+        self.found = None
 
-    # Patterns for filtering unwanted line types
-    unwanted_line_prefixes = [
-        "MARK:",
-        "LOOT_TRADE:",
-        "AGGRO:",
-        "MODEL_UPDATE:",
-        "CHAT_MSG:"
-    ]
+    def replace(self, name, line):
+        if line is not self.scanned_line:
+            self.scanned_line = line
+            self.found = self.scanner.find(line)
+        return self.groups[name].replace(line, self.found)
 
-    # Pattern to match any "fails casting" line (with or without spell ID)
-    fails_casting_pattern = re.compile(r".* fails casting ")
 
+def build_rule_set(player_name, pet_rename_replacements):
     # Mob names with apostrophes have top priority
     # only the first match will be replaced
     mob_names_with_apostrophe = {
@@ -185,226 +498,1114 @@ def replace_instances(player_name, filename):
         rf"  ([{L}' ]*?) 's (.*) (hits|crits) ([{L}' ]*?) for": r"  \g<1> (self damage) 's \g<2> \g<3> \g<4> for",
     }
 
+    return RuleSet({
+        "mob_names_with_apostrophe": RuleGroup(mob_names_with_apostrophe),
+        "pet_renames": RuleGroup(pet_rename_replacements),
+        "pet_replacements": RuleGroup(pet_replacements),
+        "you_replacements": RuleGroup(you_replacements),
+        "generic_replacements": RuleGroup(generic_replacements),
+        "renames": RuleGroup(renames),
+        "friendly_fire": RuleGroup(friendly_fire, check=bool),  # any case-sensitive match
+        "self_damage": RuleGroup(self_damage, check=is_self_damage),
+        "loot_replacements": loot_rules,
+    })
+
+
+# Greylist: For spells that appear here, only the specified ID is accepted
+# Other spells with same name but different IDs will be filtered out
+spell_id_greylist = {
+    "Blood Fury": 20572,  # Only Blood Fury(20572) is kept, others like 23234 are filtered
+}
+
+# Raid target marks to remove from target names (from AdvancedLogger.lua)
+raid_target_marks = {"Star", "Circle", "Diamond", "Triangle", "Moon", "Square", "Cross", "Skull"}
+raid_mark_pattern = re.compile(rf"\((?:{'|'.join(sorted(raid_target_marks))})\)")
+trailing_raid_mark_pattern = re.compile(rf"{raid_mark_pattern.pattern}$")
+
+# Pattern to match cast lines with spell IDs, matched from the start of the text after the timestamp
+cast_with_id_pattern = re.compile(r"(?P<actor>.*) (?P<verb>casts|channels|begins to cast|fails casting) "
+                                  r"(?P<spell>.+?)\((?P<spell_id>\d+)\)(?:\((?P<rank>Rank \d+)\))?(?P<rest> .*)?")
+cast_kinds = {"casts": "cast", "channels": "channel", "begins to cast": "begin", "fails casting": "fail"}
+
+# custom lines written by AdvancedLogger, "<kind>: ..." after the timestamp
+custom_line_kinds = {"COMBATANT_INFO", "LOOT", "LOOT_TRADE", "ZONE_INFO", "MARK", "AGGRO", "MODEL_UPDATE", "CHAT_MSG"}
+
+# kinds of the other combat messages, the first of these found in the line decides
+combat_kind_pattern = re.compile(r" (?:(?P<aura>is afflicted by|gains [^0-9]|fades from|is removed)|"
+                                 r"(?P<heal>heals|critically heals|gains \d+ health)|"
+                                 r"(?P<damage>hits|crits|suffers|misses|attacks|falls and loses|fall and lose))")
+
+# Patterns for filtering unwanted cast lines (non-greylist)
+unwanted_cast_patterns = [
+    # These will be populated dynamically based on greylist
+]
+
+# Patterns for filtering unwanted line types
+unwanted_line_prefixes = [
+    "MARK:",
+    "LOOT_TRADE:",
+    "AGGRO:",
+    "MODEL_UPDATE:",
+    "CHAT_MSG:"
+]
+unwanted_kinds = {prefix.rstrip(":") for prefix in unwanted_line_prefixes}
+
+# Matches any "fails casting" line (with or without spell ID)
+fails_casting = " fails casting "
+
+
+class LogRecord:
+    """
+    A line split into its parts by parse_line.
+
+    kind is the custom line type written by AdvancedLogger (COMBATANT_INFO, LOOT, MARK, ...), cast, channel,
+    begin or fail for cast lines with a spell ID, and aura, heal, damage or other for the remaining combat
+    messages.  That last one is only worked out when kind is first read.  Fields that don't apply to the
+    line are None, prefix is the line up to and including the cast verb.
+    """
+
+    __slots__ = ("line", "timestamp", "body_start", "custom_kind", "actor", "verb", "spell", "spell_id", "rank",
+                 "target", "rest", "prefix", "combat_kind")
+
+    def __init__(self, line, timestamp, body_start, custom_kind=None):
+        self.line = line
+        self.timestamp = timestamp
+        self.body_start = body_start
+        self.custom_kind = custom_kind
+        self.actor = self.verb = self.spell = self.spell_id = self.rank = self.target = self.rest = None
+        self.prefix = None
+        self.combat_kind = None
+
+    @property
+    def body(self):
+        return self.line[self.body_start:]
+
+    @property
+    def kind(self):
+        if self.custom_kind is not None:
+            return self.custom_kind
+        if self.verb is not None:
+            return cast_kinds[self.verb]
+        if self.combat_kind is None:
+            match = combat_kind_pattern.search(self.line, self.body_start)
+            self.combat_kind = match.lastgroup if match else "other"
+        return self.combat_kind
+
+
+def parse_line(line):
+    """
+    Split a line into a LogRecord.  The custom line kinds are told apart by their prefix, and cast lines are
+    only matched, from the start of the text after the timestamp, when they contain a cast verb at all.
+    """
+    split = line.find("  ")
+    if split > 0 and not line[:split].strip(timestamp_characters):
+        timestamp, start = line[:split], split + 2
+    else:
+        timestamp, start = None, 0
+
+    colon = line.find(": ", start, start + 16)
+    if colon > start and line[start:colon] in custom_line_kinds:
+        return LogRecord(line, timestamp, start, line[start:colon])
+
+    record = LogRecord(line, timestamp, start)
+    if " cast" in line or " channels " in line:
+        match = cast_with_id_pattern.match(line, start)
+        if match:
+            record.actor = match.group("actor")
+            record.verb = match.group("verb")
+            record.spell = match.group("spell")
+            record.spell_id = int(match.group("spell_id"))
+            record.rank = match.group("rank")
+            record.rest = match.group("rest")
+            record.prefix = line[:match.start("spell")]
+            if record.rest and record.rest.startswith(" on "):
+                record.target = record.rest[4:].rstrip(".")
+    return record
+
+
+# Number of formatted line bodies remembered by each formatter, 0 disables the cache
+line_cache_size = 65536
+
+# characters of the "4/14 21:23:45.123" timestamp in front of every line
+timestamp_characters = "0123456789/:. "
+
+
+class LineCache:
+    """
+    Bounded LRU cache of formatted lines keyed on the line body after the timestamp.
+
+    Combat logs repeat the same bodies over and over with only the timestamp changing, and the formatting of
+    a line doesn't depend on its timestamp, so the formatted body is reused with the new timestamp put back in
+    front.  Results that don't keep the timestamp in front are never cached.  Dropped lines are cached as None.
+    """
+
+    def __init__(self, maxsize):
+        self.maxsize = maxsize
+        self.entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def transform(self, line, transform):
+        split = line.find("  ")
+        timestamp = line[:split]
+        if split <= 0 or timestamp.strip(timestamp_characters):
+            return transform(line)
+        body = line[split:]
+
+        entries = self.entries
+        if body in entries:
+            self.hits += 1
+            entries.move_to_end(body)
+            cached = entries[body]
+            return None if cached is None else timestamp + cached
+
+        self.misses += 1
+        result = transform(line)
+        if result is None:
+            entries[body] = None
+        elif result.startswith(timestamp):
+            entries[body] = result[split:]
+        else:
+            return result
+        if len(entries) > self.maxsize:
+            entries.popitem(last=False)
+        return result
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {"hits": self.hits, "misses": self.misses, "entries": len(self.entries), "maxsize": self.maxsize,
+                "hit_rate": self.hits / lookups if lookups else 0.0}
+
+    def report(self):
+        stats = self.stats()
+        if stats["hits"] + stats["misses"]:
+            print(f"Line cache: {stats['hit_rate']:.1%} of {stats['hits'] + stats['misses']} lines were repeats "
+                  f"({stats['entries']} of {stats['maxsize']} entries used)")
+
+
+class LineFormatter:
+    """
+    Second pass replacements and filtering, built from the state collected by the first pass.
+
+    Nothing but the line cache changes after construction, so a copy can be sent once to each worker process.
+    A formatter built from new pet state starts with an empty cache.
+    """
+
+    def __init__(self, player_name, pet_state, cache_size=line_cache_size):
+        self.rules = build_rule_set(player_name, pet_state.pet_rename_replacements)
+        self.has_pet_renames = bool(pet_state.pet_rename_replacements)
+        self.owner_names = frozenset(pet_state.owner_names)
+        self.name_scanner = pet_state.name_scanner()
+        self.cache = LineCache(cache_size) if cache_size > 0 else None
+
+    def enable_profiling(self, profile):
+        """Record the time and hits of every stage and rule in profile, the formatter can't be sent to workers after"""
+        for name, group in self.rules.groups.items():
+            group.enable_profiling(name, profile)
+        # pet replacements are applied inside the replace_pets stage
+        self.rules = ProfiledRuleSet(self.rules, profile, nested={"pet_replacements"})
+        for stage, method in (("format_line", self.format_line), ("prepare_line", self.prepare_line), ("cast_id_filter", self.filter_cast),
+                              ("prefix_filter", self.filter_unwanted), ("pet_replacements", self.replace_pets)):
+            setattr(self, method.__name__, profile.timed_stage(stage, method))
+
+    # first pass rewrites redone on each line of the second pass, an attribute so profiling can time it
+    prepare_line = staticmethod(prepare_line)
+
+    def format_line(self, line):
+        """Format a raw line from the log, returns None if the line should be dropped"""
+        return self.transform_line(self.prepare_line(line))
+
+    def transform_line(self, line):
+        """Perform replacements and filtering on a single line, returns None if the line should be dropped"""
+        if self.cache is not None:
+            return self.cache.transform(line, self.apply_stages)
+        return self.apply_stages(line)
+
+    def apply_stages(self, line):
+        record = parse_line(line)
+        # custom lines that are dropped anyway skip the cast filter
+        if record.custom_kind in unwanted_kinds:
+            return None
+
+        line = self.filter_cast(line, record)
+        if line is None:
+            return None
+
+        line = self.filter_unwanted(line, record)
+        if line is None:
+            return None
 
+        # Continue with normal processing
+        # Handle names with apostrophes (highest priority to avoid parsing issues)
+        line = self.rules.replace("mob_names_with_apostrophe", line)
 
-    # add quantity 1 to loot messages without quantity
-    loot_replacements = {
-        r"\|h\|r\.$": "|h|rx1.",
-    }
+        # handle pet renames
+        if self.has_pet_renames:
+            line = self.rules.replace("pet_renames", line)
 
-    # create backup of original file
-    backup_filename = filename.replace(".txt", "") + f".original.{int(time.time())}.txt"
+        # handle pets
+        line = self.replace_pets(line)
+
+        # if line contains you/You
+        if "you" in line or "You" in line or "dodged." in line:
+            line = self.rules.replace("you_replacements", line)
+            line = self.rules.replace("you_replacements", line)  # when casting ability on yourself need to do two replacements
+
+        # generic replacements
+        line = self.rules.replace("generic_replacements", line)
+
+        # renames
+        line = self.rules.replace("renames", line)
+
+        # self damage exceptions
+        line = self.rules.replace("friendly_fire", line)
+
+        # self damage
+        line = self.rules.replace("self_damage", line)
+
+        return line
+
+    def filter_cast(self, line, record):
+        """Strip spell IDs, ranks and raid marks from cast lines, returns None for casts that are dropped"""
+        if record.spell_id is None:
+            return line
+
+        # Always filter out 'channels', 'begins to cast', and 'fails casting' with spell IDs
+        if record.verb != "casts":
+            return None
+
+        # Only apply greylist logic to 'casts' lines
+        spell_name = record.spell.strip()
+        if spell_name in spell_id_greylist and record.spell_id != spell_id_greylist[spell_name]:
+            # Wrong spell ID for this spell name, filter it out
+            return None
+
+        # Keep this spell but remove ID/rank and marks
+        # Remove raid marks from caster name in prefix
+        prefix = raid_mark_pattern.sub('', record.prefix)
+        suffix = record.rest if record.rest else ""  # " on target" or ""
+        # Remove raid marks from target names
+        if suffix and " on " in suffix:
+            target_part = suffix.replace(" on ", "")
+            clean_target = remove_raid_marks(target_part)
+            suffix = f" on {clean_target}" if clean_target else ""
+
+        if suffix and not suffix.endswith('.'):
+            return prefix + spell_name + suffix + ".\n"
+        elif suffix and suffix.endswith('.'):
+            return prefix + spell_name + suffix + "\n"
+        else:
+            return prefix + spell_name + ".\n"
+
+    def filter_unwanted(self, line, record):
+        """Returns None for unwanted line types"""
+        # Filter out unwanted line types by prefix
+        for prefix in unwanted_line_prefixes:
+            if prefix in line:
+                return None
+
+        # Filter out all "fails casting" lines (with or without spell ID)
+        if fails_casting in line:
+            return None
+        return line
+
+    def replace_pets(self, line):
+        """Associate pet hits, crits, misses and spells with their owners"""
+        found = self.name_scanner.find(line)
+        line_owners = found & self.owner_names
+        # check if line contains any ignored pet names, replacing pets never adds or removes one
+        if line_owners and not found & ignored_pet_names:
+            for owner_name in sorted(line_owners):
+                if owner_name in line:
+                    # ignore pet dying
+                    if "dies." in line or "is killed by" in line:
+                        continue
+
+                    line = self.rules.replace("pet_replacements", line)
+        return line
+
+
+class ProfiledRegex:
+    """
+    Compiled regex wrapper adding the time spent in search and subn to counters.  A hit is a substitution, or
+    with search_hits a match found by search.
+    """
+
+    def __init__(self, regex, counters, search_hits=False):
+        self.regex = regex
+        self.pattern = regex.pattern
+        self.counters = counters
+        self.search_hits = search_hits
+
+    def search(self, line):
+        start = time.perf_counter()
+        match = self.regex.search(line)
+        counters = self.counters
+        counters[2] += time.perf_counter() - start
+        counters[0] += 1
+        if self.search_hits and match is not None:
+            counters[1] += 1
+        return match
+
+    def subn(self, replacement, line):
+        start = time.perf_counter()
+        result = self.regex.subn(replacement, line)
+        counters = self.counters
+        counters[2] += time.perf_counter() - start
+        counters[0] += 1
+        if result[1]:
+            counters[1] += 1
+        return result
+
+
+class ProfiledRuleSet:
+    """RuleSet wrapper timing each replacement group as a stage of the formatter"""
+
+    def __init__(self, rule_set, profile, nested=()):
+        self.rule_set = rule_set
+        self.nested = nested
+        self.stages = {name: profile.timed_stage(name, self.group_replace(name)) for name in rule_set.groups}
+        # a group applied twice in a row, like the you replacements, is reported as a separate stage
+        self.repeats = {name: profile.timed_stage(f"{name} (second pass)", self.group_replace(name))
+                        for name in rule_set.groups}
+        self.previous = None
+
+    def group_replace(self, name):
+        return lambda line: self.rule_set.replace(name, line)
+
+    def replace(self, name, line):
+        if name in self.nested:
+            return self.rule_set.replace(name, line)
+        stage = self.repeats[name] if name == self.previous else self.stages[name]
+        self.previous = name
+        return stage(line)
+
+
+class FormatterProfile:
+    """
+    Calls, hits and cumulative time of each formatter stage and of each rule pattern, collected by --profile.
+    A stage hit is a line changed or dropped by the stage.  Nothing is recorded unless a formatter is given
+    the profile with LineFormatter.enable_profiling, formatting without one doesn't pay for it.
+    """
+
+    def __init__(self):
+        self.stages = {}
+        self.patterns = {}
+
+    @staticmethod
+    def counters(table, key):
+        return table.setdefault(key, [0, 0, 0.0])
+
+    def timed_stage(self, name, function):
+        counters = self.counters(self.stages, name)
+
+        def timed(line, *args):
+            start = time.perf_counter()
+            result = function(line, *args)
+            counters[2] += time.perf_counter() - start
+            counters[0] += 1
+            if result is not line and result != line:
+                counters[1] += 1
+            return result
+        return timed
+
+    def to_dict(self):
+        by_time = lambda item: -item[1][2]
+        return {
+            "stages": [{"stage": name, "calls": calls, "hits": hits, "seconds": seconds}
+                       for name, (calls, hits, seconds) in sorted(self.stages.items(), key=by_time) if calls],
+            "patterns": [{"group": group, "pattern": pattern, "calls": calls, "hits": hits, "seconds": seconds}
+                         for (group, pattern), (calls, hits, seconds) in sorted(self.patterns.items(), key=by_time)
+                         if calls],
+        }
+
+    def save(self, filename):
+        with open(filename, 'w', encoding='utf-8') as file:
+            json.dump(self.to_dict(), file, indent=2)
+
+    def report(self):
+        """Print the stages and patterns, slowest first"""
+        profile = self.to_dict()
+        print(f"\n{'Stage':<40} {'Calls':>10} {'Hits':>10} {'Seconds':>9}")
+        for stage in profile["stages"]:
+            print(f"{stage['stage']:<40} {stage['calls']:>10} {stage['hits']:>10} {stage['seconds']:>9.3f}")
+        print(f"\n{'Group':<26} {'Calls':>10} {'Hits':>10} {'Seconds':>9}  Pattern")
+        for pattern in profile["patterns"]:
+            print(f"{pattern['group']:<26} {pattern['calls']:>10} {pattern['hits']:>10} {pattern['seconds']:>9.3f}"
+                  f"  {pattern['pattern']}")
+
+
+# With several jobs the log is handed to the worker processes in chunks of about this many bytes
+parallel_chunk_size = 8 * 1024 * 1024
+
+# formatter of the current worker process, sent once by init_worker
+worker_formatter = None
+
+
+def init_worker(formatter):
+    global worker_formatter
+    worker_formatter = formatter
+
+
+def chunk_ranges(filename, chunk_size, start=0, end=None):
+    """
+    Split a file, or the byte range start-end of it, into (start, end) byte ranges of about chunk_size
+    each ending on a line boundary.  end has to be on a line boundary itself.
+    """
+    if end is None:
+        end = os.path.getsize(filename)
+    ranges = []
+    with open(filename, 'rb') as file:
+        while start < end:
+            file.seek(min(start + chunk_size, end))
+            file.readline()
+            chunk_end = min(file.tell(), end)
+            ranges.append((start, chunk_end))
+            start = chunk_end
+    return ranges
+
+
+def decode_lines(data):
+    """Decode complete lines read from the log the same way reading it in text mode does"""
+    return io.TextIOWrapper(io.BytesIO(data), encoding='utf-8')
+
+
+def read_lines(filename, start=0, end=None):
+    """Decoded lines of the log, or of a byte range of it, read in bounded chunks"""
+    with open(filename, 'rb') as file:
+        for chunk_start, chunk_end in chunk_ranges(filename, parallel_chunk_size, start, end):
+            file.seek(chunk_start)
+            yield from decode_lines(file.read(chunk_end - chunk_start))
+
+
+def format_chunk(filename, start, end):
+    """Format one byte range of the log in a worker process, returns the formatted text"""
+    lines = read_lines(filename, start, end)
+    return "".join(line for line in map(worker_formatter.format_line, lines) if line is not None)
+
+
+def write_formatted(filename, formatter, output_file, jobs=1, start=0, end=None):
+    """Format the log, or a byte range of it, writing the result to output_file"""
+    if jobs > 1:
+        write_formatted_parallel(filename, formatter, output_file, jobs, start, end)
+        return
+    for line in read_lines(filename, start, end):
+        line = formatter.format_line(line)
+        if line is not None:
+            output_file.write(line)
+
+
+def write_formatted_parallel(filename, formatter, output_file, jobs, start=0, end=None):
+    """Format the log with a pool of worker processes, writing the chunks to output_file in their original order"""
+    with ProcessPoolExecutor(max_workers=jobs, initializer=init_worker, initargs=(formatter,)) as executor:
+        pending = deque()
+        for chunk_start, chunk_end in chunk_ranges(filename, parallel_chunk_size, start, end):
+            pending.append(executor.submit(format_chunk, filename, chunk_start, chunk_end))
+            # keep a bounded number of formatted chunks in memory
+            if len(pending) >= jobs * 2:
+                output_file.write(pending.popleft().result())
+        while pending:
+            output_file.write(pending.popleft().result())
+
+
+def collect_pets(filename, pet_state, start=0, end=None):
+    """
+    Add the pets and owners found in the log, or a byte range of it, to pet_state.  Only the lines that can
+    name a pet (COMBATANT_INFO and summoned pet lines) are decoded and looked at.
+    """
+    with log_input.map_log(filename) as data:
+        for bounds in log_input.matching_lines(data, pet_line_pattern, start, end):
+            prepare_line(log_input.decode_line(data, *bounds), pet_state)
+
+
+def build_formatter(player_name, filename, cache_size=line_cache_size, start=0, end=None):
+    """
+    First pass: collect pet names from the log, or the byte range start-end of it, and build the formatter for
+    the second pass, the lines themselves are rewritten again while streaming the second pass.  Returns None if
+    the log can't be read.
+    """
+    pet_state = PetState()
     try:
+        collect_pets(filename, pet_state, start, end)
+    except (IOError, OSError, UnicodeDecodeError) as e:
+        print(f"Error reading file: {e}")
+        return None
+
+    print(f"The following pet owners will have their pet hits/crits/misses/spells associated with them: {pet_state.owner_names}")
+    if pet_state.pet_renames:
+        print(f"The following pets will be renamed to avoid having the same name as their owner: {pet_state.pet_renames}")
+    return LineFormatter(player_name, pet_state, cache_size)
+
+
+# How the original log is kept by replace_instances:
+#   copy       full copy before formatting
+#   rename     the original file itself becomes the backup once the formatted file is written, nothing is copied
+#   reflink    copy-on-write clone where the filesystem supports it (btrfs, xfs, apfs...), otherwise a copy
+#   compressed gzip compressed copy
+#   none       no backup
+backup_strategies = ("copy", "rename", "reflink", "compressed", "none")
+
+# ioctl cloning a file on Linux filesystems with copy-on-write support
+FICLONE = 0x40049409
+
+
+def backup_prefix(filename):
+    return filename.replace(".txt", "") + ".original."
+
+
+def clone_file(source, destination):
+    """Copy a file as cheaply as the platform allows: a reflink clone, then copy_file_range, then a plain copy"""
+    try:
+        import fcntl
+        with open(source, 'rb') as source_file, open(destination, 'wb') as destination_file:
+            fcntl.ioctl(destination_file.fileno(), FICLONE, source_file.fileno())
+        return "reflink"
+    except (ImportError, OSError):
+        pass
+
+    if hasattr(os, "copy_file_range"):
+        try:
+            with open(source, 'rb') as source_file, open(destination, 'wb') as destination_file:
+                remaining = os.fstat(source_file.fileno()).st_size
+                while remaining > 0:
+                    copied = os.copy_file_range(source_file.fileno(), destination_file.fileno(), remaining)
+                    if copied == 0:
+                        break
+                    remaining -= copied
+            if remaining == 0:
+                return "copy_file_range"
+        except OSError:
+            pass
+
+    shutil.copyfile(source, destination)
+    return "copy"
+
+
+def create_backup(filename, strategy):
+    """
+    Back up the log before it is formatted in place, returns the backup filename or None.  The rename strategy
+    doesn't copy anything here, see keep_original.
+    """
+    timestamp = int(time.time())
+    if strategy == "compressed":
+        backup_filename = backup_prefix(filename) + f"{timestamp}.txt.gz"
+        with open(filename, 'rb') as source, gzip.open(backup_filename, 'wb', compresslevel=1) as backup:
+            shutil.copyfileobj(source, backup, 1024 * 1024)
+    elif strategy == "reflink":
+        backup_filename = backup_prefix(filename) + f"{timestamp}.txt"
+        print(f"Backup copied using {clone_file(filename, backup_filename)}")
+    elif strategy == "copy":
+        backup_filename = backup_prefix(filename) + f"{timestamp}.txt"
         shutil.copyfile(filename, backup_filename)
-        print(f"Backup created: {backup_filename}")
+    else:
+        return None
+    print(f"Backup created: {backup_filename}")
+    return backup_filename
+
+
+def keep_original(filename):
+    """
+    Keep the unformatted log under the backup name without copying it, right before the formatted file
+    replaces it.  A hard link keeps the log in place until then, renaming is the fallback.
+    """
+    backup_filename = backup_prefix(filename) + f"{int(time.time())}.txt"
+    if os.path.exists(backup_filename):
+        os.remove(backup_filename)
+    try:
+        os.link(filename, backup_filename)
+    except (OSError, AttributeError):
+        os.rename(filename, backup_filename)
+    print(f"Backup created: {backup_filename}")
+    return backup_filename
+
+
+def prune_backups(filename, keep):
+    """Delete all but the newest keep backups of the log, keep is at least 1 so the one just made always stays"""
+    assert keep >= 1, f"keep has to be at least 1, got {keep}"
+    prefix = backup_prefix(filename)
+    backups = []
+    for backup_filename in glob.glob(glob.escape(prefix) + "*"):
+        timestamp, _, extension = backup_filename[len(prefix):].partition(".")
+        if timestamp.isdigit() and extension in ("txt", "txt.gz"):
+            backups.append((int(timestamp), backup_filename))
+    backups.sort()
+    for _, backup_filename in backups[:max(0, len(backups) - keep)]:
+        try:
+            os.remove(backup_filename)
+            print(f"Removed old backup: {backup_filename}")
+        except OSError as e:
+            print(f"Warning: Could not remove old backup {backup_filename}: {e}")
+
+
+def replace_instances(player_name, filename, jobs=1, backup="copy", keep_backups=None, profile=None,
+                      cache_size=line_cache_size):
+    """
+    Format the log in place for upload, keeping a backup of the original with the given strategy (see
+    backup_strategies).  With keep_backups only that many of the newest backups are kept.  Stage and rule
+    timings are recorded in profile if one is given.  cache_size is the size of the formatter's line cache.
+    Returns True on success.
+    """
+    player_name = player_name.strip().capitalize()
+
+    # create backup of original file
+    try:
+        create_backup(filename, backup)
     except (IOError, OSError) as e:
         print(f"Warning: Could not create backup file: {e}")
-        return  # Exit if we can't create backup
+        return False  # Exit if we can't create backup
 
-    # Read the contents of the file
+    formatter = build_formatter(player_name, filename, cache_size)
+    if formatter is None:
+        return False
+    if profile is not None:
+        if jobs > 1:
+            print("Profiling formats the log with a single job")
+            jobs = 1
+        formatter.enable_profiling(profile)
+
+    # Second pass: stream the lines through the replacements and filtering into a temporary file next to the
+    # original, then move it over the original.  Only one line (or a few chunks with several jobs) is held in
+    # memory at a time.
     try:
-        with open(filename, 'r', encoding='utf-8') as file:
-            lines = file.readlines()
-    except (IOError, OSError, UnicodeDecodeError) as e:
-        print(f"Error reading file: {e}")
-        return
+        temp_fd, temp_filename = tempfile.mkstemp(prefix=os.path.basename(filename) + ".", suffix=".tmp",
+                                                  dir=os.path.dirname(os.path.abspath(filename)))
+    except (IOError, OSError) as e:
+        print(f"Error writing to file: {e}")
+        return False
 
-    # collect pet names and change LOOT messages
-    # 4/14 20:51:43.354  COMBATANT_INFO: 14.04.24 20:51:43&Hunter&HUNTER&Dwarf&2&PetName <- pet name
-    pet_renames = set()  # rename pets that have the same name their owner
-    pet_names = set()
-    owner_names = set()
+    try:
+        with open(temp_fd, 'w', encoding='utf-8') as temp_file:
+            write_formatted(filename, formatter, temp_file, jobs)
+        shutil.copymode(filename, temp_filename)
+        if backup == "rename":
+            keep_original(filename)
+        os.replace(temp_filename, filename)
+        print(f"Successfully processed {filename}")
+        if formatter.cache is not None:
+            formatter.cache.report()
+    except (IOError, OSError, UnicodeDecodeError) as e:
+        print(f"Error writing to file: {e}")
+        try:
+            os.remove(temp_filename)
+        except OSError:
+            pass
+        return False
 
-    ignored_pet_names = {"Razorgore the Untamed (", "Deathknight Understudy (", "Naxxramas Worshipper ("}
+    if keep_backups is not None:
+        prune_backups(filename, keep_backups)
+    return True
 
-    # associate common summoned pets with their owners as well
-    summoned_pet_names = {"Greater Feral Spirit", "Battle Chicken", "Arcanite Dragonling", "The Lost", "Minor Arcane Elemental", "Scytheclaw Pureborn", "Explosive Trap I", "Explosive Trap II", "Explosive Trap III"}
-    summoned_pet_owner_regex = rf"([{L}][{L} ]+[{L}]) \(([{L}]+)\)"
+compression_methods = {
+    "deflate": zipfile.ZIP_DEFLATED,
+    "bzip2": zipfile.ZIP_BZIP2,
+    "lzma": zipfile.ZIP_LZMA,
+    "store": zipfile.ZIP_STORED,
+}
+# --compresslevel values zlib and bz2 accept, lzma and store ignore the level
+compresslevel_ranges = {"deflate": (0, 9), "bzip2": (1, 9)}
 
-    for i, _ in enumerate(lines):
-        # DPSMate logs have " 's" already which will break some of our parsing, remove the space
-        # But only for DPSMate-style logs that have extra spaces
-        if " 's" in lines[i] and not any(marker in lines[i] for marker in ["COMBATANT_INFO", "LOOT:", "ZONE_INFO"]):
-            lines[i] = lines[i].replace(" 's", "'s")
-        if "COMBATANT_INFO" in lines[i]:
-            try:
-                line_parts = lines[i].split("&")
-                pet_name = line_parts[5]
-                if pet_name != "nil" and pet_name not in ignored_pet_names:
-                    owner_name = line_parts[1]
-                    # rename pets that have the same name as their owner
-                    if pet_name == owner_name:
-                        pet_renames.add(pet_name)
-                        pet_rename_replacements[rf"{pet_name} \({owner_name}\)"] = f"{pet_name}Pet ({owner_name})"
-
-                        line_parts[5] = f"{pet_name}Pet"
-
-                    pet_names.add(f"{pet_name}")
-                    owner_names.add(f"({line_parts[1]})")
-                else:
-                    # remove pet name from uploaded combatant info, can cause player to not appear in logs if pet name
-                    # is a player name or ability name.  Don't even think legacy displays pet info anyways.
-                    line_parts[5] = "nil"
 
-                lines[i] = "&".join(line_parts)
+def check_compresslevel(compression, compresslevel):
+    """Raise ValueError if the compression method doesn't accept the level"""
+    level_range = compresslevel_ranges.get(compression)
+    if compresslevel is not None and level_range and not level_range[0] <= compresslevel <= level_range[1]:
+        raise ValueError(f"--compresslevel has to be {level_range[0]}-{level_range[1]} for {compression}")
 
-            except Exception as e:
-                print(f"Error parsing pet name from line: {lines[i]}")
-                print(e)
-        elif "LOOT:" in lines[i]:
-            lines[i] = handle_replacements(lines[i], loot_replacements)
-        else:
-            for summoned_pet_name in summoned_pet_names:
-                if summoned_pet_name in lines[i]:
-                    match = re.search(summoned_pet_owner_regex, lines[i])
-                    if match:
-                        pet_names.add(summoned_pet_name)
-                        owner_names.add(f"({match.group(2)})")
-
-    print(f"The following pet owners will have their pet hits/crits/misses/spells associated with them: {owner_names}")
-    if pet_renames:
-        print(f"The following pets will be renamed to avoid having the same name as their owner: {pet_renames}")
-
-    # Perform replacements and filtering
-    # enumerate over lines to be able to modify the list in place
-    filtered_lines = []
-
-    for i, line in enumerate(lines):
-        # Check if this is a cast line with spell ID
-        cast_match = cast_with_id_pattern.search(line)
-        should_filter = False
-
-        if cast_match:
-            # Extract spell name, ID, and action type from the cast line
-            prefix = cast_match.group(1)  # "Player casts/channels/begins to cast "
-            spell_name = cast_match.group(2).strip()
-            spell_id = int(cast_match.group(3))
-
-            # Remove raid marks from caster name in prefix
-            clean_prefix = prefix
-            for mark in raid_target_marks:
-                clean_prefix = re.sub(rf'\({mark}\)', '', clean_prefix)
-            prefix = clean_prefix
-
-            # Always filter out 'channels', 'begins to cast', and 'fails casting' with spell IDs
-            if "channels" in prefix or "begins to cast" in prefix or "fails casting" in prefix:
-                should_filter = True
-            elif "casts" in prefix:
-                # Only apply greylist logic to 'casts' lines
-                if spell_name in spell_id_greylist:
-                    if spell_id == spell_id_greylist[spell_name]:
-                        # Keep this spell but remove ID/rank and marks
-                        suffix = cast_match.group(4) if cast_match.group(4) else ""  # " on target" or ""
-                        # Remove raid marks from target names
-                        if suffix and " on " in suffix:
-                            target_part = suffix.replace(" on ", "")
-                            clean_target = remove_raid_marks(target_part, raid_target_marks)
-                            suffix = f" on {clean_target}" if clean_target else ""
-
-                        if suffix and not suffix.endswith('.'):
-                            line = prefix + spell_name + suffix + ".\n"
-                        elif suffix and suffix.endswith('.'):
-                            line = prefix + spell_name + suffix + "\n"
-                        else:
-                            line = prefix + spell_name + ".\n"
-                    else:
-                        # Wrong spell ID for this spell name, filter it out
-                        should_filter = True
-                else:
-                    # Not in greylist, keep it but remove ID/rank and marks (normal behavior)
-                    suffix = cast_match.group(4) if cast_match.group(4) else ""  # " on target" or ""
-                    # Remove raid marks from target names
-                    if suffix and " on " in suffix:
-                        target_part = suffix.replace(" on ", "")
-                        clean_target = remove_raid_marks(target_part, raid_target_marks)
-                        suffix = f" on {clean_target}" if clean_target else ""
-
-                    if suffix and not suffix.endswith('.'):
-                        line = prefix + spell_name + suffix + ".\n"
-                    elif suffix and suffix.endswith('.'):
-                        line = prefix + spell_name + suffix + "\n"
-                    else:
-                        line = prefix + spell_name + ".\n"
 
-        # Filter out unwanted line types by prefix
-        if not should_filter:
-            for prefix in unwanted_line_prefixes:
-                if prefix in line:
-                    should_filter = True
-                    break
+def replace_instances_to_zip(player_name, filename, zip_filename, compression="deflate", compresslevel=None, jobs=1,
+                             cache_size=line_cache_size):
+    """
+    Format the log straight into a zip file for upload, leaving the log itself untouched.
 
-        # Filter out all "fails casting" lines (with or without spell ID)
-        if not should_filter and fails_casting_pattern.search(line):
-            should_filter = True
+    The formatted lines are compressed as they are produced, so there is no rewrite of the log and no second
+    read of it to build the zip.  Returns True on success.
+    """
+    try:
+        check_compresslevel(compression, compresslevel)
+    except ValueError as e:
+        print(f"Error creating zip file: {e}")
+        return False
+    player_name = player_name.strip().capitalize()
+    formatter = build_formatter(player_name, filename, cache_size)
+    if formatter is None:
+        return False
 
-        if should_filter:
-            continue  # Skip this line
+    temp_filename = zip_filename + ".tmp"
+    try:
+        with zipfile.ZipFile(temp_filename, 'w', compression_methods[compression], compresslevel=compresslevel) as zipf:
+            # the size isn't known up front, allow the entry to grow past 2 GB
+            with zipf.open(os.path.basename(filename), 'w', force_zip64=True) as entry, \
+                    io.TextIOWrapper(entry, encoding='utf-8') as output_file:
+                write_formatted(filename, formatter, output_file, jobs)
+        os.replace(temp_filename, zip_filename)
+    except (IOError, OSError, UnicodeDecodeError, ValueError, zipfile.BadZipFile) as e:
+        print(f"Error creating zip file: {e}")
+        try:
+            os.remove(temp_filename)
+        except OSError:
+            pass
+        return False
 
-        # Continue with normal processing
-        # Handle names with apostrophes (highest priority to avoid parsing issues)
-        line = handle_replacements(line, mob_names_with_apostrophe)
+    print(f"Successfully processed {filename} into {zip_filename}")
+    if formatter.cache is not None:
+        formatter.cache.report()
+    return True
+
+
+class CountingWriter:
+    """Unseekable stream that only counts the bytes written to it"""
+
+    def __init__(self):
+        self.size = 0
+
+    def write(self, data):
+        self.size += len(data)
+        return len(data)
+
+    def flush(self):
+        pass
+
+
+def compression_report(filename, settings=None):
+    """
+    Compress a formatted log (or the first entry of a zip of one) with each (method, level) in settings and
+    print the time and size of each, to pick a setting for the upload zip.  Returns the measurements.
+    """
+    if settings is None:
+        settings = [("store", None), ("deflate", 1), ("deflate", 6), ("deflate", 9), ("bzip2", 1), ("bzip2", 9),
+                    ("lzma", None)]
+
+    def open_source():
+        if zipfile.is_zipfile(filename):
+            source_zip = zipfile.ZipFile(filename)
+            entry = source_zip.open(source_zip.namelist()[0])
+            entry.size = source_zip.infolist()[0].file_size
+            return entry
+        return open(filename, 'rb')
+
+    results = []
+    for compression, compresslevel in settings:
+        sink = CountingWriter()
+        started = time.perf_counter()
+        original_size = 0
+        with open_source() as source, \
+                zipfile.ZipFile(sink, 'w', compression_methods[compression], compresslevel=compresslevel) as zipf, \
+                zipf.open("log.txt", 'w', force_zip64=True) as entry:
+            while True:
+                block = source.read(1024 * 1024)
+                if not block:
+                    break
+                original_size += len(block)
+                entry.write(block)
+        results.append((compression, compresslevel, original_size, sink.size, time.perf_counter() - started))
+
+    print("\nMethod   Level       Size   Ratio   Seconds     MB/s")
+    print("-" * 53)
+    for compression, compresslevel, original_size, size, seconds in results:
+        ratio = size / original_size if original_size else 0
+        speed = original_size / seconds / 1024 / 1024 if seconds else 0
+        level = "-" if compresslevel is None else str(compresslevel)
+        print(f"{compression:<8} {level:>5} {size:>10} {ratio:>7.3f} {seconds:>9.2f} {speed:>8.1f}")
+    return results
+
+
+# number of bytes hashed at the start of the log and just before the checkpoint offset
+fingerprint_size = 64 * 1024
+
+
+def log_fingerprint(filename, offset):
+    """
+    Hash identifying the first offset bytes of the log.  Only the start of the log and the bytes right before
+    offset are hashed so that checking a checkpoint doesn't read the whole history.
+    """
+    digest = hashlib.sha256(str(offset).encode())
+    with open(filename, 'rb') as file:
+        digest.update(file.read(min(offset, fingerprint_size)))
+        tail_start = max(fingerprint_size, offset - fingerprint_size)
+        if tail_start < offset:
+            file.seek(tail_start)
+            digest.update(file.read(offset - tail_start))
+    return digest.hexdigest()
+
+
+def last_line_end(filename, start, end):
+    """Offset just past the last newline between start and end, so a partially written line is left for later"""
+    block_size = 64 * 1024
+    with open(filename, 'rb') as file:
+        position = end
+        while position > start:
+            block_start = max(start, position - block_size)
+            file.seek(block_start)
+            newline = file.read(position - block_start).rfind(b"\n")
+            if newline != -1:
+                return block_start + newline + 1
+            position = block_start
+    return start
+
+
+def load_checkpoint(checkpoint_filename, filename, player_name, output_filename):
+    """Returns the checkpoint if it still describes the log and the formatted output, otherwise None"""
+    try:
+        with open(checkpoint_filename, 'r', encoding='utf-8') as file:
+            checkpoint = json.load(file)
+        if checkpoint.get("version") != 1 or checkpoint["player_name"] != player_name:
+            return None
+        if os.path.abspath(checkpoint["output_filename"]) != os.path.abspath(output_filename):
+            return None
+        if os.path.getsize(output_filename) != checkpoint["output_size"]:
+            return None
+        offset = checkpoint["offset"]
+        if os.path.getsize(filename) < offset or log_fingerprint(filename, offset) != checkpoint["fingerprint"]:
+            return None
+        return checkpoint
+    except (IOError, OSError, ValueError, KeyError, TypeError):
+        return None
+
+
+def save_checkpoint(checkpoint_filename, checkpoint):
+    temp_filename = checkpoint_filename + ".tmp"
+    with open(temp_filename, 'w', encoding='utf-8') as file:
+        json.dump(checkpoint, file)
+    os.replace(temp_filename, checkpoint_filename)
+
+
+def replace_instances_incremental(player_name, filename, output_filename=None, jobs=1, cache_size=line_cache_size):
+    """
+    Format only what was appended to the log since the last run and append it to output_filename.
+
+    The game keeps appending to the same WoWCombatLog.txt, so instead of rewriting it in place this leaves the
+    log untouched and keeps a checkpoint next to it with the processed byte offset, a fingerprint of the
+    processed part and the pet/owner state collected from it.  If the log was replaced or the output was
+    changed since the checkpoint, everything is formatted again.
+
+    Pets learned from the new lines are only applied to the new lines.
+
+    Returns the output filename, or None on error.
+    """
+    player_name = player_name.strip().capitalize()
+    if output_filename is None:
+        output_filename = filename.replace(".txt", "") + ".formatted.txt"
+    checkpoint_filename = filename + ".checkpoint.json"
+
+    checkpoint = load_checkpoint(checkpoint_filename, filename, player_name, output_filename)
+    if checkpoint is None:
+        start = 0
+        pet_state = PetState()
+        output_mode = 'w'
+    else:
+        start = checkpoint["offset"]
+        pet_state = PetState.from_dict(checkpoint["pet_state"])
+        output_mode = 'a'
 
-        # handle pet renames
-        if pet_rename_replacements:
-            line = handle_replacements(line, pet_rename_replacements)
+    try:
+        end = last_line_end(filename, start, os.path.getsize(filename))
+    except (IOError, OSError) as e:
+        print(f"Error reading file: {e}")
+        return None
+    if checkpoint is not None and end == start:
+        print(f"No new lines in {filename} since the last run")
+        return output_filename
+    print(f"Formatting {end - start} bytes of {filename} starting at offset {start}")
 
-        # handle pets
-        for owner_name in owner_names:
-            if owner_name in line:
-                # ignore pet dying
-                if "dies." in line or "is killed by" in line:
-                    continue
+    # First pass over the new lines only, adding to the state of the previous runs
+    try:
+        collect_pets(filename, pet_state, start, end)
+    except (IOError, OSError, UnicodeDecodeError) as e:
+        print(f"Error reading file: {e}")
+        return None
 
-                # check if line contains any ignored pet names
-                if not any(ignored_pet_name in line for ignored_pet_name in ignored_pet_names):
-                    line = handle_replacements(line, pet_replacements)
+    formatter = LineFormatter(player_name, pet_state, cache_size)
+    print(f"The following pet owners will have their pet hits/crits/misses/spells associated with them: {pet_state.owner_names}")
+    if pet_state.pet_renames:
+        print(f"The following pets will be renamed to avoid having the same name as their owner: {pet_state.pet_renames}")
 
-        # if line contains you/You
-        if "you" in line or "You" in line or "dodged." in line:
-            line = handle_replacements(line, you_replacements)
-            line = handle_replacements(line,
-                                           you_replacements)  # when casting ability on yourself need to do two replacements
+    try:
+        with open(output_filename, output_mode, encoding='utf-8') as output_file:
+            write_formatted(filename, formatter, output_file, jobs, start, end)
+        save_checkpoint(checkpoint_filename, {
+            "version": 1,
+            "player_name": player_name,
+            "offset": end,
+            "fingerprint": log_fingerprint(filename, end),
+            "output_filename": output_filename,
+            "output_size": os.path.getsize(output_filename),
+            "pet_state": pet_state.to_dict(),
+        })
+    except (IOError, OSError, UnicodeDecodeError) as e:
+        print(f"Error writing to file: {e}")
+        # the output no longer matches the checkpoint, the next run starts over
+        return None
 
-        # generic replacements
-        line = handle_replacements(line, generic_replacements)
+    print(f"Successfully processed {filename} into {output_filename}")
+    return output_filename
 
-        # renames
-        line = handle_replacements(line, renames)
 
-        # self damage exceptions
-        for pattern, replacement in friendly_fire.items():
-            match = re.search(pattern, line)
-            if match:
-                line = handle_replacements(line, {pattern: replacement})
-                break
+def replace_instances_segments(player_name, filename, segment=None, since=None, until=None, output_filename=None,
+                               jobs=1, cache_size=line_cache_size):
+    """
+    Format only some segments or a time range of the log into output_filename, leaving the log untouched.  The
+    parts are found with the segment index of log_segments (see log_segments.select_ranges) and read straight
+    from their offsets.
 
-        # self damage
-        for pattern, replacement in self_damage.items():
-            match = re.search(pattern, line)
-            # check that group 1 and 4 are equal meaning the player is hitting themselves
-            if match and match.group(1).strip() == match.group(4).strip():
-                line = handle_replacements(line, {pattern: replacement})
-                break
+    Pets are collected from the start of the log up to the end of the last part, so pets only named after it
+    aren't known, like with --incremental.
 
-        # Add processed line to filtered results
-        filtered_lines.append(line)
+    Returns the output filename, or None on error.
+    """
+    player_name = player_name.strip().capitalize()
+    if output_filename is None:
+        output_filename = filename.replace(".txt", "") + ".segment.txt"
 
-    # Write the modified text back to the file
     try:
-        with open(filename, 'w', encoding='utf-8') as file:
-            file.writelines(filtered_lines)
-        print(f"Successfully processed {filename}")
+        ranges = log_segments.select_ranges(filename, segment, since, until)
+    except ValueError as e:
+        # nothing in the log matched --segment, --since or --until
+        print(f"Error: {e}")
+        return None
     except (IOError, OSError) as e:
+        print(f"Error reading file: {e}")
+        return None
+    print(f"Formatting {sum(end - start for start, end, _, _ in ranges)} bytes of {filename} in {len(ranges)} "
+          f"part{'s' if len(ranges) > 1 else ''}")
+
+    formatter = build_formatter(player_name, filename, cache_size, 0, ranges[-1][1])
+    if formatter is None:
+        return None
+
+    try:
+        with open(output_filename, 'w', encoding='utf-8') as output_file:
+            for start, end, _, _ in ranges:
+                write_formatted(filename, formatter, output_file, jobs, start, end)
+    except (IOError, OSError, UnicodeDecodeError) as e:
         print(f"Error writing to file: {e}")
-        return
+        return None
+
+    print(f"Successfully processed {filename} into {output_filename}")
+    if formatter.cache is not None:
+        formatter.cache.report()
+    return output_filename
+
+
+# seconds between checks for new lines in --follow mode
+follow_poll_interval = 0.25
 
-def create_zip_file(source_file, zip_filename):
+
+def follow_log(player_name, filename, output_filename=None, from_start=False, idle_timeout=None,
+               cache_size=line_cache_size):
+    """
+    Format lines as the game appends them to the log, writing them to output_filename.
+
+    The existing log is read once to collect pets and owners (and formatted too with from_start), then new
+    lines are formatted as soon as they are complete, read parallel_chunk_size bytes at a time.  COMBATANT_INFO
+    lines arriving while following add their pets for the lines after them.  If the log is truncated or replaced
+    by a new file, its pets are collected again and following continues from the start of it.  Runs until interrupted, or until the log hasn't grown for idle_timeout
+    seconds.
+
+    Returns the output filename, or None on error.
+    """
+    player_name = player_name.strip().capitalize()
+    if output_filename is None:
+        output_filename = filename.replace(".txt", "") + ".live.txt"
+
+    pet_state = PetState()
+    try:
+        # pets of the whole existing log, with from_start its first lines get the same owners as in a normal run
+        existing = last_line_end(filename, 0, os.path.getsize(filename))
+        collect_pets(filename, pet_state, 0, existing)
+        position = 0 if from_start else existing
+        file = open(filename, 'rb')
+        inode = os.fstat(file.fileno()).st_ino
+    except (IOError, OSError, UnicodeDecodeError) as e:
+        print(f"Error reading file: {e}")
+        return None
+
+    formatter = LineFormatter(player_name, pet_state, cache_size)
+    print(f"Following {filename}, writing formatted lines to {output_filename} (Ctrl+C to stop)")
+    partial = b""
+    last_growth = time.monotonic()
+    try:
+        with file, open(output_filename, 'w', encoding='utf-8') as output_file:
+            while True:
+                try:
+                    stat = os.stat(filename)
+                except OSError:
+                    stat = None  # being rotated, try again
+                if stat is not None and (stat.st_ino != inode or stat.st_size < position):
+                    print(f"{filename} was truncated or replaced, following it from the start")
+                    file.close()
+                    file = open(filename, 'rb')
+                    inode = os.fstat(file.fileno()).st_ino
+                    position = 0
+                    partial = b""
+                    collect_pets(filename, pet_state, 0, last_line_end(filename, 0, os.fstat(file.fileno()).st_size))
+                    formatter = LineFormatter(player_name, pet_state, cache_size)
+
+                # a bounded block at a time, the rest is read on the next round
+                file.seek(position)
+                data = file.read(parallel_chunk_size)
+                if not data:
+                    if idle_timeout is not None and time.monotonic() - last_growth >= idle_timeout:
+                        break
+                    time.sleep(follow_poll_interval)
+                    continue
+                position += len(data)
+                last_growth = time.monotonic()
+
+                # keep a partially written last line until the rest of it arrives
+                data = partial + data
+                line_end = data.rfind(b"\n") + 1
+                partial = data[line_end:]
+                for line in decode_lines(data[:line_end]):
+                    owner_count = len(pet_state.owner_names)
+                    rename_count = len(pet_state.pet_rename_replacements)
+                    line = prepare_line(line, pet_state)
+                    if len(pet_state.owner_names) != owner_count or \
+                            len(pet_state.pet_rename_replacements) != rename_count:
+                        formatter = LineFormatter(player_name, pet_state, cache_size)
+                        print(f"Pet owners are now: {pet_state.owner_names}")
+                    line = formatter.transform_line(line)
+                    if line is not None:
+                        output_file.write(line)
+                output_file.flush()
+    except KeyboardInterrupt:
+        pass
+    except (IOError, OSError, UnicodeDecodeError) as e:
+        print(f"Error following file: {e}")
+        return None
+
+    print(f"Stopped following {filename}, formatted lines are in {output_filename}")
+    return output_filename
+
+
+def create_zip_file(source_file, zip_filename, compression="deflate", compresslevel=None):
+    try:
+        check_compresslevel(compression, compresslevel)
+    except ValueError as e:
+        print(f"Error creating zip file: {e}")
+        return False
     try:
-        with zipfile.ZipFile(zip_filename, 'w', zipfile.ZIP_DEFLATED) as zipf:
+        with zipfile.ZipFile(zip_filename, 'w', compression_methods[compression], compresslevel=compresslevel) as zipf:
             zipf.write(source_file, arcname=os.path.basename(source_file))
         print(f"Zip file created: {zip_filename}")
-    except (IOError, OSError, zipfile.BadZipFile) as e:
+        return True
+    except (IOError, OSError, ValueError, zipfile.BadZipFile) as e:
         print(f"Error creating zip file: {e}")
+        try:
+            os.remove(zip_filename)
+        except OSError:
+            pass
+        return False
+
+def parse_keep_backups(value):
+    """--keep-backups N, at least 1 so the backup of the run itself is never deleted"""
+    try:
+        keep = int(value)
+    except ValueError:
+        keep = 0
+    if keep < 1:
+        raise argparse.ArgumentTypeError(f"expected a number of backups of at least 1, got {value}")
+    return keep
+
 
 def validate_player_name(name):
     """Validate player name - should only contain letters, spaces, and apostrophes"""
@@ -423,15 +1624,201 @@ def validate_filename(filename):
         return False
     if not os.path.isfile(filename):
         return False
-    try:
-        with open(filename, 'r', encoding='utf-8') as f:
-            f.read(1)  # Try to read first character
-        return True
-    except (IOError, OSError, UnicodeDecodeError):
-        return False
+    return os.access(filename, os.R_OK)
+
+def format_log_job(player_name, filename, create_zip=True, stream_zip=False, compression="deflate",
+                   compresslevel=None, backup="copy", keep_backups=None, cache_size=line_cache_size):
+    """
+    Format and optionally zip one log in a batch worker process.  With stream_zip the log is formatted straight
+    into the zip and left untouched.
+
+    Returns (success, output) where output is everything the job printed, so that the reports of jobs
+    running at the same time don't interleave.
+    """
+    output = io.StringIO()
+    with contextlib.redirect_stdout(output):
+        if not validate_player_name(player_name):
+            print(f"Invalid player name '{player_name}'. Please use only letters, spaces, and apostrophes.")
+            success = False
+        elif not validate_filename(filename):
+            print(f"File '{filename}' not found or not readable.")
+            success = False
+        else:
+            try:
+                if stream_zip:
+                    success = replace_instances_to_zip(player_name, filename, filename + ".zip", compression,
+                                                       compresslevel, cache_size=cache_size)
+                else:
+                    success = replace_instances(player_name, filename, backup=backup, keep_backups=keep_backups,
+                                                cache_size=cache_size)
+                    if success and create_zip:
+                        success = create_zip_file(filename, filename + ".zip", compression, compresslevel)
+            except Exception as e:
+                print(f"Error formatting {filename}: {e}")
+                success = False
+    return success, output.getvalue()
+
+
+def parse_batch_entry(entry):
+    """Split a PLAYER=LOGFILE batch argument"""
+    player_name, separator, filename = entry.partition("=")
+    if not separator:
+        raise argparse.ArgumentTypeError(f"expected PLAYER=LOGFILE, got '{entry}'")
+    return player_name.strip(), filename.strip()
+
+
+def read_manifest(manifest_filename):
+    """
+    Read (player name, log file) pairs from a manifest with one "player,logfile" per line.  Blank lines and
+    lines starting with # are ignored, relative log paths are relative to the manifest.
+    """
+    entries = []
+    base_dir = os.path.dirname(os.path.abspath(manifest_filename))
+    with open(manifest_filename, 'r', encoding='utf-8', newline='') as file:
+        for row in csv.reader(file):
+            if not row or not row[0].strip() or row[0].lstrip().startswith("#"):
+                continue
+            if len(row) < 2:
+                raise ValueError(f"expected 'player,logfile' in {manifest_filename}, got '{','.join(row)}'")
+            entries.append((row[0].strip(), os.path.join(base_dir, row[1].strip())))
+    return entries
+
+
+def unique_entries(entries):
+    """
+    Batch entries with each log only once, the first entry of a log is kept.  Two workers on the same log would
+    race on its temp and backup files.
+    """
+    unique = {}
+    for player_name, filename in entries:
+        path = os.path.abspath(filename)
+        if path in unique:
+            print(f"Warning: {filename} is listed more than once, formatting it once for {unique[path][0]}")
+            continue
+        unique[path] = (player_name, filename)
+    return list(unique.values())
+
+
+def run_batch(entries, workers, **job_options):
+    """
+    Format many logs on a pool of worker processes, printing a report for each.  job_options are passed to
+    format_log_job.  Returns the number of failures.
+    """
+    failures = []
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        futures = {executor.submit(format_log_job, player_name, filename, **job_options): (player_name, filename)
+                   for player_name, filename in entries}
+        for future in as_completed(futures):
+            player_name, filename = futures[future]
+            try:
+                success, output = future.result()
+            except Exception as e:
+                success, output = False, f"Worker failed: {e}\n"
+            print(f"[{'OK' if success else 'FAILED'}] {filename} ({player_name})")
+            for line in output.splitlines():
+                print(f"    {line}")
+            if not success:
+                failures.append(filename)
+
+    print(f"\n{len(entries) - len(failures)} of {len(entries)} logs formatted successfully.")
+    for filename in failures:
+        print(f"- Failed: {filename}")
+    return len(failures)
+
 
 def main():
     """Main function for interactive usage"""
+    parser = argparse.ArgumentParser(description="Format a WoWCombatLog.txt for upload.")
+    parser.add_argument("-j", "--jobs", type=int, default=1,
+                        help="number of worker processes used to format the log, or number of logs formatted at "
+                             "once in batch mode (default 1)")
+    parser.add_argument("--batch", nargs="+", type=parse_batch_entry, default=[], metavar="PLAYER=LOGFILE",
+                        help="format these logs without prompting")
+    parser.add_argument("--manifest",
+                        help="format the logs listed in this file without prompting, one 'player,logfile' per line")
+    parser.add_argument("--no-zip", action="store_true", help="don't create zip files in batch mode")
+    parser.add_argument("--stream-zip", action="store_true",
+                        help="write the formatted log straight into the zip file, leaving the log untouched")
+    parser.add_argument("--compression", choices=sorted(compression_methods), default="deflate",
+                        help="compression method of the zip file (default deflate)")
+    parser.add_argument("--compresslevel", type=int,
+                        help="compression level of the zip file, 0-9 for deflate, 1-9 for bzip2, lzma and store "
+                             "ignore it")
+    parser.add_argument("--backup", choices=backup_strategies,
+                        help="how the original log is kept: copy it (default), rename it (no copy), reflink clone "
+                             "it where supported, gzip it, or none")
+    parser.add_argument("--keep-backups", type=parse_keep_backups, metavar="N",
+                        help="only keep the newest N backups of the log, at least 1")
+    parser.add_argument("--line-cache", type=int, default=line_cache_size, metavar="N",
+                        help=f"remember the formatting of up to N repeated lines, 0 to disable (default {line_cache_size})")
+    parser.add_argument("--profile", nargs="?", const="-", metavar="FILE",
+                        help="time each formatting stage and rule and print a report, or write it as json to FILE")
+    parser.add_argument("--compression-report", metavar="FILE",
+                        help="print the time and size of each compression setting for a formatted log or its "
+                             "zip, then exit")
+    parser.add_argument("--incremental", action="store_true",
+                        help="leave the log untouched and only format what was appended since the last run, "
+                             "appending it to a separate output file")
+    parser.add_argument("--follow", action="store_true",
+                        help="keep running and format lines as the game writes them to a separate output file")
+    parser.add_argument("--from-start", action="store_true",
+                        help="with --follow, also format the lines already in the log")
+    parser.add_argument("--idle-timeout", type=float,
+                        help="with --follow, stop once the log hasn't grown for this many seconds")
+    parser.add_argument("--segment", metavar="N|NAME",
+                        help="leave the log untouched and only format these segments of it to a separate output "
+                             "file: comma separated numbers or ranges like 3-5, or a boss, mob or zone name, "
+                             "python log_segments.py LOGFILE lists them")
+    parser.add_argument("--since", type=log_segments.parse_time, metavar="[M/D ]HH:MM[:SS]",
+                        help="like --segment, only format the log from this time")
+    parser.add_argument("--until", type=log_segments.parse_time, metavar="[M/D ]HH:MM[:SS]",
+                        help="like --segment, only format the log up to before this time")
+    parser.add_argument("-o", "--output",
+                        help="output file for --incremental (default <log>.formatted.txt), "
+                             "--follow (default <log>.live.txt) or --segment, --since and --until "
+                             "(default <log>.segment.txt)")
+    args = parser.parse_args()
+    select = args.segment is not None or args.since is not None or args.until is not None
+    if (args.batch or args.manifest) and (args.profile or args.incremental or args.follow or args.from_start or
+                                          args.idle_timeout is not None or select or args.output):
+        parser.error("--profile, --incremental, --follow, --from-start, --idle-timeout, --segment, --since, --until "
+                     "and --output can't be used with --batch or --manifest")
+    if select and (args.incremental or args.follow or args.stream_zip):
+        parser.error("--segment, --since and --until can't be used with --incremental, --follow or --stream-zip")
+    if args.stream_zip and (args.incremental or args.follow):
+        parser.error("--stream-zip can't be used with --incremental or --follow")
+    if args.profile and (args.incremental or args.follow or select or args.stream_zip):
+        parser.error("--profile only works when formatting the log in place, not with --incremental, --follow, "
+                     "--segment, --since, --until or --stream-zip")
+    # only formatting in place backs up the log, the other modes leave it untouched
+    if (args.backup or args.keep_backups) and (args.incremental or args.follow or select or args.stream_zip):
+        parser.error("--backup and --keep-backups can't be used with --incremental, --follow, --segment, --since, "
+                     "--until or --stream-zip, which leave the log untouched")
+    backup = args.backup or "copy"
+    try:
+        check_compresslevel(args.compression, args.compresslevel)
+    except ValueError as e:
+        parser.error(str(e))
+    zip_options = {"compression": args.compression, "compresslevel": args.compresslevel}
+
+    if args.compression_report:
+        compression_report(args.compression_report)
+        return
+
+    if args.batch or args.manifest:
+        entries = list(args.batch)
+        if args.manifest:
+            try:
+                entries.extend(read_manifest(args.manifest))
+            except (IOError, OSError, ValueError) as e:
+                print(f"Error reading manifest: {e}")
+                sys.exit(2)
+        entries = unique_entries(entries)
+        if run_batch(entries, max(1, args.jobs), create_zip=not args.no_zip, stream_zip=args.stream_zip,
+                     backup=backup, keep_backups=args.keep_backups, cache_size=args.line_cache, **zip_options):
+            sys.exit(1)
+        return
+
     # Get and validate player name
     while True:
         player_name = input("Enter player name: ").strip()
@@ -449,13 +1836,48 @@ def main():
             break
         print(f"File '{filename}' not found or not readable. Please enter a valid filename.")
 
+    if args.stream_zip:
+        if replace_instances_to_zip(player_name, filename, filename + ".zip", jobs=max(1, args.jobs),
+                                    cache_size=args.line_cache, **zip_options):
+            print(f"Messages with You/Your have been converted to {player_name} in {filename}.zip, "
+                  f"the original file was left untouched.")
+        return
+
     create_zip = input("Create zip file (default y): ")
 
-    replace_instances(player_name, filename)
+    if args.incremental or args.follow or select:
+        if args.follow:
+            output_filename = follow_log(player_name, filename, args.output, args.from_start, args.idle_timeout,
+                                         args.line_cache)
+        elif select:
+            output_filename = replace_instances_segments(player_name, filename, args.segment, args.since, args.until,
+                                                         args.output, jobs=max(1, args.jobs), cache_size=args.line_cache)
+        else:
+            output_filename = replace_instances_incremental(player_name, filename, args.output,
+                                                            jobs=max(1, args.jobs), cache_size=args.line_cache)
+        if output_filename is None:
+            return
+        if not create_zip.strip() or create_zip.lower().startswith('y'):
+            create_zip_file(output_filename, output_filename + ".zip", **zip_options)
+        print(f"Messages with You/Your have been converted to {player_name} in {output_filename}.")
+        return
+
+    profile = FormatterProfile() if args.profile else None
+    replace_instances(player_name, filename, jobs=max(1, args.jobs), backup=backup, keep_backups=args.keep_backups,
+                      profile=profile, cache_size=args.line_cache)
+    if profile is not None:
+        if args.profile == "-":
+            profile.report()
+        else:
+            profile.save(args.profile)
+            print(f"Profile written to {args.profile}")
     if not create_zip.strip() or create_zip.lower().startswith('y'):
-        create_zip_file(filename, filename + ".zip")
-    print(
-        f"Messages with You/Your have been converted to {player_name}.  A backup of the original file has also been created.")
+        create_zip_file(filename, filename + ".zip", **zip_options)
+    if backup == "none":
+        print(f"Messages with You/Your have been converted to {player_name}.")
+    else:
+        print(
+            f"Messages with You/Your have been converted to {player_name}.  A backup of the original file has also been created.")
 
 if __name__ == "__main__":
     main()
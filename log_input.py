@@ -0,0 +1,235 @@
+"""
+Memory mapped, bytes level access to combat logs, shared by format_log_for_upload.py and wasted_sunders_raw.py.
+
+Nearly all of a log is ASCII and most lines are of no interest to a given pass, so instead of decoding every
+line the file is mapped and compiled bytes regexes run over the whole of it.  Only the lines that matched are
+decoded.  Lines end with \\r\\n, \\n or a lone \\r like with Python's universal newlines, and decoded lines end
+with \\n the same way reading the log in text mode gives them.
+"""
+
+import contextlib
+import datetime
+import fnmatch
+import hashlib
+import mmap
+import os
+import re
+
+# a line break as universal newlines sees it
+newline_pattern = re.compile(rb"\r\n?|\n")
+# how much of the log is lowercased at a time by matching_lines_ignorecase
+ignorecase_chunk_size = 16 * 1024 * 1024
+# how much of the log is copied at a time by count_line_breaks
+count_chunk_size = 16 * 1024 * 1024
+# how much of the start and end of the log goes into the hash of file_key
+key_block_size = 1024 * 1024
+# year of logs without a dated line to take it from
+default_year = 2024
+# ZONE_INFO: 27.11.24 19:30:00&... and COMBATANT_INFO: 27.11.24 19:30:00&..., the only lines with the year
+record_date_pattern = re.compile(rb"^(\d{1,2})/\d{1,2} [^\r\n]*?  (?:ZONE_INFO|COMBATANT_INFO): \d{1,2}\.\d{1,2}\.(\d{2,4})[ &]",
+                                 re.MULTILINE)
+# how much of the start of the log log_year looks through for a dated line
+year_search_size = 1024 * 1024
+# names the game gives logs
+log_name_patterns = ("WoWCombatLog*.txt", "WoWRawCombatLog*.txt")
+# files the scripts write next to a log that look like logs themselves: the --incremental, --follow and --segment
+# output, the .sunders.txt of watch_logs.py, backups of the original and the <date>.<zone>.txt pieces of split_log.py
+output_name_pattern = re.compile(r"\.(?:formatted|live|segment|sunders)\.txt$|\.original\."
+                                 r"|\.(?:(?:\d{4}-)?\d{2}-\d{2}|undated)\.[^.]+(?:\.\d+)?\.txt$")
+
+
+@contextlib.contextmanager
+def map_log(filename):
+    """Map a log read only, an empty log gives empty bytes since it can't be mapped"""
+    with open(filename, 'rb') as file:
+        try:
+            data = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+        except ValueError:
+            # empty file
+            yield b""
+            return
+        with data:
+            yield data
+
+
+def file_key(filename):
+    """
+    What a cache or index of filename has to have been made from: its size, modification time and a hash of its
+    first and last megabyte, so it's made again whenever the log changes or grows.
+    """
+    stat = os.stat(filename)
+    digest = hashlib.sha1()
+    with open(filename, 'rb') as file:
+        digest.update(file.read(key_block_size))
+        if stat.st_size > key_block_size:
+            file.seek(max(key_block_size, stat.st_size - key_block_size))
+            digest.update(file.read())
+    return {"size": stat.st_size, "mtime_ns": stat.st_mtime_ns, "hash": digest.hexdigest()}
+
+
+def is_log_name(name, raw_only=False):
+    """Whether a file name is one of a log the game wrote (only raw logs with raw_only), not one the scripts wrote"""
+    patterns = log_name_patterns[1:] if raw_only else log_name_patterns
+    return any(fnmatch.fnmatch(name, pattern) for pattern in patterns) and not output_name_pattern.search(name)
+
+
+def is_raw_log_name(name):
+    return fnmatch.fnmatch(name, log_name_patterns[1])
+
+
+def line_bounds(data, offset, start=0, end=None):
+    """
+    (line start, content end, line end) of the line containing offset, where content end is before the line
+    break and line end after it.  The line is looked for within start-end only.
+    """
+    if end is None:
+        end = len(data)
+    # look for a \r only after the last \n, searching back to start for one that isn't there is quadratic
+    newline = data.rfind(b"\n", start, offset)
+    line_start = max(newline, data.rfind(b"\r", max(newline, start), offset), start - 1) + 1
+    match = newline_pattern.search(data, offset, end)
+    if match is None:
+        return line_start, end, end
+    return line_start, match.start(), match.end()
+
+
+def last_line_start(data, start=0, end=None):
+    """Start of the last line within start-end, which ends at end"""
+    if end is None:
+        end = len(data)
+    return line_bounds(data, end - 2 if data[end - 2:end] == b"\r\n" else end - 1, start, end)[0]
+
+
+def count_line_breaks(data, start, end):
+    """
+    Line breaks within start-end as universal newlines sees them, start-end mustn't split a \\r\\n.  Maps are
+    counted a chunk at a time since they can't count themselves.
+    """
+    count = 0
+    for chunk_start in range(start, end, count_chunk_size):
+        chunk = data[chunk_start:min(chunk_start + count_chunk_size, end)]
+        count += chunk.count(b"\n") + chunk.count(b"\r") - chunk.count(b"\r\n")
+        # a \\r\\n split between two chunks
+        if chunk_start > start and data[chunk_start - 1:chunk_start + 1] == b"\r\n":
+            count -= 1
+    return count
+
+
+def decode_line(data, line_start, content_end, line_end):
+    """Decode one line the way reading the log in text mode would, ending it with \\n if it has a line break"""
+    line = data[line_start:content_end].decode('utf-8')
+    return line + "\n" if line_end > content_end else line
+
+
+def matching_lines(data, pattern, start=0, end=None):
+    """
+    (line start, content end, line end) of every line within start-end that pattern finds anything in, in
+    order and once per line however many matches it has.  pattern is a compiled bytes regex that doesn't
+    match across line breaks.
+    """
+    if end is None:
+        end = len(data)
+    position = start
+    while position < end:
+        match = pattern.search(data, position, end)
+        if match is None:
+            return
+        bounds = line_bounds(data, match.start(), start, end)
+        yield bounds
+        position = max(bounds[2], match.end())
+        if position == match.start():
+            position += 1
+
+
+
+def matching_lines_ignorecase(data, pattern, start=0, end=None):
+    """
+    matching_lines ignoring ASCII case, the same as a bytes pattern with re.IGNORECASE but pattern is lowercase
+    and compiled without it.  The log is lowercased a chunk of whole lines at a time and searched case sensitively,
+    which is many times faster for an alternation of names than re.IGNORECASE.
+    """
+    if end is None:
+        end = len(data)
+    chunk_start = start
+    while chunk_start < end:
+        chunk_end = line_bounds(data, min(chunk_start + ignorecase_chunk_size, end) - 1, chunk_start, end)[2]
+        chunk = data[chunk_start:chunk_end].lower()
+        for line_start, content_end, line_end in matching_lines(chunk, pattern):
+            yield chunk_start + line_start, chunk_start + content_end, chunk_start + line_end
+        chunk_start = chunk_end
+
+
+def log_year(data):
+    """
+    Year of the first line of a mapped log, from the dd.mm.yy date of the first ZONE_INFO or COMBATANT_INFO line
+    near its start, default_year if there's none.
+    """
+    match = record_date_pattern.search(data, 0, min(len(data), year_search_size))
+    if match is None:
+        return default_year
+    first = re.match(rb"\s*(\d{1,2})/\d{1,2} ", data[:16])
+    line_month, year = (int(group) for group in match.groups())
+    year = 2000 + year if year < 100 else year
+    if first is None:
+        return year
+    # the log started in the year before if it went past new year's eve on the way to the dated line
+    return year - 1 if int(first.group(1)) > line_month else year
+
+
+class TimestampDecoder:
+    """
+    Turns the M/D HH:MM:SS.mmm timestamps at the start of log lines into integer milliseconds, for measuring the
+    time between lines.  Timestamps have no year, so decoding starts in year, log_year of the log when decoding it
+    from the start.  The year only goes up by one when the month is lower than the month of the line before (or
+    than month), so a raid going past new year's eve doesn't go back in time.  Timestamps must be decoded in log
+    order for that.  Lines come many to a second, the milliseconds of the last second are remembered and only the
+    milliseconds of the line are parsed for the rest of its lines.
+    """
+
+    def __init__(self, year=default_year, month=None):
+        self.year = year
+        self.month = month
+        self.second_text = None
+        self.second_ms = None
+
+    def decode(self, line):
+        """Milliseconds at the timestamp starting line, None if it doesn't start with one"""
+        dot = line.find(".", 0, 20)
+        if dot < 0:
+            return None
+        milliseconds = line[dot + 1:dot + 4]
+        if len(milliseconds) != 3 or not milliseconds.isdigit():
+            return None
+        second_text = line[:dot]
+        if second_text != self.second_text:
+            second_ms = self.decode_second(second_text)
+            if second_ms is None:
+                return None
+            self.second_text = second_text
+            self.second_ms = second_ms
+        return self.second_ms + int(milliseconds)
+
+    def decode_second(self, second_text):
+        parts = second_text.split()
+        if len(parts) != 2:
+            return None
+        date, time = parts
+        if not date.replace("/", "").isdigit() or not time.replace(":", "").isdigit():
+            return None
+        try:
+            month, day = map(int, date.split("/"))
+            hour, minute, second = map(int, time.split(":"))
+        except ValueError:
+            return None
+        if hour > 23 or minute > 59 or second > 59:
+            return None
+        year = self.year
+        if self.month is not None and month < self.month:
+            year += 1
+        try:
+            days = datetime.date(year, month, day).toordinal()
+        except ValueError:
+            return None
+        self.year = year
+        self.month = month
+        return ((days * 24 + hour) * 60 + minute) * 60000 + second * 1000
@@ -0,0 +1,365 @@
+"""
+Byte offset index of the segments of a combat log, so one boss or one evening can be analyzed or formatted without
+reading the rest of the log.
+
+A new segment starts
+- at a ZONE_INFO line of another zone than the current one, AdvancedLogger writes one on every zone change,
+- at a boss yell or emote (CHAT_MSG_MONSTER_YELL, CHAT_MSG_RAID_BOSS_EMOTE) or an AGGRO line coming after
+  combat_gap seconds without any fighting, which is a new pull,
+- at a yell or emote of another boss than the one of the current segment.
+Segments are named after the boss that yelled in them, or else the first mob that aggroed.  Regular and raw logs
+both have these lines.
+
+The index is kept next to the log as <log>.segments.json, keyed by log_input.file_key so it's made again whenever
+the log changes or grows.  Making it takes one pass over the log, a few seconds for 2 GB, after that finding a
+segment or a time range in the log takes milliseconds.
+
+Usage: python log_segments.py LOGFILE, lists the segments of the log
+"""
+
+import argparse
+import json
+import os
+import re
+
+import log_input
+
+# bump when the rules or the fields of segments change, older indexes are made again
+INDEX_VERSION = 2
+# seconds without fighting before an AGGRO line or a yell starts a new segment
+combat_gap = 20
+# how far back before an AGGRO line or a yell the last fighting is looked for, less fighting than this is a gap
+combat_lookback = 64 * 1024
+
+# the lines segments start at, the group that matched tells which kind it is
+boundary_pattern = re.compile(rb"  (?:ZONE_INFO: [^&\r\n]*&([^&\r\n]*)&|AGGRO: ([^(\r\n]+)\(|"
+                              rb"CHAT_MSG: CHAT_MSG_(?:MONSTER_YELL|RAID_BOSS_EMOTE)&([^&\r\n]*)&)")
+# lines of fighting, in regular and raw logs
+combat_pattern = re.compile(rb" (?:hits|crits|misses) | suffers [0-9]|  You (?:hit|crit|miss) ")
+# --since and --until, [M/D ]HH:MM[:SS]
+time_pattern = re.compile(r"(?:(\d{1,2})/(\d{1,2}) +)?(\d{1,2}):(\d{2})(?::(\d{2}))?")
+
+
+class Segment:
+    """
+    One part of the log: the byte offsets start-end, the lines start_line-end_line counted from 0, the milliseconds
+    of the first and the last line from log_input.TimestampDecoder (None without timestamps) and their timestamp
+    text.  zone is the last ZONE_INFO zone, name the boss or first mob, None before the first pull.  year and month
+    are what a TimestampDecoder decoding lines of the segment has to start from.
+    """
+
+    __slots__ = ("start", "end", "start_line", "end_line", "start_time", "end_time", "start_text", "end_text",
+                 "zone", "name", "boss", "year", "month")
+
+    def __init__(self, start, start_line, zone, year, month):
+        self.start = start
+        self.end = start
+        self.start_line = start_line
+        self.end_line = start_line
+        self.start_time = None
+        self.end_time = None
+        self.start_text = ""
+        self.end_text = ""
+        self.zone = zone
+        self.name = None
+        self.boss = False
+        self.year = year
+        self.month = month
+
+    @property
+    def title(self):
+        if self.name is None:
+            return f"{self.zone or 'Start of log'} (no pull)"
+        return f"{self.name} (boss)" if self.boss else self.name
+
+    def to_dict(self):
+        return {field: getattr(self, field) for field in self.__slots__}
+
+    @classmethod
+    def from_dict(cls, values):
+        segment = cls(values["start"], values["start_line"], values["zone"], values["year"], values["month"])
+        for field in cls.__slots__:
+            setattr(segment, field, values[field])
+        return segment
+
+
+def index_path(filename):
+    return os.path.splitext(filename)[0] + ".segments.json"
+
+
+def index_key(filename):
+    """What an index of filename has to have been made from, log_input.file_key and the rules it was made with"""
+    return dict(log_input.file_key(filename), version=INDEX_VERSION, combat_gap=combat_gap)
+
+
+def line_timestamp(data, line_start, decoder):
+    """(milliseconds, timestamp text) of the line starting at line_start, (None, "") without a timestamp"""
+    text = data[line_start:line_start + 32].decode('latin-1')
+    time = decoder.decode(text)
+    if time is None:
+        return None, ""
+    return time, text[:text.find(".") + 4]
+
+
+def last_combat_line(data, start, end):
+    """Start of the last line of fighting within start-end, only looking combat_lookback bytes back, None if none"""
+    window_end = end
+    while window_end > start and end - window_end < combat_lookback:
+        window_start = max(start, window_end - 4096, end - combat_lookback)
+        match = None
+        for match in combat_pattern.finditer(data, window_start, window_end):
+            pass
+        if match is not None:
+            return log_input.line_bounds(data, match.start(), start)[0]
+        window_end = window_start
+    return None
+
+
+def build_segments(data):
+    """Split a memory mapped log into Segments, in order and covering all of it"""
+    decoder = log_input.TimestampDecoder(log_input.log_year(data))
+    segments = []
+    current = Segment(0, 0, None, decoder.year, decoder.month)
+    counted = 0  # line breaks before counted are in lines
+    lines = 0
+    last_activity = None  # milliseconds of the last boundary line or fighting
+    previous_end = 0  # end of the last boundary line
+    if len(data):
+        current.start_time, current.start_text = line_timestamp(data, 0, decoder)
+        current.year, current.month = decoder.year, decoder.month
+
+    def close(segment, end, end_line):
+        segment.end = end
+        segment.end_line = end_line
+        if end > segment.start:
+            # decoded after the line starting the next segment, so with a decoder of its own
+            last_line = log_input.last_line_start(data, segment.start, end)
+            segment.end_time, segment.end_text = line_timestamp(data, last_line, log_input.TimestampDecoder(segment.year, segment.month))
+            segments.append(segment)
+
+    for match in boundary_pattern.finditer(data):
+        line_start, _, line_end = log_input.line_bounds(data, match.start())
+        if line_start < previous_end:
+            continue
+        # fighting since the last boundary line counts as activity, decoded before it to keep the log order
+        combat_start = last_combat_line(data, previous_end, line_start)
+        if combat_start is not None:
+            combat_time = line_timestamp(data, combat_start, decoder)[0]
+            if combat_time is not None:
+                last_activity = combat_time
+        year, month = decoder.year, decoder.month
+        time, text = line_timestamp(data, line_start, decoder)
+        zone, mob, speaker = (None if group is None else group.decode('utf-8', 'replace').strip() for group in match.groups())
+
+        if zone is not None:
+            split = zone != current.zone
+        elif time is None:
+            split = False
+        elif last_activity is None or time - last_activity >= combat_gap * 1000:
+            split = True
+        else:
+            # another boss talking is another fight
+            split = speaker is not None and current.boss and speaker != current.name
+
+        if split and line_start > current.start:
+            lines += log_input.count_line_breaks(data, counted, line_start)
+            counted = line_start
+            close(current, line_start, lines)
+            current = Segment(line_start, lines, current.zone, year, month)
+        if current.start == line_start:
+            current.start_time, current.start_text = time, text
+            current.year, current.month = year, month
+        if zone is not None:
+            current.zone = zone
+        elif speaker is not None and not current.boss:
+            current.name = speaker
+            current.boss = True
+        elif mob is not None and current.name is None:
+            current.name = mob
+        if time is not None:
+            last_activity = time if last_activity is None else max(last_activity, time)
+        previous_end = line_end
+
+    lines += log_input.count_line_breaks(data, counted, len(data))
+    # a last line without a line break
+    if len(data) and data[len(data) - 1:] not in (b"\n", b"\r"):
+        lines += 1
+    close(current, len(data), lines)
+    return segments
+
+
+def save_index(path, key, segments):
+    temp_filename = path + ".tmp"
+    with open(temp_filename, 'w', encoding='utf-8') as file:
+        json.dump({"key": key, "segments": [segment.to_dict() for segment in segments]}, file)
+    os.replace(temp_filename, path)
+
+
+def load_index(path, key):
+    """Segments from the index at path if it was made from a log with key, else None"""
+    try:
+        with open(path, 'r', encoding='utf-8') as file:
+            index = json.load(file)
+        if index["key"] != key:
+            return None
+        return [Segment.from_dict(values) for values in index["segments"]]
+    except (IOError, OSError, ValueError, KeyError, TypeError):
+        # missing or unreadable index
+        return None
+
+
+def load_segments(filename):
+    """Segments of a log from its index, making the index first if there isn't an up to date one"""
+    path = index_path(filename)
+    key = index_key(filename)
+    segments = load_index(path, key)
+    if segments is not None:
+        return segments
+    with log_input.map_log(filename) as data:
+        segments = build_segments(data)
+    try:
+        save_index(path, key, segments)
+    except (IOError, OSError) as e:
+        print(f"Warning: Couldn't write the segment index {path}: {e}")
+    return segments
+
+
+def parse_time(value):
+    """(month, day, hour, minute, second) from --since or --until, [M/D ]HH:MM[:SS], month and day may be None"""
+    match = time_pattern.fullmatch(value.strip())
+    if match is None:
+        raise argparse.ArgumentTypeError(f"expected [M/D ]HH:MM[:SS], got {value}")
+    month, day, hour, minute, second = (None if part is None else int(part) for part in match.groups())
+    if hour > 23 or minute > 59 or (second or 0) > 59:
+        raise argparse.ArgumentTypeError(f"invalid time {value}")
+    return month, day, hour, minute, second or 0
+
+
+def time_ms(segments, when):
+    """
+    Milliseconds of a parse_time time the same way the segments' times are.  Without a date it's the first day of
+    the log at that time, or the day after if that's before the log starts.  None if the log has no timestamps.
+    """
+    first = next((segment for segment in segments if segment.start_time is not None), None)
+    if first is None:
+        return None
+    month, day, hour, minute, second = when
+    first_month, first_day = map(int, first.start_text.split()[0].split("/"))
+    decoder = log_input.TimestampDecoder(first.year, first_month)
+    if month is None:
+        time = decoder.decode(f"{first_month}/{first_day} {hour}:{minute:02d}:{second:02d}.000")
+        return time + 24 * 3600 * 1000 if time is not None and time < first.start_time else time
+    time = decoder.decode(f"{month}/{day} {hour}:{minute:02d}:{second:02d}.000")
+    if time is None:
+        raise ValueError(f"invalid date {month}/{day}")
+    return time
+
+
+def find_time(data, segment, time):
+    """Start of the first line of segment at or after time by bisecting on the line timestamps, segment.end if none"""
+    low, high = segment.start, segment.end
+    while low < high:
+        line_start, _, line_end = log_input.line_bounds(data, (low + high) // 2, low, segment.end)
+        # lines without a timestamp go with the lines after them
+        decoder = log_input.TimestampDecoder(segment.year, segment.month)
+        line_time = line_timestamp(data, line_start, decoder)[0]
+        if line_time is not None and line_time >= time:
+            high = line_start
+        else:
+            low = line_end
+    return low
+
+
+def select_segments(segments, spec):
+    """
+    Segments picked by --segment: comma separated indexes or index ranges like 3-5, or else the segments named
+    spec, or else the segments in the zone spec, ignoring case.
+    """
+    try:
+        indexes = set()
+        for part in spec.split(","):
+            first, _, last = part.strip().partition("-")
+            indexes.update(range(int(first), int(last or first) + 1))
+    except ValueError:
+        indexes = None
+    if not segments:
+        raise ValueError("the log is empty")
+    if indexes is not None:
+        unknown = sorted(index for index in indexes if index >= len(segments))
+        if unknown:
+            raise ValueError(f"the log only has segments 0-{len(segments) - 1}, not {unknown[0]}")
+        return [segment for number, segment in enumerate(segments) if number in indexes]
+    name = spec.strip().lower()
+    selected = [segment for segment in segments if segment.name is not None and segment.name.lower() == name]
+    if not selected:
+        selected = [segment for segment in segments if segment.zone is not None and segment.zone.lower() == name]
+    if not selected:
+        raise ValueError(f"no segment or zone is called {spec.strip()}, see python log_segments.py LOGFILE")
+    return selected
+
+
+def select_ranges(filename, segment=None, since=None, until=None, segments=None):
+    """
+    The parts of the log picked by --segment, --since and up to before --until (see select_segments and parse_time) as
+    (start, end, start line, end line) in log order, adjacent parts merged.  Raises ValueError if they pick nothing
+    or can't be used with this log.  segments are those of load_segments, loaded if None.
+    """
+    if segments is None:
+        segments = load_segments(filename)
+    selected = segments if segment is None else select_segments(segments, segment)
+    since_ms = None if since is None else time_ms(segments, since)
+    until_ms = None if until is None else time_ms(segments, until)
+    if (since is not None or until is not None) and since_ms is None and until_ms is None:
+        raise ValueError("the log has no timestamps to use --since or --until with")
+
+    ranges = []
+    with log_input.map_log(filename) as data:
+        for part in selected:
+            start, end, start_line, end_line = part.start, part.end, part.start_line, part.end_line
+            if part.start_time is not None:
+                if until_ms is not None and part.start_time >= until_ms:
+                    continue
+                if since_ms is not None and part.end_time is not None and part.end_time < since_ms:
+                    continue
+                if since_ms is not None and part.start_time < since_ms:
+                    start = find_time(data, part, since_ms)
+                    start_line += log_input.count_line_breaks(data, part.start, start)
+                if until_ms is not None and (part.end_time is None or part.end_time >= until_ms):
+                    end = find_time(data, part, until_ms)
+                    end_line -= log_input.count_line_breaks(data, end, part.end)
+            if start >= end:
+                continue
+            if ranges and ranges[-1][1] == start:
+                ranges[-1] = (ranges[-1][0], end, ranges[-1][2], end_line)
+            else:
+                ranges.append((start, end, start_line, end_line))
+    if not ranges:
+        raise ValueError("no lines of the log are in the selected segments and times")
+    return ranges
+
+
+def print_segments(segments):
+    print(f"{'#':>4}  {'Start':<16} {'Length':>8} {'MB':>8}  {'Zone':<24} Segment")
+    for number, segment in enumerate(segments):
+        length = ""
+        if segment.start_time is not None and segment.end_time is not None:
+            minutes, seconds = divmod((segment.end_time - segment.start_time) // 1000, 60)
+            length = f"{minutes}:{seconds:02d}"
+        print(f"{number:>4}  {segment.start_text.split('.')[0]:<16} {length:>8} {(segment.end - segment.start) / 1024 / 1024:>8.2f}  "
+              f"{(segment.zone or '')[:24]:<24} {segment.title}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="List the segments of a combat log, making its segment index.")
+    parser.add_argument("filename", metavar="logfile", help="the regular or raw combat log")
+    args = parser.parse_args()
+    try:
+        segments = load_segments(args.filename)
+    except (IOError, OSError) as e:
+        print(f"Error reading file: {e}")
+        return
+    print_segments(segments)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,403 @@
+#!/usr/bin/env python3
+"""
+Local analysis service keeping parsed logs in memory between requests.
+
+Officers ask for the sunder table, one boss or the formatted upload of the same night's log many times over, and
+running the scripts again reads and parses the log again each time.  The service parses a log on the first request
+for it and keeps what it parsed (the raw_events casts and misses, the segment index, the pets of the formatter) and
+the finished results in an LRU cache bounded by their estimated size in bytes, so asking again is answered from
+memory.  Everything is keyed by log_input.file_key, a log that changed or grew is parsed again.  Formatted logs are
+written to a temp file while they're formatted, only those that fit in the cache are read back into memory and kept,
+larger ones are sent from the temp file.
+
+It only listens on 127.0.0.1.  Logs are paths relative to --log-dir, logs outside of it are refused.
+
+Endpoints, all GET with query parameters:
+    /sunders?log=LOG[&tanks=Maintank,Offtank][&debuffs=all][&format=json]
+        the wasted_sunders_raw.py table as text, or the counts as json like sunder_leaderboard.py --json
+    /segments?log=LOG
+        the segments of the log as json, like python log_segments.py LOG
+    /format?log=LOG&player=NAME[&zip=1]
+        the log formatted for upload as text, or zipped
+    /stats
+        what's in the cache as json
+/sunders and /format take segment=, since= and until= like the --segment, --since and --until of the scripts.
+
+Usage: python log_service.py [--port 8765] [--log-dir DIR] [--cache-size MB] [--jobs N]
+"""
+
+import argparse
+import io
+import json
+import os
+import shutil
+import sys
+import tempfile
+import threading
+import time
+import urllib.parse
+import zipfile
+from collections import OrderedDict
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import log_input
+import log_segments
+from format_log_for_upload import PetState, LineFormatter, collect_pets, validate_player_name, write_formatted
+from sunder_leaderboard import write_json
+from wasted_sunders_raw import DEBUFFS, DebuffResults, DebuffTracker, display_results, parse_debuffs, track_events, track_log
+
+try:
+    import raw_events
+except ImportError:  # the service works without numpy, parsing the log for every new sunder query
+    raw_events = None
+
+default_port = 8765
+# MB of parsed logs and results kept in memory
+default_cache_size = 1024
+
+# bytes of a streamed response written at a time
+stream_block_size = 1024 * 1024
+
+
+class RequestError(Exception):
+    """A request that can't be answered, with the HTTP status to answer it with"""
+
+    def __init__(self, status, message):
+        super().__init__(message)
+        self.status = status
+
+
+class StreamedFile:
+    """A response too large to keep in memory, sent from a temp file that's deleted once it's sent"""
+
+    def __init__(self, filename):
+        self.filename = filename
+
+    def __len__(self):
+        return os.path.getsize(self.filename)
+
+
+class SizedCache:
+    """
+    LRU cache bounded by the estimated size of its values in bytes, shared by the request threads.  A value that
+    isn't cached is loaded once even when several requests ask for it at the same time, values larger than the
+    whole cache are returned without being kept.
+    """
+
+    def __init__(self, max_bytes):
+        self.max_bytes = max_bytes
+        self.entries = OrderedDict()  # (value, size) by key
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.lock = threading.Lock()
+        self.loading = {}  # lock of each key being loaded
+
+    def lookup(self, key):
+        """(True, value) if key is cached, else (False, None), the caller holds self.lock"""
+        if key not in self.entries:
+            return False, None
+        self.hits += 1
+        self.entries.move_to_end(key)
+        return True, self.entries[key][0]
+
+    def get_or_load(self, key, load):
+        """The value of key, from load() returning (value, size in bytes) if it isn't cached"""
+        with self.lock:
+            found, value = self.lookup(key)
+            if found:
+                return value
+            key_lock = self.loading.setdefault(key, threading.Lock())
+        with key_lock:
+            try:
+                with self.lock:
+                    # loaded by another request while this one waited
+                    found, value = self.lookup(key)
+                    if found:
+                        return value
+                    self.misses += 1
+                value, size = load()
+                self.put(key, value, size)
+            finally:
+                with self.lock:
+                    self.loading.pop(key, None)
+        return value
+
+    def put(self, key, value, size):
+        if size > self.max_bytes:
+            return
+        with self.lock:
+            if key in self.entries:
+                self.size -= self.entries.pop(key)[1]
+            self.entries[key] = (value, size)
+            self.size += size
+            while self.size > self.max_bytes:
+                self.size -= self.entries.popitem(last=False)[1][1]
+                self.evictions += 1
+
+    def discard_log(self, path, key):
+        """Drop what's cached for other versions of the log at path than the one with key"""
+        with self.lock:
+            for stale in [cached for cached in self.entries if cached[1] == path and cached[2] != key]:
+                self.size -= self.entries.pop(stale)[1]
+
+    def stats(self):
+        with self.lock:
+            lookups = self.hits + self.misses
+            return {"hits": self.hits, "misses": self.misses, "evictions": self.evictions, "bytes": self.size,
+                    "max_bytes": self.max_bytes, "hit_rate": self.hits / lookups if lookups else 0.0,
+                    "entries": [{"kind": key[0], "log": key[1], "bytes": size} for key, (_, size) in self.entries.items()]}
+
+
+def json_size(value):
+    """Rough size in memory of json-like value, about the size of its json text"""
+    return len(json.dumps(value))
+
+
+def events_size(events):
+    return (sum(getattr(events, column).nbytes for column in raw_events.COLUMNS) +
+            sum(sys.getsizeof(value) for table in raw_events.STRING_TABLES for value in getattr(events, table)))
+
+
+def query_selection(query):
+    """(segment, since, until) of a request, see log_segments.select_ranges, None if it's for the whole log"""
+    segment = query.get("segment") or None
+    since = log_segments.parse_time(query["since"]) if query.get("since") else None
+    until = log_segments.parse_time(query["until"]) if query.get("until") else None
+    if segment is None and since is None and until is None:
+        return None
+    return segment, since, until
+
+
+class LogService:
+    """The endpoints of the service, answering from cache where they can"""
+
+    def __init__(self, log_dir, cache_bytes, jobs=1):
+        self.log_dir = os.path.realpath(log_dir)
+        self.cache = SizedCache(cache_bytes)
+        self.jobs = jobs
+        self.keys = {}  # file key each log had when it was last asked for
+        self.endpoints = {"/sunders": self.sunders, "/segments": self.segments, "/format": self.format, "/stats": self.stats}
+
+    def log(self, query):
+        """(path, file key) of the log of a request"""
+        name = query.get("log")
+        if not name:
+            raise RequestError(400, "missing log=")
+        path = os.path.realpath(os.path.join(self.log_dir, name))
+        if os.path.commonpath([path, self.log_dir]) != self.log_dir:
+            raise RequestError(403, f"{name} is outside of {self.log_dir}")
+        if not os.path.isfile(path):
+            raise RequestError(404, f"no log {name}")
+        key = tuple(sorted(log_input.file_key(path).items()))
+        if self.keys.get(path) != key:
+            # the log changed or grew, what was parsed from it before is of no use anymore
+            self.keys[path] = key
+            self.cache.discard_log(path, key)
+        return path, key
+
+    def load_segments(self, path, key):
+        def load():
+            segments = log_segments.load_segments(path)
+            return segments, json_size([segment.to_dict() for segment in segments])
+        return self.cache.get_or_load(("segments", path, key), load)
+
+    def ranges(self, path, key, selection):
+        """log_segments.select_ranges of the selection, None for the whole log"""
+        if selection is None:
+            return None
+
+        def load():
+            ranges = log_segments.select_ranges(path, *selection, segments=self.load_segments(path, key))
+            return ranges, json_size(ranges)
+        return self.cache.get_or_load(("ranges", path, key, selection), load)
+
+    def load_events(self, path, key):
+        def load():
+            events = raw_events.load_raw_events(path)[0]
+            return events, events_size(events)
+        return self.cache.get_or_load(("events", path, key), load)
+
+    def debuff_results(self, path, key, names, selection):
+        """DebuffResults by debuff name, the same counts as wasted_sunders_raw.analyze_debuffs"""
+        def load():
+            ranges = self.ranges(path, key, selection)
+            trackers = {name: DebuffTracker(name, DEBUFFS[name]) for name in names}
+            if raw_events is not None and all(tracker.misses <= set(raw_events.MISS_OUTCOMES) for tracker in trackers.values()):
+                track_events(self.load_events(path, key), trackers, ranges)
+            else:
+                track_log(path, trackers, ranges)
+            results = {name: DebuffResults.from_tracker(tracker) for name, tracker in trackers.items()}
+            return results, json_size({name: values.to_dict() for name, values in results.items()})
+        return self.cache.get_or_load(("sunders", path, key, tuple(names), selection), load)
+
+    def load_pets(self, path, key, end):
+        """PetState of the log up to end, all of it if None"""
+        def load():
+            pet_state = PetState()
+            collect_pets(path, pet_state, 0, end)
+            return pet_state, json_size(pet_state.to_dict())
+        return self.cache.get_or_load(("pets", path, key, end), load)
+
+    def write_formatted_file(self, path, key, player_name, selection, output_file):
+        """Write the log, or the selected parts of it, formatted for upload like format_log_for_upload.py"""
+        ranges = self.ranges(path, key, selection)
+        # pets are collected up to the end of the last part, like replace_instances_segments
+        pet_state = self.load_pets(path, key, None if ranges is None else ranges[-1][1])
+        formatter = LineFormatter(player_name, pet_state)
+        for start, end, _, _ in ranges or [(0, None, 0, None)]:
+            write_formatted(path, formatter, output_file, self.jobs, start, end)
+
+    def formatted(self, path, key, player_name, selection, zipped=False):
+        """
+        The formatted log, zipped like format_log_for_upload.py --stream-zip if zipped, as bytes if it fits in the
+        cache, else as a StreamedFile.  It's written to a temp file as it's formatted, so a large log is never held
+        in memory.
+        """
+        def load():
+            with tempfile.NamedTemporaryFile(prefix=".log_service.", suffix=".zip" if zipped else ".txt",
+                                             delete=False) as temp_file:
+                temp_filename = temp_file.name
+            try:
+                if zipped:
+                    with zipfile.ZipFile(temp_filename, 'w', zipfile.ZIP_DEFLATED) as zipf:
+                        with zipf.open(os.path.basename(path), 'w', force_zip64=True) as entry, \
+                                io.TextIOWrapper(entry, encoding='utf-8') as output_file:
+                            self.write_formatted_file(path, key, player_name, selection, output_file)
+                else:
+                    with open(temp_filename, 'w', encoding='utf-8') as output_file:
+                        self.write_formatted_file(path, key, player_name, selection, output_file)
+                size = os.path.getsize(temp_filename)
+                if size > self.cache.max_bytes:
+                    # not cached, the request sends and deletes it
+                    return StreamedFile(temp_filename), size
+                with open(temp_filename, 'rb') as file:
+                    data = file.read()
+            except BaseException:
+                os.remove(temp_filename)
+                raise
+            os.remove(temp_filename)
+            return data, size
+        return self.cache.get_or_load(("zip" if zipped else "format", path, key, player_name, selection), load)
+
+    def sunders(self, query):
+        path, key = self.log(query)
+        names = parse_debuffs(query.get("debuffs") or "Sunder Armor")
+        tanks = [tank.strip() for tank in query.get("tanks", "").split(",") if tank.strip()]
+        results = self.debuff_results(path, key, names, query_selection(query))
+        output = io.StringIO()
+        if query.get("format") == "json":
+            write_json(results, output)
+            return "application/json", output.getvalue().encode('utf-8')
+        for name, debuff_results in results.items():
+            config = DEBUFFS[name]
+            if len(results) > 1:
+                print(f"\n=== {name} ===", file=output)
+            display_results(*debuff_results.results()[:4], tanks, *debuff_results.results()[4:],
+                            label=config["label"], plural=config["plural"], max_stacks=config["max_stacks"],
+                            refresh_window=config["refresh_window"], file=output)
+        return "text/plain; charset=utf-8", output.getvalue().encode('utf-8')
+
+    def segments(self, query):
+        path, key = self.log(query)
+        segments = [dict(segment.to_dict(), number=number, title=segment.title)
+                    for number, segment in enumerate(self.load_segments(path, key))]
+        return "application/json", json.dumps(segments, indent=2).encode('utf-8')
+
+    def format(self, query):
+        path, key = self.log(query)
+        player_name = query.get("player", "")
+        if not validate_player_name(player_name):
+            raise RequestError(400, "player= has to be a player name")
+        player_name = player_name.strip().capitalize()
+        selection = query_selection(query)
+        if query.get("zip") not in (None, "", "0"):
+            return "application/zip", self.formatted(path, key, player_name, selection, zipped=True)
+        return "text/plain; charset=utf-8", self.formatted(path, key, player_name, selection)
+
+    def stats(self, query):
+        return "application/json", json.dumps(self.cache.stats(), indent=2).encode('utf-8')
+
+
+class ServiceHandler(BaseHTTPRequestHandler):
+    server_version = "AdvancedLoggerService"
+
+    def do_GET(self):
+        started = time.perf_counter()
+        url = urllib.parse.urlsplit(self.path)
+        query = {name: values[-1] for name, values in urllib.parse.parse_qs(url.query).items()}
+        endpoint = self.server.service.endpoints.get(url.path)
+        status = 200
+        try:
+            if endpoint is None:
+                raise RequestError(404, f"unknown endpoint {url.path}")
+            content_type, body = endpoint(query)
+        except RequestError as e:
+            status, message = e.status, str(e)
+        except FileNotFoundError as e:
+            status, message = 404, f"Error reading file: {e}"
+        except (IOError, OSError, UnicodeDecodeError) as e:
+            status, message = 500, f"Error reading file: {e}"
+        except (ValueError, argparse.ArgumentTypeError) as e:
+            # bad segment, since, until or debuffs
+            status, message = 400, str(e)
+        except Exception as e:
+            status, message = 500, f"Error: {e}"
+        if status != 200:
+            content_type, body = "text/plain; charset=utf-8", f"Error: {message}\n".encode('utf-8')
+
+        size = len(body)
+        try:
+            self.send_response(status)
+            self.send_header("Content-Type", content_type)
+            self.send_header("Content-Length", str(size))
+            self.end_headers()
+            if isinstance(body, StreamedFile):
+                with open(body.filename, 'rb') as file:
+                    shutil.copyfileobj(file, self.wfile, stream_block_size)
+            else:
+                self.wfile.write(body)
+        except (BrokenPipeError, ConnectionResetError):
+            pass
+        finally:
+            if isinstance(body, StreamedFile):
+                os.remove(body.filename)
+        print(f"{self.command} {self.path} {status} {size} bytes {(time.perf_counter() - started) * 1000:.0f} ms")
+
+    def log_message(self, format, *args):
+        # requests are printed by do_GET with their time
+        pass
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Serve sunder tables, segments and formatted logs from memory on "
+                                                 "localhost, parsing each log once.")
+    parser.add_argument("--port", type=int, default=default_port, help=f"port to listen on (default {default_port})")
+    parser.add_argument("--log-dir", default=".", help="directory the logs are in, requests name logs relative to it "
+                                                       "(default the current directory)")
+    parser.add_argument("--cache-size", type=int, default=default_cache_size,
+                        help=f"MB of parsed logs and results kept in memory (default {default_cache_size})")
+    parser.add_argument("-j", "--jobs", type=int, default=1, help="worker processes formatting a log (default 1)")
+    args = parser.parse_args()
+
+    service = LogService(args.log_dir, args.cache_size * 1024 * 1024, max(1, args.jobs))
+    try:
+        server = ThreadingHTTPServer(("127.0.0.1", args.port), ServiceHandler)
+    except OSError as e:
+        print(f"Error starting the service: {e}")
+        sys.exit(1)
+    server.daemon_threads = True
+    server.service = service
+    print(f"Serving logs in {service.log_dir} on http://127.0.0.1:{server.server_address[1]}/ "
+          f"with {args.cache_size} MB of cache, Ctrl+C to stop")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+if __name__ == "__main__":
+    main()
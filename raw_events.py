@@ -0,0 +1,204 @@
+"""
+Parse once cache of the raw combat log for analyses that only need spell casts and misses, like wasted_sunders_raw.py.
+
+The casts and misses of every spell are parsed out of the raw log into numpy columns, with the GUIDs, names and spell
+names interned into string tables, and kept next to the log as <log>.events.npz.  The cache is keyed by the log's
+size, modification time and a hash of its first and last megabyte, so it's rebuilt whenever the log changes or grows,
+and loading it takes milliseconds where parsing the log takes seconds.
+
+Expected log format, uses the RAW log:
+8/22 20:01:54.030  0x0000000000440A95(Qcb) casts Sunder Armor(11597)(Rank 5) on 0xF13000F1ED276B19(Greater Gloomwing).
+8/22 20:01:54.210  0x0000000000440A95's Sunder Armor was dodged by 0xF13000F1ED276B19.
+"""
+
+import json
+import os
+import re
+import tempfile
+import zipfile
+
+import numpy
+
+import log_input
+
+EVENT_CAST = 0
+EVENT_MISS = 1
+# time of events without a timestamp
+NO_TIME = -1
+# the ways a spell can miss that are kept, analyses can only look for these
+MISS_OUTCOMES = ("was parried by", "was dodged by", "missed", "was resisted by", "was blocked by", "was evaded by")
+# bump when the columns or patterns change, older caches are rebuilt
+CACHE_VERSION = 2
+
+COLUMNS = ("line", "time", "kind", "actor", "actor_name", "spell", "spell_id", "target", "target_name", "outcome")
+COLUMN_TYPES = {
+    "line": numpy.int64,  # line number of the event, from 0
+    "time": numpy.int64,  # milliseconds from log_input.TimestampDecoder or NO_TIME
+    "kind": numpy.uint8,  # EVENT_CAST or EVENT_MISS
+    "actor": numpy.int32,  # index into guids
+    "actor_name": numpy.int32,  # index into names, -1 for misses
+    "spell": numpy.int32,  # index into spells
+    "spell_id": numpy.int32,  # -1 for misses or spell ids that aren't numbers
+    "target": numpy.int32,  # index into guids
+    "target_name": numpy.int32,  # index into names, -1 for misses
+    "outcome": numpy.int8,  # index into MISS_OUTCOMES, -1 for casts
+}
+STRING_TABLES = ("guids", "names", "spells")
+
+# Casts and misses of any spell, matched over lowercased chunks of the log.
+# Note: Names may contain raid marks like (Diamond) inside the parentheses
+# e.g., 0x123(Khoni(Diamond)) - we use [^()]+ to match base name, then optionally (\([^)]+\))? for the mark
+# Spell names may have one part in parentheses like Faerie Fire (Feral)
+SPACE = rb"[ \t\x0b\x0c]+"
+NAME = rb"([^()\r\n]+(?:\([^)\r\n]+\))?)"
+EVENT_PATTERN = re.compile(
+    rb"(0x[0-9a-f]+)(?:"
+    rb"\(" + NAME + rb"\)" + SPACE + rb"casts" + SPACE + rb"([^()\r\n]+?(?: \([^()\r\n]+\))?)\(([^)\r\n]+)\)\([^)\r\n]+\)" +
+    SPACE + rb"on" + SPACE + rb"(0x[0-9a-f]+)\(" + NAME + rb"\)"
+    rb"|'s ([^\r\n]+?) (" + rb"|".join(re.escape(outcome.encode('ascii')) for outcome in MISS_OUTCOMES) + rb") (0x[0-9a-f]+))"
+)
+
+
+class RawEvents:
+    """
+    Casts and misses of a raw log in log order, the columns are numpy arrays of COLUMN_TYPES and guids, names and
+    spells are lists of str.  line_count is the number of lines in the log.
+    """
+
+    def __init__(self, columns, tables, line_count):
+        for column in COLUMNS:
+            setattr(self, column, columns[column])
+        for table in STRING_TABLES:
+            setattr(self, table, tables[table])
+        self.line_count = line_count
+
+    def __len__(self):
+        return len(self.line)
+
+
+def cache_path(filename):
+    return os.path.splitext(filename)[0] + ".events.npz"
+
+
+def cache_key(filename):
+    """What a cache of filename has to have been made from, log_input.file_key and how it was parsed"""
+    return dict(log_input.file_key(filename), version=CACHE_VERSION, miss_outcomes=list(MISS_OUTCOMES))
+
+
+def parse_raw_events(filename):
+    """Parse the casts and misses of a raw log, only the first cast and the first miss of a line are kept"""
+    columns = {column: [] for column in COLUMNS}
+    tables = {table: [] for table in STRING_TABLES}
+    indexes = {table: {} for table in STRING_TABLES}
+
+    def intern(table, value):
+        value = value.decode('utf-8')
+        index = indexes[table].get(value)
+        if index is None:
+            index = indexes[table][value] = len(tables[table])
+            tables[table].append(value)
+        return index
+
+    def add(line, time, kind, actor, actor_name, spell, spell_id, target, target_name, outcome):
+        for column, value in zip(COLUMNS, (line, time, kind, actor, actor_name, spell, spell_id, target, target_name, outcome)):
+            columns[column].append(value)
+
+    with log_input.map_log(filename) as data:
+        timestamps = log_input.TimestampDecoder(log_input.log_year(data))
+        lines = 0  # line breaks before chunk_start
+        chunk_start = 0
+        while chunk_start < len(data):
+            chunk_end = log_input.line_bounds(data, min(chunk_start + log_input.ignorecase_chunk_size, len(data)) - 1, chunk_start)[2]
+            chunk = data[chunk_start:chunk_end]
+            counted = 0  # line breaks of chunk before counted are in lines
+            line_end = 0  # end of the line with the last event
+            for match in EVENT_PATTERN.finditer(chunk.lower()):
+                if match.start() >= line_end:
+                    line_start, _, line_end = log_input.line_bounds(chunk, match.start())
+                    lines += log_input.count_line_breaks(chunk, counted, line_start)
+                    counted = line_start
+                    time = timestamps.decode(chunk[line_start:line_start + 32].decode('latin-1'))
+                    time = NO_TIME if time is None else time
+                    line_has_cast = line_has_miss = False
+                # Only the first cast and the first miss of a line count
+                if match.group(3) is not None and not line_has_cast:
+                    line_has_cast = True
+                    spell_id = chunk[match.start(4):match.end(4)]
+                    add(lines, time, EVENT_CAST,
+                        intern("guids", chunk[match.start(1):match.end(1)]),
+                        intern("names", chunk[match.start(2):match.end(2)]),
+                        intern("spells", chunk[match.start(3):match.end(3)]),
+                        int(spell_id) if spell_id.isdigit() else -1,
+                        intern("guids", chunk[match.start(5):match.end(5)]),
+                        intern("names", chunk[match.start(6):match.end(6)]),
+                        -1)
+                elif match.group(7) is not None and not line_has_miss:
+                    line_has_miss = True
+                    add(lines, time, EVENT_MISS,
+                        intern("guids", chunk[match.start(1):match.end(1)]),
+                        -1,
+                        intern("spells", chunk[match.start(7):match.end(7)]),
+                        -1,
+                        intern("guids", chunk[match.start(9):match.end(9)]),
+                        -1,
+                        MISS_OUTCOMES.index(match.group(8).decode('ascii')))
+            lines += log_input.count_line_breaks(chunk, counted, len(chunk))
+            chunk_start = chunk_end
+        # a last line without a line break
+        if len(data) and data[len(data) - 1:] not in (b"\n", b"\r"):
+            lines += 1
+
+    return RawEvents({column: numpy.array(columns[column], dtype=COLUMN_TYPES[column]) for column in COLUMNS},
+                     tables, lines)
+
+
+def save_raw_events(events, path, key):
+    """Write events to path as .npz along with the key of the log they're from"""
+    arrays = {column: getattr(events, column) for column in COLUMNS}
+    for table in STRING_TABLES:
+        arrays[table] = numpy.array(getattr(events, table), dtype=str)
+    arrays["key"] = numpy.array(json.dumps(dict(key, line_count=events.line_count)))
+    directory = os.path.dirname(os.path.abspath(path))
+    with tempfile.NamedTemporaryFile(dir=directory, prefix=".events.", suffix=".npz", delete=False) as file:
+        try:
+            numpy.savez(file, **arrays)
+        except BaseException:
+            file.close()
+            os.remove(file.name)
+            raise
+    os.replace(file.name, path)
+
+
+def load_cached_events(path, key):
+    """RawEvents from the cache at path if it was made from a log with key, else None"""
+    try:
+        with numpy.load(path, allow_pickle=False) as cache:
+            cached_key = json.loads(str(cache["key"]))
+            line_count = cached_key.pop("line_count")
+            if cached_key != key:
+                return None
+            return RawEvents({column: cache[column] for column in COLUMNS},
+                             {table: cache[table].tolist() for table in STRING_TABLES}, line_count)
+    except (OSError, ValueError, KeyError, EOFError, zipfile.BadZipFile):
+        # missing, unreadable or truncated cache
+        return None
+
+
+def load_raw_events(filename):
+    """
+    Casts and misses of a raw log from its cache, parsing the log and writing the cache if there isn't an up to date one.
+
+    Returns:
+        tuple: (RawEvents, True if they came from the cache)
+    """
+    path = cache_path(filename)
+    key = cache_key(filename)
+    events = load_cached_events(path, key)
+    if events is not None:
+        return events, True
+    events = parse_raw_events(filename)
+    try:
+        save_raw_events(events, path, key)
+    except OSError as e:
+        print(f"Warning: Couldn't write the event cache {path}: {e}")
+    return events, False
@@ -0,0 +1,257 @@
+#!/usr/bin/env python3
+"""
+Split a combat log holding many raids into one file per raid night and instance.
+
+The game keeps appending to the same WoWCombatLog.txt, so after a few weeks it holds every raid since it was last
+cleared.  This writes each raid out on its own so the pieces can be formatted, zipped and analyzed separately, and in
+parallel with format_log_for_upload.py --batch or --manifest.
+
+A new piece starts
+- at a ZONE_INFO line of another instance (name and instance id) than the one of the current piece, AdvancedLogger
+  writes one on every zone change and when the saved instances are updated (UPDATE_INSTANCE_INFO),
+- at a line coming night_gap hours or more after the line before it, which is the next raid night even in the
+  same instance.
+Lines outside of instances (forming up in a city, going to repair) stay with the piece they come in, so a piece is one
+instance on one night and everything around it.
+
+AdvancedLogger writes the COMBATANT_INFO of everyone it knows about when zoning into an instance, but only once per
+session otherwise.  Each piece gets the latest COMBATANT_INFO of the players seen earlier that night that it doesn't
+have itself at its start, so pets still get their owners when a piece is formatted on its own.
+
+Usage: python split_log.py WoWCombatLog.txt [--output-dir DIR] [--manifest pieces.csv --player NAME]
+"""
+
+import argparse
+import csv
+import os
+import re
+
+import log_input
+
+# hours without any line before a new raid night starts
+night_gap = 4
+# how often the log is sampled for night gaps, only the parts between samples further apart than night_gap are read
+gap_sample_size = 64 * 1024
+# how much of the log is copied to a piece at a time
+copy_chunk_size = 16 * 1024 * 1024
+
+# ZONE_INFO: 27.11.24 19:30:00&Molten Core&409 and COMBATANT_INFO: 27.11.24 19:30:00&Name&...
+record_pattern = re.compile(rb"  (?:ZONE_INFO: ([^&\r\n]*)&([^&\r\n]*)&([^&\r\n]*)|COMBATANT_INFO: [^&\r\n]*&([^&\r\n]*)&)")
+# characters that don't go in the file names of pieces
+unsafe_name_pattern = re.compile(r"[^A-Za-z0-9]+")
+
+
+class Piece:
+    """
+    The part start-end of the log for one instance and night.  carried are the COMBATANT_INFO lines of earlier
+    pieces written before it by player name, date is its first day as (year or None, month, day).
+    """
+
+    __slots__ = ("start", "end", "zone", "instance_id", "date", "carried", "filename")
+
+    def __init__(self, start, date, carried):
+        self.start = start
+        self.end = start
+        self.zone = None
+        self.instance_id = None
+        self.date = date
+        self.carried = carried
+        self.filename = None
+
+
+def night_breaks(data):
+    """
+    Starts of the lines that come night_gap hours or more after the line before them, in order.  The log is sampled
+    every gap_sample_size bytes and only the parts between samples at least night_gap apart are read line by line.
+    """
+    gap = night_gap * 3600 * 1000
+    decoder = log_input.TimestampDecoder(log_input.log_year(data))
+    breaks = []
+    previous = None  # (line start, milliseconds, year, month) of the last sample with a timestamp
+    if not len(data):
+        return breaks
+    # the last line is always sampled
+    last_line = log_input.last_line_start(data)
+    offset = 0
+    while True:
+        line_start, _, line_end = log_input.line_bounds(data, offset)
+        year, month = decoder.year, decoder.month
+        time = decoder.decode(data[line_start:line_start + 32].decode('latin-1'))
+        if time is not None:
+            if previous is not None and time - previous[1] >= gap:
+                breaks.extend(read_breaks(data, previous, line_end, gap))
+            previous = (line_start, time, year, month)
+        if line_start >= last_line:
+            return breaks
+        offset = min(max(line_end, offset + gap_sample_size), last_line)
+
+
+def read_breaks(data, sample, end, gap):
+    """night_breaks between a sample and end, reading every line"""
+    line_start, last_time, year, month = sample
+    decoder = log_input.TimestampDecoder(year, month)
+    decoder.decode(data[line_start:line_start + 32].decode('latin-1'))
+    breaks = []
+    for line_start, _, _ in log_input.matching_lines(data, log_input.newline_pattern, line_start, end):
+        time = decoder.decode(data[line_start:line_start + 32].decode('latin-1'))
+        if time is None:
+            continue
+        if time - last_time >= gap:
+            breaks.append(line_start)
+        last_time = time
+    return breaks
+
+
+def record_date(text):
+    """(year, month, day) of the dd.mm.yy date of ZONE_INFO and COMBATANT_INFO lines, None if it isn't one"""
+    parts = text.split()[0].split(".") if text.strip() else []
+    if len(parts) != 3 or not all(part.isdigit() for part in parts):
+        return None
+    day, month, year = (int(part) for part in parts)
+    return 2000 + year if year < 100 else year, month, day
+
+
+def line_date(data, line_start):
+    """(None, month, day) of the timestamp of the line at line_start, None without one"""
+    date = data[line_start:line_start + 8].split(b" ")[0].decode('latin-1')
+    parts = date.split("/")
+    if len(parts) != 2 or not all(part.isdigit() for part in parts):
+        return None
+    month, day = (int(part) for part in parts)
+    return None, month, day
+
+
+def find_pieces(data):
+    """Split a memory mapped log into Pieces, in order and covering all of it"""
+    breaks = iter(night_breaks(data) + [None])
+    next_break = next(breaks)
+    pieces = [Piece(0, line_date(data, 0), {})]
+    # latest COMBATANT_INFO line of each player this night
+    night_records = {}
+
+    def start_piece(start, new_night):
+        pieces[-1].end = start
+        if new_night:
+            night_records.clear()
+        pieces.append(Piece(start, line_date(data, start), dict(night_records)))
+
+    for match in record_pattern.finditer(data):
+        line_start, _, line_end = log_input.line_bounds(data, match.start())
+        while next_break is not None and next_break <= line_start:
+            start_piece(next_break, True)
+            next_break = next(breaks)
+        current = pieces[-1]
+        date, zone, instance_id, player = (None if group is None else group.decode('utf-8', 'replace').strip()
+                                           for group in match.groups())
+        if zone is None:
+            night_records[player] = data[line_start:line_end]
+            # the piece has its own record of the player
+            current.carried.pop(player, None)
+            continue
+        if instance_id != "0" and (zone, instance_id) != (current.zone, current.instance_id):
+            # the lines before the first instance of the night go with it
+            if current.instance_id is not None:
+                start_piece(line_start, False)
+                current = pieces[-1]
+            current.zone, current.instance_id = zone, instance_id
+        zone_date = record_date(date)
+        if zone_date is not None and current.date is not None and current.date[0] is None:
+            # the year of the piece's first day, which may be the year before the zone-in
+            year, month, _ = zone_date
+            current.date = (year - 1 if month < current.date[1] else year,) + current.date[1:]
+    while next_break is not None:
+        start_piece(next_break, True)
+        next_break = next(breaks)
+    pieces[-1].end = len(data)
+    # pieces without a dated ZONE_INFO are in the year of the piece before them, or the next one
+    for previous, piece in zip(pieces, pieces[1:]):
+        if piece.date is not None and piece.date[0] is None and previous.date is not None and previous.date[0] is not None:
+            piece.date = (previous.date[0] + (piece.date[1] < previous.date[1]),) + piece.date[1:]
+    return [piece for piece in pieces if piece.end > piece.start]
+
+
+def piece_filename(filename, piece, output_dir, used):
+    """<log>.<date>.<zone>.txt in output_dir, numbered if there's more than one of them"""
+    stem = os.path.splitext(os.path.basename(filename))[0]
+    if piece.date is None:
+        date = "undated"
+    else:
+        year, month, day = piece.date
+        date = f"{year:04d}-{month:02d}-{day:02d}" if year else f"{month:02d}-{day:02d}"
+    name = ".".join([stem, date, unsafe_name_pattern.sub("_", piece.zone or "No instance").strip("_")])
+    count = used.get(name, 0) + 1
+    used[name] = count
+    if count > 1:
+        name += f".{count}"
+    return os.path.join(output_dir, name + ".txt")
+
+
+def write_piece(data, piece):
+    temp_filename = piece.filename + ".tmp"
+    with open(temp_filename, 'wb') as file:
+        for line in piece.carried.values():
+            file.write(line if line.endswith((b"\n", b"\r")) else line + b"\n")
+        for chunk_start in range(piece.start, piece.end, copy_chunk_size):
+            file.write(data[chunk_start:min(chunk_start + copy_chunk_size, piece.end)])
+    os.replace(temp_filename, piece.filename)
+
+
+def split_log(filename, output_dir=None):
+    """
+    Write the raid nights and instances of the log to their own files in output_dir, next to the log by default.
+
+    Returns the Pieces with their filenames in log order, or None on error.
+    """
+    if output_dir is None:
+        output_dir = os.path.dirname(os.path.abspath(filename))
+    try:
+        os.makedirs(output_dir, exist_ok=True)
+        with log_input.map_log(filename) as data:
+            pieces = find_pieces(data)
+            used = {}
+            for piece in pieces:
+                piece.filename = piece_filename(filename, piece, output_dir, used)
+                write_piece(data, piece)
+    except (IOError, OSError) as e:
+        print(f"Error splitting {filename}: {e}")
+        return None
+    return pieces
+
+
+def write_manifest(manifest_filename, player_name, pieces):
+    """Write a format_log_for_upload.py --manifest listing the pieces for player_name"""
+    base_dir = os.path.dirname(os.path.abspath(manifest_filename))
+    with open(manifest_filename, 'w', encoding='utf-8', newline='') as file:
+        writer = csv.writer(file)
+        for piece in pieces:
+            writer.writerow([player_name, os.path.relpath(os.path.abspath(piece.filename), base_dir)])
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Split a combat log into one file per raid night and instance.")
+    parser.add_argument("filename", metavar="logfile", help="the regular or raw combat log")
+    parser.add_argument("--output-dir", help="where the pieces are written (default next to the log)")
+    parser.add_argument("--manifest", metavar="FILE",
+                        help="also write the pieces to FILE for format_log_for_upload.py --manifest, needs --player")
+    parser.add_argument("--player", help="player name written to the manifest")
+    args = parser.parse_args()
+    if args.manifest and not args.player:
+        parser.error("--manifest needs --player")
+
+    pieces = split_log(args.filename, args.output_dir)
+    if pieces is None:
+        return
+    for piece in pieces:
+        carried = f", {len(piece.carried)} COMBATANT_INFO carried over" if piece.carried else ""
+        print(f"{piece.filename}: {(piece.end - piece.start) / 1024 / 1024:.1f} MB{carried}")
+    if args.manifest:
+        try:
+            write_manifest(args.manifest, args.player, pieces)
+        except (IOError, OSError) as e:
+            print(f"Error writing manifest: {e}")
+            return
+        print(f"Format them all with: python format_log_for_upload.py --manifest {args.manifest} --jobs {os.cpu_count() or 1}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,241 @@
+#!/usr/bin/env python3
+"""
+Season-wide wasted sunder leaderboard over many raw combat logs.
+
+Each log is analyzed on its own by wasted_sunders_raw.analyze_debuffs in a pool of worker processes, and the
+DebuffResults of all of them are merged into one table.  The results of every log are kept in a cache file keyed by
+log_input.file_key and the DEBUFFS settings, so a run over an archive only analyzes the logs added or changed since
+the last one.
+
+Usage: python sunder_leaderboard.py LOG_OR_DIR [LOG_OR_DIR ...] [--tanks NAME ...] [--jobs N] [--debuffs all]
+                                    [--json FILE] [--csv FILE] [--cache FILE | --no-cache]
+"""
+
+import argparse
+import contextlib
+import csv
+import glob
+import io
+import json
+import os
+import sys
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import log_input
+from wasted_sunders_raw import DEBUFFS, DebuffResults, analyze_debuffs, display_results, parse_debuffs
+
+# bump when DebuffResults or the analysis change, older cached results are analyzed again
+CACHE_VERSION = 2
+default_cache = "sunder_leaderboard_cache.json"
+
+
+def find_logs(paths):
+    """
+    The logs among paths, each log once in the order given.  Directories give the raw logs in them, not the backups,
+    pieces and other outputs of the scripts next to them, which would count the same raid twice.
+    """
+    logs = []
+    for path in paths:
+        if os.path.isdir(path):
+            logs.extend(sorted(filename for filename in glob.glob(os.path.join(glob.escape(path), "*.txt"))
+                               if log_input.is_log_name(os.path.basename(filename), raw_only=True)))
+        else:
+            logs.append(path)
+    return list(dict.fromkeys(os.path.abspath(log) for log in logs))
+
+
+def analyze_log_job(filename, names):
+    """
+    Analyze one log in a worker process.
+
+    Returns (file key, DebuffResults as dicts by debuff name, everything the analysis printed), the results are
+    None if the log couldn't be read.
+    """
+    output = io.StringIO()
+    with contextlib.redirect_stdout(output):
+        try:
+            # taken first, a log that grows while it's analyzed is analyzed again next time
+            key = log_input.file_key(filename)
+        except (IOError, OSError) as e:
+            print(f"Error reading file: {e}")
+            return None, None, output.getvalue()
+        trackers = analyze_debuffs(filename, names)
+    if trackers is None:
+        return key, None, output.getvalue()
+    return key, {name: DebuffResults.from_tracker(tracker).to_dict() for name, tracker in trackers.items()}, output.getvalue()
+
+
+def load_cache(cache_filename):
+    """Cached results by log path, empty if there's no usable cache"""
+    try:
+        with open(cache_filename, 'r', encoding='utf-8') as file:
+            cache = json.load(file)
+        if cache.get("version") != CACHE_VERSION:
+            return {}
+        return cache["logs"]
+    except (IOError, OSError, ValueError, KeyError, AttributeError):
+        return {}
+
+
+def save_cache(cache_filename, logs):
+    temp_filename = cache_filename + ".tmp"
+    with open(temp_filename, 'w', encoding='utf-8') as file:
+        json.dump({"version": CACHE_VERSION, "logs": logs}, file)
+    os.replace(temp_filename, cache_filename)
+
+
+def cached_results(entry, key, names):
+    """DebuffResults by name from a cache entry if it's from a log with key and the current DEBUFFS, else None"""
+    if entry is None or entry["key"] != key:
+        return None
+    results = {}
+    for name in names:
+        cached = entry["debuffs"].get(name)
+        if cached is None or cached["config"] != DEBUFFS[name]:
+            return None
+        results[name] = DebuffResults.from_dict(cached["results"])
+    return results
+
+
+def analyze_logs(logs, names, jobs=1, cache_filename=None):
+    """
+    Analyze logs for the debuffs names, jobs at a time, taking the results of unchanged logs from the cache.
+
+    Returns:
+        tuple: (DebuffResults by log and debuff name of the logs that could be read, list of the logs that failed)
+    """
+    cache = load_cache(cache_filename) if cache_filename else {}
+    results = {}
+    pending = []
+    for filename in logs:
+        try:
+            key = log_input.file_key(filename)
+        except (IOError, OSError):
+            key = None
+        log_results = cached_results(cache.get(filename), key, names)
+        if log_results is None:
+            pending.append(filename)
+        else:
+            results[filename] = log_results
+    if results:
+        print(f"{len(results)} of {len(logs)} logs are unchanged, their results are from {cache_filename}")
+
+    failures = []
+    try:
+        with ProcessPoolExecutor(max_workers=jobs) as executor:
+            futures = {executor.submit(analyze_log_job, filename, names): filename for filename in pending}
+            for future in as_completed(futures):
+                filename = futures[future]
+                try:
+                    key, log_results, output = future.result()
+                except Exception as e:
+                    key, log_results, output = None, None, f"Worker failed: {e}\n"
+                print(f"[{'OK' if log_results is not None else 'FAILED'}] {filename}")
+                if log_results is None:
+                    for line in output.splitlines():
+                        print(f"    {line}")
+                    failures.append(filename)
+                    continue
+                results[filename] = {name: DebuffResults.from_dict(values) for name, values in log_results.items()}
+                entry = cache.setdefault(filename, {"key": key, "debuffs": {}})
+                if entry["key"] != key:
+                    entry.update(key=key, debuffs={})
+                for name, values in log_results.items():
+                    entry["debuffs"][name] = {"config": DEBUFFS[name], "results": values}
+    finally:
+        # keep what was analyzed even if the run is interrupted
+        if cache_filename and pending:
+            try:
+                save_cache(cache_filename, cache)
+            except (IOError, OSError) as e:
+                print(f"Warning: Couldn't write the result cache {cache_filename}: {e}")
+    return results, failures
+
+
+def merge_results(logs, results, names):
+    """Merged DebuffResults of the logs with results by debuff name, in the order of logs"""
+    merged = {name: DebuffResults(name) for name in names}
+    for filename in logs:
+        if filename not in results:
+            continue
+        for name in names:
+            merged[name].merge(results[filename][name])
+    return merged
+
+
+def leaderboard_rows(results):
+    """(player, true, first, landed, wasted) of each player, sorted like display_results"""
+    rows = []
+    for key in results.total_counts.keys() | results.wasted_counts.keys() | results.first_counts.keys():
+        landed = results.total_counts.get(key, 0)
+        wasted = results.wasted_counts.get(key, 0)
+        rows.append((key, results.display_names[key], landed - wasted, results.first_counts.get(key, 0), landed, wasted))
+    rows.sort(key=lambda row: (-row[2], row[0]))
+    return [row[1:] for row in rows]
+
+
+def write_csv(merged, csv_file):
+    writer = csv.writer(csv_file)
+    writer.writerow(["debuff", "player", "true", "first", "landed", "wasted"])
+    for name, results in merged.items():
+        for row in leaderboard_rows(results):
+            writer.writerow([name, *row])
+
+
+def write_json(merged, json_file):
+    json.dump({name: {"logs": results.logs, "casts": results.cast_count, "landed": results.successful_count,
+                      "unique_mobs": results.unique_mobs,
+                      "players": [dict(zip(("player", "true", "first", "landed", "wasted"), row))
+                                  for row in leaderboard_rows(results)]}
+               for name, results in merged.items()}, json_file, indent=2)
+    json_file.write("\n")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Merge the wasted sunders, or other debuffs, of many raw combat logs "
+                                                 "into one leaderboard.")
+    parser.add_argument("logs", nargs="+", metavar="LOG_OR_DIR",
+                        help="raw combat logs, or directories with WoWRawCombatLog*.txt raw combat logs")
+    parser.add_argument("--tanks", nargs="*", default=[], help="tanks to exclude from the Landed/Wasted ranking")
+    parser.add_argument("-j", "--jobs", type=int, default=os.cpu_count() or 1,
+                        help="number of logs analyzed at once (default the number of CPUs)")
+    parser.add_argument("--debuffs", type=parse_debuffs, default=["Sunder Armor"],
+                        help=f"comma separated debuffs to analyze, or all (default Sunder Armor): {', '.join(DEBUFFS)}")
+    parser.add_argument("--cache", default=default_cache,
+                        help=f"file keeping the results of each log between runs (default {default_cache})")
+    parser.add_argument("--no-cache", action="store_true", help="analyze every log again and don't write the cache")
+    parser.add_argument("--json", metavar="FILE", help="also write the leaderboard as json, - for stdout")
+    parser.add_argument("--csv", metavar="FILE", help="also write the leaderboard as CSV, - for stdout")
+    args = parser.parse_args()
+    if args.json == "-" and args.csv == "-":
+        parser.error("only one of --json and --csv can go to stdout")
+
+    logs = find_logs(args.logs)
+    to_stdout = "-" in (args.json, args.csv)
+    # keep the progress and tables out of json or CSV written to stdout
+    with contextlib.redirect_stdout(sys.stderr) if to_stdout else contextlib.nullcontext():
+        results, failures = analyze_logs(logs, args.debuffs, max(1, args.jobs), None if args.no_cache else args.cache)
+        merged = merge_results(logs, results, args.debuffs)
+        for name, tracker_results in merged.items():
+            config = DEBUFFS[name]
+            if len(merged) > 1:
+                print(f"\n=== {name} ===")
+            display_results(*tracker_results.results()[:4], args.tanks, *tracker_results.results()[4:],
+                            label=config["label"], plural=config["plural"], max_stacks=config["max_stacks"],
+                            refresh_window=config["refresh_window"], logs=tracker_results.logs)
+        if failures:
+            print(f"\n{len(failures)} of {len(logs)} logs couldn't be analyzed:")
+            for filename in failures:
+                print(f"- Failed: {filename}")
+
+    for filename, write in ((args.json, write_json), (args.csv, write_csv)):
+        if filename is None:
+            continue
+        with (open(filename, 'w', newline='', encoding='utf-8') if filename != "-" else contextlib.nullcontext(sys.stdout)) as file:
+            write(merged, file)
+    if failures:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,110 @@
+#!/usr/bin/env python3
+"""
+Regression test for the formatter against the output of the original one.
+
+tests/data holds logs next to what the original format_log_for_upload.py (the handle_replacements loop over the
+replacement dictionaries, before the rules were compiled) made of them for player Qcb:
+- cases.txt covers casts with spell ids and raid marks, the dropped line types, loot, pets (renamed, summoned,
+  ignored, dismissed), totems, You/Your lines, friendly fire, self damage, DPSMate " 's" lines and the mob names
+  with apostrophes.
+- generated.txt is the COMBATANT_INFO lines and every 400th other line of a 10 MB benchmarks/generate_log.py log.
+
+Every way of formatting a log has to give the same bytes, with and without the line cache and in worker processes.
+
+Usage: python -m pytest tests  or  python tests/test_formatting.py
+"""
+
+import contextlib
+import io
+import os
+import shutil
+import sys
+import tempfile
+import unittest
+import zipfile
+
+tests_dir = os.path.dirname(os.path.abspath(__file__))
+data_dir = os.path.join(tests_dir, "data")
+sys.path.insert(0, os.path.dirname(tests_dir))
+
+import format_log_for_upload
+
+player_name = "Qcb"
+logs = ("cases", "generated")
+
+
+def read_bytes(filename):
+    with open(filename, 'rb') as file:
+        return file.read()
+
+
+class FormattingTest(unittest.TestCase):
+
+    def setUp(self):
+        temp_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(temp_dir.cleanup)
+        self.temp_dir = temp_dir.name
+
+    def copy_log(self, name):
+        filename = os.path.join(self.temp_dir, "WoWCombatLog.txt")
+        shutil.copyfile(os.path.join(data_dir, name + ".txt"), filename)
+        return filename
+
+    def expected(self, name):
+        return read_bytes(os.path.join(data_dir, name + ".formatted.txt"))
+
+    def assert_in_place(self, **options):
+        for name in logs:
+            with self.subTest(log=name):
+                filename = self.copy_log(name)
+                with contextlib.redirect_stdout(io.StringIO()):
+                    self.assertTrue(format_log_for_upload.replace_instances(player_name, filename, backup="none",
+                                                                            **options))
+                self.assert_same_lines(read_bytes(filename), self.expected(name))
+
+    def assert_same_lines(self, formatted, expected):
+        # line by line first for a readable failure, then the bytes
+        self.assertEqual(formatted.decode('utf-8').splitlines(True), expected.decode('utf-8').splitlines(True))
+        self.assertEqual(formatted, expected)
+
+    def test_line_cache(self):
+        self.assert_in_place()
+
+    def test_no_line_cache(self):
+        self.assert_in_place(cache_size=0)
+
+    def test_small_line_cache(self):
+        # lines are dropped from the cache and formatted again
+        self.assert_in_place(cache_size=16)
+
+    def test_worker_processes(self):
+        # small chunks so each log is split between the workers
+        chunk_size = format_log_for_upload.parallel_chunk_size
+        format_log_for_upload.parallel_chunk_size = 4096
+        try:
+            self.assert_in_place(jobs=2)
+        finally:
+            format_log_for_upload.parallel_chunk_size = chunk_size
+
+    def test_stream_zip(self):
+        for name in logs:
+            with self.subTest(log=name):
+                filename = self.copy_log(name)
+                zip_filename = filename + ".zip"
+                with contextlib.redirect_stdout(io.StringIO()):
+                    self.assertTrue(format_log_for_upload.replace_instances_to_zip(player_name, filename,
+                                                                                   zip_filename))
+                with zipfile.ZipFile(zip_filename) as zipf:
+                    self.assert_same_lines(zipf.read(os.path.basename(filename)), self.expected(name))
+
+    def test_lines_are_rewritten(self):
+        # the logs actually exercise the rules, otherwise the comparisons prove nothing
+        for name in logs:
+            with self.subTest(log=name):
+                original = read_bytes(os.path.join(data_dir, name + ".txt")).splitlines()
+                formatted = set(self.expected(name).splitlines())
+                self.assertGreater(sum(line not in formatted for line in original), len(original) // 4)
+
+
+if __name__ == "__main__":
+    unittest.main()
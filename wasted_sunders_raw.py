@@ -5,12 +5,15 @@ GUID-based Wasted Sunder Counter for World of Warcraft Combat Logs
 This script analyzes combat log files with GUID format to count wasted sunder armor casts.
 It tracks all sunder casts per mob GUID and counts any beyond the 5th as wasted,
 but excludes refreshes (sunders cast when the debuff is about to expire).
+Other stacking or refreshable debuffs from the DEBUFFS table are counted the same way with --debuffs,
+all of them in one pass over the log.
 
 Expected log format, uses the RAW log:
 8/22 20:01:54.030  0x0000000000440A95(Qcb) casts Sunder Armor(11597)(Rank 5) on 0xF13000F1ED276B19(Greater Gloomwing).
 8/22 20:01:54.033  0xF13000F1ED276B19 is afflicted by Sunder Armor (1).
 
-Usage: python wasted_sunders_raw.py <logfile> [tank1] [tank2] ...
+Usage: python wasted_sunders_raw.py <logfile> [tank1] [tank2] ... [--debuffs all|name,name,...]
+                                    [--segment N|name] [--since [M/D ]HH:MM] [--until [M/D ]HH:MM]
 Example: python wasted_sunders_raw.py combat.log Maintankname Offtankname
 """
 
@@ -18,10 +21,75 @@ Example: python wasted_sunders_raw.py combat.log Maintankname Offtankname
 SUNDER_DURATION = 30  # Sunder Armor debuff lasts 30 seconds
 WASTE_THRESHOLD = 22  # Only count as wasted if cast within this many seconds of last sunder
 
+# Tracked debuffs:
+#   label, plural: what the output calls a cast of it
+#   spells: the spells whose casts apply it
+#   spell_ids: the ranks of those spells that count, empty for any
+#   max_stacks: casts beyond this many on a mob can be wasted
+#   duration: how long the debuff lasts in seconds
+#   refresh_window: a cast with this many seconds or less left on the debuff is a refresh, not wasted
+#   misses: the ways a cast can fail to land
+DEBUFFS = {
+    "Sunder Armor": {
+        "label": "sunder",
+        "plural": "sunders",
+        "spells": ["Sunder Armor"],
+        "spell_ids": [],  # any rank, mobs sundering players included as they always were
+        "max_stacks": 5,
+        "duration": SUNDER_DURATION,
+        "refresh_window": SUNDER_DURATION - WASTE_THRESHOLD,
+        "misses": ["was parried by", "was dodged by", "missed"],
+    },
+    "Faerie Fire": {
+        "label": "faerie fire",
+        "plural": "faerie fires",
+        "spells": ["Faerie Fire", "Faerie Fire (Feral)"],
+        "spell_ids": [770, 778, 9749, 9907, 16857, 17390, 17391, 17392],
+        "max_stacks": 1,
+        "duration": 40,
+        "refresh_window": 8,
+        "misses": ["was resisted by", "missed"],
+    },
+    "Curse of Recklessness": {
+        "label": "curse of recklessness",
+        "plural": "curses of recklessness",
+        "spells": ["Curse of Recklessness"],
+        "spell_ids": [704, 7658, 7659, 11717],
+        "max_stacks": 1,
+        "duration": 120,
+        "refresh_window": 15,
+        "misses": ["was resisted by", "missed"],
+    },
+    "Expose Armor": {
+        "label": "expose armor",
+        "plural": "expose armors",
+        "spells": ["Expose Armor"],
+        "spell_ids": [8647, 8649, 8650, 11197, 11198],
+        "max_stacks": 1,
+        "duration": 30,
+        "refresh_window": 8,
+        "misses": ["was parried by", "was dodged by", "missed"],
+    },
+}
+
+import argparse
+import contextlib
+import csv
 import re
 import sys
+from array import array
+from bisect import bisect_left
 from collections import defaultdict
-from datetime import datetime, timedelta
+
+import log_input
+import log_segments
+
+try:
+    import numpy
+    import raw_events
+except ImportError:  # --sweep works without it, just slower, and there's no event cache
+    numpy = None
+    raw_events = None
 
 def clean_player_name(name):
     """
@@ -37,143 +105,462 @@ def clean_player_name(name):
     cleaned = re.sub(r'\s*\([^)]+\)\s*$', '', name).strip()
     return cleaned if cleaned else name
 
-def analyze_guid_sunders(filename):
+class NameTable:
     """
-    Analyze sunder armor usage by tracking casts per mob GUID.
+    Raw names from the log interned to small ints, with the cleaned name and its lowercase key of each so
+    clean_player_name runs once per name.
+    """
+
+    def __init__(self, raw_names=()):
+        self.ids = {}
+        self.cleaned = []
+        self.keys = []
+        for raw_name in raw_names:
+            self.add(raw_name)
+
+    def add(self, raw_name):
+        """Id of raw_name, adding it the first time"""
+        name_id = self.ids.get(raw_name)
+        if name_id is None:
+            name_id = self.ids[raw_name] = len(self.cleaned)
+            cleaned = clean_player_name(raw_name)
+            self.cleaned.append(cleaned)
+            self.keys.append(cleaned.lower())
+        return name_id
+
+class MobRecord:
+    """Landed casts of one debuff on one mob"""
+    __slots__ = ('name', 'count', 'last_time')
+
+    def __init__(self):
+        self.name = None  # Store mob name for debugging
+        self.count = 0
+        self.last_time = None  # Timestamp of last landed cast
+
+class PendingCast:
+    """A player's last cast until it's resolved, each player has one that's reused for all their casts"""
+    __slots__ = ('player_name', 'player_key', 'mob', 'mob_name', 'time')
+
+class DebuffTracker:
+    """
+    Waste analysis of one debuff from DEBUFFS.
+
+    Casts are pending until the next line that isn't a cast or miss of this debuff, a miss in between means
+    they never landed.  Landed casts are counted per mob GUID, and one beyond max_stacks cast while the
+    debuff had more than refresh_window seconds left is wasted.  Players and mobs are given by their GUIDs
+    interned to ints, along with their cleaned names.
+
+    With record_intervals the time since the last landed cast on the mob is kept for every cast that could be
+    wasted, for sweep to count them again for other thresholds.
+    """
+
+    def __init__(self, name, config, record_intervals=False):
+        self.name = name
+        self.label = config["label"]
+        self.plural = config["plural"]
+        self.spell_ids = {str(spell_id) for spell_id in config["spell_ids"]}
+        self.max_stacks = config["max_stacks"]
+        self.refresh_window = config["refresh_window"]
+        self.waste_threshold = config["duration"] - config["refresh_window"]
+        self.misses = {miss.lower() for miss in config["misses"]}
+        self.wasted_counts = defaultdict(int)
+        self.total_counts = defaultdict(int)
+        self.first_counts = defaultdict(int)
+        self.display_names = {}
+        self.mobs = {}  # MobRecord of each mob GUID id with a landed cast
+        self.casters = {}  # PendingCast of each player GUID id
+        self.cast_count = 0  # Debug counter for total casts
+        self.successful_count = 0  # Counter for casts that landed (not missed/dodged/parried)
+        self.pending = {}  # Track casts that were cast but not yet resolved, PendingCast by player GUID id
+        self.interval_players = array('q') if record_intervals else None  # Player of each interval, index into player_keys
+        self.intervals = array('q') if record_intervals else None  # Milliseconds since the last landed cast on the mob
+        self.player_indexes = {}
+
+    def cast(self, player_id, player_name, player_key, mob_id, mob_name, current_time):
+        self.cast_count += 1
+        # Store this cast as pending
+        pending_cast = self.casters.get(player_id)
+        if pending_cast is None:
+            pending_cast = self.casters[player_id] = PendingCast()
+        pending_cast.player_name = player_name
+        pending_cast.player_key = player_key
+        pending_cast.mob = mob_id
+        pending_cast.mob_name = mob_name
+        pending_cast.time = current_time
+        self.pending[player_id] = pending_cast
+
+    def miss(self, player_id):
+        # Remove from pending - this cast doesn't count
+        self.pending.pop(player_id, None)
+
+    def resolve_pending(self):
+        """Process all pending casts as landed"""
+        for pending_cast in self.pending.values():
+            self.successful_count += 1
+            current_time = pending_cast.time
+            
+            mob = self.mobs.get(pending_cast.mob)
+            if mob is None:
+                mob = self.mobs[pending_cast.mob] = MobRecord()
+            mob.name = pending_cast.mob_name
+            
+            # Increment cast count for this mob
+            mob.count += 1
+            
+            # Count total casts for this player
+            key = pending_cast.player_key
+            self.display_names[key] = pending_cast.player_name
+            self.total_counts[key] += 1
+            
+            # Check if this is the first cast on this mob
+            if mob.count == 1:
+                self.first_counts[key] += 1
+            
+            # Check if this is wasted (more than max stacks AND cast too early)
+            if mob.count > self.max_stacks:
+                # Check if this is a premature cast
+                if current_time is not None and mob.last_time is not None:
+                    time_since_last = (current_time - mob.last_time) / 1000
+                    if self.intervals is not None:
+                        self.interval_players.append(self.player_indexes.setdefault(key, len(self.player_indexes)))
+                        self.intervals.append(current_time - mob.last_time)
+                    
+                    if time_since_last < self.waste_threshold:
+                        self.wasted_counts[key] += 1
+            
+            # Update last cast time for this mob
+            if current_time is not None:
+                mob.last_time = current_time
+        
+        # Clear all pending casts
+        self.pending.clear()
+
+    def print_summary(self):
+        print(f"- Found {self.cast_count} total {self.label} casts")
+        print(f"- Successful {self.plural}: {self.successful_count} (not missed/dodged/parried)")
+        print(f"- Tracking {len(self.mobs)} unique mobs")
+        print(f"- Total wasted {self.plural}: {sum(self.wasted_counts.values())}")
+
+    def sweep(self, thresholds):
+        """
+        Wasted casts per player for each of thresholds in place of the waste threshold, from the recorded intervals.
+
+        Args:
+            thresholds (list): Waste thresholds in seconds, ascending
+
+        Returns:
+            dict: Wasted counts for each threshold by player key, players who landed casts without any intervals
+            have all zeros
+        """
+        wasted = {key: [0] * len(thresholds) for key in self.total_counts}
+        thresholds_ms = [threshold * 1000 for threshold in thresholds]
+        player_keys = list(self.player_indexes)
+        if numpy is not None:
+            players = numpy.frombuffer(self.interval_players, dtype=numpy.int64)
+            intervals = numpy.frombuffer(self.intervals, dtype=numpy.int64)
+            # an interval is wasted for all thresholds from the first one above it
+            first_wasted = numpy.searchsorted(numpy.asarray(thresholds_ms, dtype=float), intervals, side='right')
+            width = len(thresholds) + 1
+            counts = numpy.bincount(players * width + first_wasted, minlength=len(player_keys) * width)
+            counts = numpy.cumsum(counts.reshape(len(player_keys), width), axis=1)[:, :-1]
+            for index, key in enumerate(player_keys):
+                wasted[key] = counts[index].tolist()
+        else:
+            player_intervals = [[] for _ in player_keys]
+            for index, interval in zip(self.interval_players, self.intervals):
+                player_intervals[index].append(interval)
+            for key, intervals in zip(player_keys, player_intervals):
+                intervals.sort()
+                wasted[key] = [bisect_left(intervals, threshold) for threshold in thresholds_ms]
+        return wasted
+
+    def results(self):
+        """(wasted_counts, total_counts, first_counts, display_names, cast_count, successful_count, unique_mobs)"""
+        return (self.wasted_counts, self.total_counts, self.first_counts, self.display_names,
+                self.cast_count, self.successful_count, len(self.mobs))
+
+class DebuffResults:
+    """
+    The counts of a DebuffTracker without its per mob state, which can be merged with the results of other logs
+    and saved as json.  logs is the number of logs merged into them, mobs of different logs are counted apart.
+    """
+
+    def __init__(self, name, logs=0):
+        self.name = name
+        self.wasted_counts = defaultdict(int)
+        self.total_counts = defaultdict(int)
+        self.first_counts = defaultdict(int)
+        self.display_names = {}
+        self.cast_count = 0
+        self.successful_count = 0
+        self.unique_mobs = 0
+        self.logs = logs
+
+    @classmethod
+    def from_tracker(cls, tracker):
+        results = cls(tracker.name, logs=1)
+        (wasted_counts, total_counts, first_counts, results.display_names, results.cast_count,
+         results.successful_count, results.unique_mobs) = tracker.results()
+        results.wasted_counts.update(wasted_counts)
+        results.total_counts.update(total_counts)
+        results.first_counts.update(first_counts)
+        return results
+
+    def merge(self, other):
+        """Add the counts of other to these, the names players had in the later logs are kept"""
+        for counts, other_counts in ((self.wasted_counts, other.wasted_counts), (self.total_counts, other.total_counts),
+                                     (self.first_counts, other.first_counts)):
+            for key, count in other_counts.items():
+                counts[key] += count
+        self.display_names.update(other.display_names)
+        self.cast_count += other.cast_count
+        self.successful_count += other.successful_count
+        self.unique_mobs += other.unique_mobs
+        self.logs += other.logs
+        return self
+
+    def results(self):
+        """The same tuple as DebuffTracker.results"""
+        return (self.wasted_counts, self.total_counts, self.first_counts, self.display_names,
+                self.cast_count, self.successful_count, self.unique_mobs)
+
+    def to_dict(self):
+        return {"name": self.name, "wasted_counts": self.wasted_counts, "total_counts": self.total_counts,
+                "first_counts": self.first_counts, "display_names": self.display_names, "cast_count": self.cast_count,
+                "successful_count": self.successful_count, "unique_mobs": self.unique_mobs, "logs": self.logs}
+
+    @classmethod
+    def from_dict(cls, values):
+        results = cls(values["name"], values["logs"])
+        results.wasted_counts.update(values["wasted_counts"])
+        results.total_counts.update(values["total_counts"])
+        results.first_counts.update(values["first_counts"])
+        results.display_names.update(values["display_names"])
+        results.cast_count = values["cast_count"]
+        results.successful_count = values["successful_count"]
+        results.unique_mobs = values["unique_mobs"]
+        return results
+
+def debuff_patterns(trackers):
+    """
+    Patterns for the casts and misses of the spells of trackers, the spell name is group 'spell' in both.
+
+    Returns:
+        tuple: (lowercase bytes line prefilter, cast pattern, miss pattern)
+    """
+    spells = sorted({spell for tracker in trackers for spell in DEBUFFS[tracker.name]["spells"]}, key=len, reverse=True)
+    spell_names = "|".join(re.escape(spell) for spell in spells)
+    misses = sorted({miss for tracker in trackers for miss in tracker.misses}, key=len, reverse=True)
+    line_pattern = re.compile(spell_names.lower().encode('utf-8'))
+    # Note: Names may contain raid marks like (Diamond) inside the parentheses
+    # e.g., 0x123(Khoni(Diamond)) - we use [^()]+ to match base name, then optionally (\([^)]+\))? for the mark
+    cast_pattern = re.compile(
+        r'(0x[0-9A-Fa-f]+)\(([^()]+(?:\([^)]+\))?)\)\s+casts\s+(?P<spell>' + spell_names + r')\((?P<spell_id>[^)]+)\)\([^)]+\)\s+on\s+(0x[0-9A-Fa-f]+)\(([^()]+(?:\([^)]+\))?)\)',
+        re.IGNORECASE
+    )
+    miss_pattern = re.compile(
+        r'(0x[0-9A-Fa-f]+)\'s (?P<spell>' + spell_names + r') (?P<outcome>' + "|".join(map(re.escape, misses)) + r') (0x[0-9A-Fa-f]+)',
+        re.IGNORECASE
+    )
+    return line_pattern, cast_pattern, miss_pattern
+
+def debuff_lines(data, line_pattern, start=0, end=None):
+    """
+    Decoded lines of a memory mapped log, or of the byte range start-end of it, that mention a tracked spell, in order.
+
+    Only these can be casts or misses.  Any other lines between them just resolve the pending casts,
+    so each run of them is given as a single empty line.
+    
+    Args:
+        data: The log, from log_input.map_log
+        line_pattern: lowercase bytes pattern finding the tracked spell names in any case
+        start, end: Line boundaries of the part of the log to read
+        
+    Yields:
+        str: Each line with a tracked spell, or "" for the lines skipped before it and after the last one
+    """
+    if end is None:
+        end = len(data)
+    # the lines before start were skipped too
+    if start > 0:
+        yield ""
+    previous_end = start
+    for line_start, content_end, line_end in log_input.matching_lines_ignorecase(data, line_pattern, start, end):
+        if line_start > previous_end:
+            yield ""
+        yield log_input.decode_line(data, line_start, content_end, line_end)
+        previous_end = line_end
+    if previous_end < end:
+        yield ""
+
+def track_log(filename, trackers, ranges=None):
+    """
+    Feed the casts and misses of the tracked debuffs in the log to trackers, a dict of DebuffTracker by name.
+    ranges are the (start, end, start line, end line) parts of the log to read from log_segments.select_ranges,
+    all of it if None.
+    """
+    # a spell name could apply more than one tracked debuff
+    spell_trackers = defaultdict(list)
+    for tracker in trackers.values():
+        for spell in DEBUFFS[tracker.name]["spells"]:
+            spell_trackers[spell.lower()].append(tracker)
+    line_pattern, cast_pattern, miss_pattern = debuff_patterns(trackers.values())
+    guid_ids = {}
+    names = NameTable()
+    
+    with log_input.map_log(filename) as data:
+        timestamps = log_input.TimestampDecoder(log_input.log_year(data))
+        lines = (line for start, end, _, _ in ranges or [(0, len(data), 0, None)]
+                 for line in debuff_lines(data, line_pattern, start, end))
+        for line in lines:
+            # trackers with a cast or miss on this line
+            active = []
+            
+            # Look for casts with GUID format
+            cast_match = cast_pattern.search(line)
+            if cast_match:
+                # Timestamp in milliseconds (format: 8/22 20:01:54.030), None if it can't be parsed
+                # and we'll skip time-based logic for this cast
+                current_time = timestamps.decode(line)
+                player_id = guid_ids.setdefault(cast_match.group(1), len(guid_ids))
+                mob_id = guid_ids.setdefault(cast_match.group(5), len(guid_ids))
+                player_name = names.add(cast_match.group(2))
+                mob_name = names.cleaned[names.add(cast_match.group(6))]
+                for tracker in spell_trackers[cast_match.group('spell').lower()]:
+                    if not tracker.spell_ids or cast_match.group('spell_id') in tracker.spell_ids:
+                        tracker.cast(player_id, names.cleaned[player_name], names.keys[player_name], mob_id,
+                                     mob_name, current_time)
+                        active.append(tracker)
+            
+            # Check for miss/dodge/parry - these negate the cast
+            miss_match = miss_pattern.search(line)
+            if miss_match:
+                for tracker in spell_trackers[miss_match.group('spell').lower()]:
+                    if miss_match.group('outcome').lower() in tracker.misses:
+                        # a player who never cast has nothing pending
+                        if miss_match.group(1) in guid_ids:
+                            tracker.miss(guid_ids[miss_match.group(1)])
+                        active.append(tracker)
+            
+            # Process any remaining pending casts (these landed)
+            for tracker in trackers.values():
+                if tracker.pending and tracker not in active:
+                    tracker.resolve_pending()
+
+def track_events(events, trackers, ranges=None):
+    """
+    Feed the casts and misses of the tracked debuffs to trackers from the events of raw_events instead of the log,
+    only those within the lines of ranges like track_log's.
+
+    Each tracker only gets its own events, with the line numbers telling whether any other line came in between
+    to resolve its pending casts, so the results are the same as track_log's.
+    """
+    if ranges is None:
+        ranges = [(0, None, 0, events.line_count)]
+    spells = [spell.lower() for spell in events.spells]
+    names = NameTable(events.names)
+    for tracker in trackers.values():
+        tracker_spells = {spell.lower() for spell in DEBUFFS[tracker.name]["spells"]}
+        spell_indexes = [index for index, spell in enumerate(spells) if spell in tracker_spells]
+        outcome_indexes = [index for index, outcome in enumerate(raw_events.MISS_OUTCOMES) if outcome in tracker.misses]
+        tracked = numpy.isin(events.spell, spell_indexes)
+        casts = tracked & (events.kind == raw_events.EVENT_CAST)
+        if tracker.spell_ids:
+            casts &= numpy.isin(events.spell_id, [int(spell_id) for spell_id in tracker.spell_ids if spell_id.isdigit()])
+        misses = tracked & (events.kind == raw_events.EVENT_MISS) & numpy.isin(events.outcome, outcome_indexes)
+        
+        for _, _, start_line, end_line in ranges:
+            # the lines skipped before the range resolve the pending casts
+            if tracker.pending:
+                tracker.resolve_pending()
+            selected = numpy.flatnonzero((casts | misses) & (events.line >= start_line) & (events.line < end_line))
+            last_line = start_line - 1
+            for line, current_time, kind, actor, actor_name, target, target_name in zip(
+                    *(getattr(events, column)[selected].tolist() for column in ("line", "time", "kind", "actor", "actor_name", "target", "target_name"))):
+                # any other line in between resolves the pending casts
+                if tracker.pending and line > last_line + 1:
+                    tracker.resolve_pending()
+                last_line = line
+                if kind == raw_events.EVENT_CAST:
+                    tracker.cast(actor, names.cleaned[actor_name], names.keys[actor_name], target, names.cleaned[target_name],
+                                 None if current_time == raw_events.NO_TIME else current_time)
+                else:
+                    tracker.miss(actor)
+            if tracker.pending and last_line < end_line - 1:
+                tracker.resolve_pending()
+
+def analyze_debuffs(filename, names, record_intervals=False, use_cache=False, segment=None, since=None, until=None):
+    """
+    Analyze the usage of the debuffs from DEBUFFS called names by tracking casts per mob GUID, all in one pass.
     
     Args:
         filename (str): Path to the combat log file
+        names (list): Debuffs to track, keys of DEBUFFS
+        record_intervals (bool): Keep the intervals DebuffTracker.sweep needs
+        use_cache (bool): Read the casts and misses from the raw_events cache of the log, making it first if it's
+            missing or out of date, when numpy is installed
+        segment (str): Only analyze these segments of the log, see log_segments.select_segments
+        since, until: Only analyze the log from and up to before these log_segments.parse_time times
         
     Returns:
-        tuple: (wasted_counts, total_counts, first_counts, display_names, sunder_cast_count, successful_sunder_count, unique_mobs)
+        dict: DebuffTracker with the results of each debuff by name, None if the log couldn't be read
     """
-    wasted_counts = defaultdict(int)
-    total_counts = defaultdict(int)
-    first_counts = defaultdict(int)
-    display_names = {}
-    mob_sunder_counts = defaultdict(int)  # Track sunders per mob GUID
-    mob_names = {}  # Store mob names for debugging
-    mob_last_sunder_time = {}  # Track timestamp of last sunder per mob
-    sunder_cast_count = 0  # Debug counter for total casts
-    successful_sunder_count = 0  # Counter for successful sunders (not missed/dodged/parried)
-    pending_sunders = {}  # Track sunders that were cast but not yet resolved
+    trackers = {name: DebuffTracker(name, DEBUFFS[name], record_intervals) for name in names}
     
     try:
-        with open(filename, 'r', encoding='utf-8') as file:
-            for line_num, line in enumerate(file, 1):
-                # Extract timestamp from each line (format: 8/22 20:01:54.030)
-                timestamp_match = re.match(r'(\d+/\d+\s+\d+:\d+:\d+\.\d+)', line)
-                current_time = None
-                if timestamp_match:
-                    try:
-                        # Parse timestamp (assuming current year)
-                        time_str = timestamp_match.group(1)
-                        current_time = datetime.strptime(f"2024/{time_str}", "%Y/%m/%d %H:%M:%S.%f")
-                    except ValueError:
-                        # If parsing fails, we'll skip time-based logic for this line
-                        pass
-                
-                # Look for sunder armor casts with GUID format
-                # Note: Names may contain raid marks like (Diamond) inside the parentheses
-                # e.g., 0x123(Khoni(Diamond)) - we use [^()]+ to match base name, then optionally (\([^)]+\))? for the mark
-                cast_match = re.search(
-                    r'(0x[0-9A-Fa-f]+)\(([^()]+(?:\([^)]+\))?)\)\s+casts\s+Sunder Armor\([^)]+\)\([^)]+\)\s+on\s+(0x[0-9A-Fa-f]+)\(([^()]+(?:\([^)]+\))?)\)',
-                    line,
-                    re.IGNORECASE
-                )
-                
-                if cast_match:
-                    sunder_cast_count += 1
-                    player_guid = cast_match.group(1)
-                    raw_player_name = cast_match.group(2)
-                    mob_guid = cast_match.group(3)
-                    raw_mob_name = cast_match.group(4)
-                    
-                    # Clean both player and mob names
-                    player_name = clean_player_name(raw_player_name)
-                    mob_name = clean_player_name(raw_mob_name)
-                    
-                    # Store this sunder as pending
-                    pending_sunders[player_guid] = {
-                        'player_name': player_name,
-                        'mob_guid': mob_guid,
-                        'mob_name': mob_name,
-                        'timestamp': current_time
-                    }
-                
-                # Check for miss/dodge/parry - these negate the sunder
-                miss_match = re.search(
-                    r'(0x[0-9A-Fa-f]+)\'s Sunder Armor (?:was parried by|was dodged by|missed) (0x[0-9A-Fa-f]+)',
-                    line,
-                    re.IGNORECASE
-                )
-                
-                if miss_match:
-                    player_guid = miss_match.group(1)
-                    if player_guid in pending_sunders:
-                        # Remove from pending - this sunder doesn't count
-                        del pending_sunders[player_guid]
-                
-                # Process any remaining pending sunders (these are successful)
-                if not cast_match and not miss_match and pending_sunders:
-                    # Process all pending sunders as successful
-                    for player_guid, sunder_info in list(pending_sunders.items()):
-                        successful_sunder_count += 1  # Count this as a successful sunder
-                        player_name = sunder_info['player_name']
-                        mob_guid = sunder_info['mob_guid']
-                        mob_name = sunder_info['mob_name']
-                        current_time = sunder_info['timestamp']
-                        
-                        # Store mob name for reference
-                        mob_names[mob_guid] = mob_name
-                        
-                        # Increment sunder count for this mob
-                        mob_sunder_counts[mob_guid] += 1
-                        current_count = mob_sunder_counts[mob_guid]
-                        
-                        # Count total sunders for this player
-                        key = player_name.lower()
-                        display_names[key] = player_name
-                        total_counts[key] += 1
-                        
-                        # Check if this is the first sunder on this mob
-                        if current_count == 1:
-                            first_counts[key] += 1
-                        
-                        # Check if this is wasted (more than 5 stacks AND cast too early)
-                        if current_count > 5:
-                            # Check if this is a premature cast
-                            if current_time and mob_guid in mob_last_sunder_time:
-                                last_sunder_time = mob_last_sunder_time[mob_guid]
-                                time_since_last = (current_time - last_sunder_time).total_seconds()
-                                
-                                if time_since_last < WASTE_THRESHOLD:
-                                    wasted_counts[key] += 1
-                        
-                        # Update last sunder time for this mob
-                        if current_time:
-                            mob_last_sunder_time[mob_guid] = current_time
-                    
-                    # Clear all pending sunders
-                    pending_sunders.clear()
+        ranges = None
+        if segment is not None or since is not None or until is not None:
+            try:
+                ranges = log_segments.select_ranges(filename, segment, since, until)
+            except ValueError as e:
+                # nothing in the log matched --segment, --since or --until
+                print(f"Error: {e}")
+                return None
+            print(f"- Analyzing {sum(end - start for start, end, _, _ in ranges) / 1024 / 1024:.1f} MB of the log "
+                  f"in {len(ranges)} part{'s' if len(ranges) > 1 else ''}")
+        if use_cache and raw_events is not None and all(tracker.misses <= set(raw_events.MISS_OUTCOMES) for tracker in trackers.values()):
+            events, cached = raw_events.load_raw_events(filename)
+            if cached:
+                print(f"- Loaded {len(events)} parsed casts and misses from {raw_events.cache_path(filename)}")
+            else:
+                print(f"- Cached {len(events)} parsed casts and misses in {raw_events.cache_path(filename)}")
+            track_events(events, trackers, ranges)
+        else:
+            track_log(filename, trackers, ranges)
         
-        print(f"- Found {sunder_cast_count} total sunder casts")
-        print(f"- Successful sunders: {successful_sunder_count} (not missed/dodged/parried)")
-        print(f"- Tracking {len(mob_sunder_counts)} unique mobs")
-        print(f"- Total wasted sunders: {sum(wasted_counts.values())}")
+        for tracker in trackers.values():
+            tracker.print_summary()
                     
     except FileNotFoundError:
         print(f"Error: File '{filename}' not found.")
-        return {}, {}, {}, {}, 0, 0, 0
+        return None
     except Exception as e:
         print(f"Error reading file: {e}")
-        return {}, {}, {}, {}, 0, 0, 0
+        return None
     
-    return wasted_counts, total_counts, first_counts, display_names, sunder_cast_count, successful_sunder_count, len(mob_sunder_counts)
+    return trackers
 
-def display_results(wasted_counts, total_counts, first_counts, display_names, tanks, sunder_cast_count, successful_sunder_count, unique_mobs):
+def analyze_guid_sunders(filename, segment=None, since=None, until=None):
     """
-    Display the sunder statistics in four columns, sorted by true sunders.
+    Analyze sunder armor usage by tracking casts per mob GUID.
+    
+    Args:
+        filename (str): Path to the combat log file
+        segment (str): Only analyze these segments of the log, see log_segments.select_segments
+        since, until: Only analyze the log from and up to before these log_segments.parse_time times
+        
+    Returns:
+        tuple: (wasted_counts, total_counts, first_counts, display_names, sunder_cast_count, successful_sunder_count, unique_mobs)
+    """
+    trackers = analyze_debuffs(filename, ["Sunder Armor"], segment=segment, since=since, until=until)
+    if trackers is None:
+        return {}, {}, {}, {}, 0, 0, 0
+    return trackers["Sunder Armor"].results()
+
+def display_results(wasted_counts, total_counts, first_counts, display_names, tanks, sunder_cast_count, successful_sunder_count, unique_mobs,
+                    label="sunder", plural="sunders", max_stacks=5, refresh_window=SUNDER_DURATION - WASTE_THRESHOLD, logs=None, file=None):
+    """
+    Display the sunder (or other debuff) statistics in four columns, sorted by true sunders.
     
     Args:
         wasted_counts: Dictionary with wasted sunder counts per player
@@ -184,6 +571,12 @@ def display_results(wasted_counts, total_counts, first_counts, display_names, ta
         sunder_cast_count: Total number of sunder casts found
         successful_sunder_count: Number of successful sunders
         unique_mobs: Number of unique mobs tracked
+        label: What a cast of the debuff is called
+        plural: What more than one cast is called
+        max_stacks: Stacks of the debuff before casts can be wasted
+        refresh_window: Seconds left on the debuff below which casts are refreshes
+        logs: Number of logs the counts were merged from, for DebuffResults of many logs
+        file: Where the table is written, stdout if None
     """
    
     # Get all unique players from all three dictionaries
@@ -193,7 +586,7 @@ def display_results(wasted_counts, total_counts, first_counts, display_names, ta
     all_players.update(first_counts.keys())
     
     if not all_players:
-        print("No sunder applications found.")
+        print(f"No {label} applications found.", file=file)
         return
     
     # Calculate true sunders for each player (total - wasted)
@@ -211,8 +604,8 @@ def display_results(wasted_counts, total_counts, first_counts, display_names, ta
     top_first_player = max(all_players, key=lambda x: first_counts.get(x, 0), default=None)  # Include tanks for first sunders
     # No asterisk for True column
     
-    print("\nPlayer            True  First  Landed  Wasted")
-    print("-" * 45) 
+    print("\nPlayer            True  First  Landed  Wasted", file=file)
+    print("-" * 45, file=file)
     
     # Sort by true sunders (descending), then by name (ascending)
     sorted_players = sorted(all_players, 
@@ -233,7 +626,7 @@ def display_results(wasted_counts, total_counts, first_counts, display_names, ta
         
         # Format with fixed-width columns - accounting for asterisks in width
         formatted_name = player_name[:15].ljust(15)
-        print(f"{formatted_name} {true_str:>6}  {first_str:>5} {total_str:>7} {wasted_str:>7}")
+        print(f"{formatted_name} {true_str:>6}  {first_str:>5} {total_str:>7} {wasted_str:>7}", file=file)
     
     # Summary statistics
     total_wasted = sum(wasted_counts.values())
@@ -241,29 +634,132 @@ def display_results(wasted_counts, total_counts, first_counts, display_names, ta
     total_true = sum(true_counts.values())
     total_first = sum(first_counts.values())
     
-    print("-" * 45)
-    print(f"{'TOTAL':<15} {total_true:>6}  {total_first:>5} {total_all:>7} {total_wasted:>7}")
+    print("-" * 45, file=file)
+    print(f"{'TOTAL':<15} {total_true:>6}  {total_first:>5} {total_all:>7} {total_wasted:>7}", file=file)
 
-    print(f"\nTracking {unique_mobs} unique mobs and {sunder_cast_count} total sunder spell casts.")
+    in_logs = f" in {logs} logs" if logs is not None else ""
+    print(f"\nTracking {unique_mobs} unique mobs and {sunder_cast_count} total {label} spell casts{in_logs}.", file=file)
+    if tanks:
+        print(f"- Tanks: {', '.join(tanks)}", file=file)
+    print(f"- Tanks are excluded from Landed/Wasted ranking.", file=file)
+    if max_stacks > 1:
+        print(f"- Wasted {plural} are those cast when a {max_stacks} stack is present\nand has more than {refresh_window} seconds left.", file=file)
+    else:
+        print(f"- Wasted {plural} are those cast when it is already present\nand has more than {refresh_window} seconds left.", file=file)
+    print(f"- Landed {plural} are ones which did not miss/dodge/parry.", file=file)
+    print(f"- True {label} count is Landed minus Wasted.", file=file)
+
+def display_sweep(tracker, thresholds, tanks, csv_file=None):
+    """
+    Display the wasted casts of each player for every threshold, one row per player and one column per threshold,
+    sorted like display_results.  Tanks are marked with a * after their name.
+    
+    Args:
+        tracker: DebuffTracker that recorded intervals
+        thresholds: Waste thresholds in seconds, ascending
+        tanks: List of tank names
+        csv_file: Write the rows here as CSV instead of printing a table
+    """
+    wasted = tracker.sweep(thresholds)
+    # Sort by landed casts (descending), then by name (ascending)
+    players = sorted(wasted, key=lambda x: (-tracker.total_counts[x], x))
+    tank_keys = [t.lower() for t in tanks]
+    columns = [f"{threshold:g}" for threshold in thresholds]
+    
+    if csv_file is not None:
+        writer = csv.writer(csv_file)
+        for player_key in players:
+            writer.writerow([tracker.name, tracker.display_names[player_key], tracker.total_counts[player_key]] + wasted[player_key])
+        return
+    
+    if not players:
+        print(f"No {tracker.label} applications found.")
+        return
+    
+    print(f"\nWasted {tracker.plural} per waste threshold in seconds (currently {tracker.waste_threshold:g})")
+    print(f"{'Player':<16} {'Landed':>6} " + " ".join(f"{column:>5}" for column in columns))
+    print("-" * (24 + 6 * len(columns)))
+    for player_key in players:
+        player_name = tracker.display_names[player_key][:15] + ("*" if player_key in tank_keys else "")
+        print(f"{player_name:<16} {tracker.total_counts[player_key]:>6} " + " ".join(f"{count:>5}" for count in wasted[player_key]))
+    print("-" * (24 + 6 * len(columns)))
+    totals = [sum(wasted[player_key][index] for player_key in players) for index in range(len(thresholds))]
+    print(f"{'TOTAL':<16} {sum(tracker.total_counts.values()):>6} " + " ".join(f"{total:>5}" for total in totals))
     if tanks:
-        print(f"- Tanks: {', '.join(tanks)}")
-    print(f"- Tanks are excluded from Landed/Wasted ranking.")
-    print(f"- Wasted sunders are those cast when a 5 stack is present\nand has more than 8 seconds left.")
-    print(f"- Landed sunders are ones which did not miss/dodge/parry.")
-    print(f"- True sunder count is Landed minus Wasted.")
+        print(f"- Tanks (*): {', '.join(tanks)}")
+
+def parse_thresholds(value):
+    """Thresholds from --sweep START:STOP[:STEP], in seconds including STOP, STEP defaults to 1"""
+    try:
+        parts = [float(part) for part in value.split(":")]
+    except ValueError:
+        parts = []
+    if len(parts) not in (2, 3):
+        raise argparse.ArgumentTypeError(f"expected START:STOP[:STEP] in seconds, got {value}")
+    start, stop = parts[:2]
+    step = parts[2] if len(parts) == 3 else 1
+    if step <= 0 or stop < start:
+        raise argparse.ArgumentTypeError(f"expected START <= STOP and a positive STEP, got {value}")
+    return [round(start + index * step, 6) for index in range(int((stop - start) / step + 1e-9) + 1)]
+
+def parse_debuffs(value):
+    """Debuff names from --debuffs, matched case insensitively against DEBUFFS"""
+    if value.strip().lower() == "all":
+        return list(DEBUFFS)
+    names = {name.lower(): name for name in DEBUFFS}
+    debuffs = []
+    for name in value.split(","):
+        if name.strip().lower() not in names:
+            raise argparse.ArgumentTypeError(f"unknown debuff {name.strip()}, expected all or some of: {', '.join(DEBUFFS)}")
+        debuffs.append(names[name.strip().lower()])
+    return debuffs
 
 def main():
     """Main function to handle command line arguments and run the analysis."""
-    if len(sys.argv) < 2:
-        print("Usage: python guid_sunder_counter.py <rawlogfile> [tank1] [tank2] ...")
-        print("Example: python guid_sunder_counter.py WoWRawCombatLog.txt Maintank Offtank")
-        sys.exit(1)
+    parser = argparse.ArgumentParser(description="Count wasted sunders, or other debuffs, in a raw combat log.",
+                                     epilog="Example: python wasted_sunders_raw.py WoWRawCombatLog.txt Maintank Offtank")
+    parser.add_argument("filename", metavar="rawlogfile", help="the raw combat log")
+    parser.add_argument("tanks", nargs="*", help="tanks to exclude from the Landed/Wasted ranking")
+    parser.add_argument("--debuffs", type=parse_debuffs, default=["Sunder Armor"],
+                        help=f"comma separated debuffs to analyze, or all (default Sunder Armor): {', '.join(DEBUFFS)}")
+    parser.add_argument("--sweep", type=parse_thresholds, metavar="START:STOP[:STEP]",
+                        help="show wasted counts for every waste threshold from START to STOP seconds, e.g. 0:30")
+    parser.add_argument("--sweep-csv", metavar="FILE", help="with --sweep, write the counts as CSV instead, - for stdout")
+    parser.add_argument("--no-cache", action="store_true",
+                        help="parse the log instead of using or writing its .events.npz cache (only used with numpy)")
+    parser.add_argument("--segment", metavar="N|NAME",
+                        help="only analyze these segments of the log: comma separated numbers or ranges like 3-5, "
+                             "or a boss, mob or zone name, python log_segments.py LOGFILE lists them")
+    parser.add_argument("--since", type=log_segments.parse_time, metavar="[M/D ]HH:MM[:SS]",
+                        help="only analyze the log from this time")
+    parser.add_argument("--until", type=log_segments.parse_time, metavar="[M/D ]HH:MM[:SS]",
+                        help="only analyze the log up to before this time")
+    args = parser.parse_args()
+    if args.sweep_csv and not args.sweep:
+        parser.error("--sweep-csv needs --sweep")
     
-    filename = sys.argv[1]
-    tanks = sys.argv[2:] if len(sys.argv) > 2 else []  # Get tank names from remaining arguments
+    # keep the summary out of CSV written to stdout
+    with contextlib.redirect_stdout(sys.stderr) if args.sweep_csv == "-" else contextlib.nullcontext():
+        trackers = analyze_debuffs(args.filename, args.debuffs, record_intervals=bool(args.sweep), use_cache=not args.no_cache,
+                                   segment=args.segment, since=args.since, until=args.until)
+    if trackers is None:
+        trackers = {name: DebuffTracker(name, DEBUFFS[name], bool(args.sweep)) for name in args.debuffs}
+    
+    if args.sweep_csv:
+        with (open(args.sweep_csv, 'w', newline='', encoding='utf-8') if args.sweep_csv != "-" else contextlib.nullcontext(sys.stdout)) as csv_file:
+            csv.writer(csv_file).writerow(["debuff", "player", "landed"] + [f"{threshold:g}" for threshold in args.sweep])
+            for tracker in trackers.values():
+                display_sweep(tracker, args.sweep, args.tanks, csv_file)
+        return
     
-    wasted_counts, total_counts, first_counts, display_names, sunder_cast_count, successful_sunder_count, unique_mobs = analyze_guid_sunders(filename)
-    display_results(wasted_counts, total_counts, first_counts, display_names, tanks, sunder_cast_count, successful_sunder_count, unique_mobs)
+    for tracker in trackers.values():
+        if len(trackers) > 1:
+            print(f"\n=== {tracker.name} ===")
+        if args.sweep:
+            display_sweep(tracker, args.sweep, args.tanks)
+        else:
+            display_results(*tracker.results()[:4], args.tanks, *tracker.results()[4:],
+                            label=tracker.label, plural=tracker.plural, max_stacks=tracker.max_stacks, refresh_window=tracker.refresh_window)
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
@@ -0,0 +1,277 @@
+#!/usr/bin/env python3
+"""
+Watch folders for new and growing combat logs and process each one once it stops changing.
+
+Logs from several clients are dropped into a shared folder.  Every WoWCombatLog*.txt is formatted straight into
+<log>.zip for upload like format_log_for_upload.py --stream-zip, leaving the log untouched, and the wasted sunders of
+every WoWRawCombatLog*.txt are written to <log>.sunders.txt like wasted_sunders_raw.py prints them.
+
+The folders are checked every poll_interval seconds.  A log is processed once its size and modification time haven't
+changed for --settle seconds, so logs still being copied or written to wait until they're done, and again whenever it
+has grown since.  Jobs go to a pool of --jobs worker processes through a queue of at most --queue-size logs; while
+the queue is full the folders aren't checked, so a burst of logs can't pile up unbounded work.  Each log only takes
+one worker, and smaller logs can go ahead of a larger one queued shortly before them: a log of 2**n MB is passed by
+at most the n logs queued after it, so a large log doesn't hold up the others and is never held up forever either.
+
+A log whose zip or sunders file is newer than the log itself is skipped on startup.
+
+Usage: python watch_logs.py FOLDER [FOLDER ...] --player NAME [--player NAME=GLOB ...] [--tanks NAME ...] [--jobs N]
+"""
+
+import argparse
+import asyncio
+import contextlib
+import fnmatch
+import functools
+import io
+import itertools
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import log_input
+from format_log_for_upload import format_log_job, validate_player_name
+from wasted_sunders_raw import DEBUFFS, analyze_debuffs, display_results, parse_debuffs
+
+# seconds between checks of the folders
+poll_interval = 2
+# seconds a log has to stay unchanged before it's processed
+default_settle = 60
+
+
+
+class LogState:
+    """
+    What the watcher knows of one log: stat is its last seen (size, modification time), changed when that last
+    changed, processed the stat it had when it was last processed and queued whether it's waiting for or in a job.
+    """
+
+    __slots__ = ("stat", "changed", "processed", "queued")
+
+    def __init__(self, stat, changed, processed=None):
+        self.stat = stat
+        self.changed = changed
+        self.processed = processed
+        self.queued = False
+
+
+def sunders_path(filename):
+    return os.path.splitext(filename)[0] + ".sunders.txt"
+
+
+def output_path(filename):
+    """The file processing the log writes"""
+    return sunders_path(filename) if log_input.is_raw_log_name(os.path.basename(filename)) else filename + ".zip"
+
+
+def up_to_date(filename, stat):
+    """Whether the output of the log was written after the log was last changed"""
+    try:
+        return os.stat(output_path(filename)).st_mtime_ns >= stat[1]
+    except OSError:
+        return False
+
+
+def size_bucket(size):
+    """How many logs queued after a log of size bytes can go ahead of it, log2 of its size in MB"""
+    return max(0, size.bit_length() - 20)
+
+
+def parse_player(value):
+    """(player name, glob of the log names it's for) from --player NAME or NAME=GLOB"""
+    player_name, _, pattern = value.partition("=")
+    if not validate_player_name(player_name):
+        raise argparse.ArgumentTypeError(f"invalid player name '{player_name}', use only letters, spaces and apostrophes")
+    return player_name.strip(), pattern.strip() or "*"
+
+
+def log_player(filename, players):
+    """Player name of the first --player matching the log's name, None if none does"""
+    name = os.path.basename(filename)
+    return next((player_name for player_name, pattern in players if fnmatch.fnmatch(name, pattern)), None)
+
+
+def sunders_job(filename, names, tanks):
+    """
+    Write the wasted sunders, or other debuffs, of a raw log next to it in a worker process.
+
+    Returns (success, output) like format_log_job.
+    """
+    output = io.StringIO()
+    with contextlib.redirect_stdout(output):
+        trackers = analyze_debuffs(filename, names, use_cache=True)
+    if trackers is None:
+        return False, output.getvalue()
+
+    table = io.StringIO()
+    for tracker in trackers.values():
+        if len(trackers) > 1:
+            print(f"\n=== {tracker.name} ===", file=table)
+        display_results(*tracker.results()[:4], tanks, *tracker.results()[4:], label=tracker.label, plural=tracker.plural,
+                        max_stacks=tracker.max_stacks, refresh_window=tracker.refresh_window, file=table)
+    path = sunders_path(filename)
+    temp_filename = path + ".tmp"
+    try:
+        with open(temp_filename, 'w', encoding='utf-8') as file:
+            file.write(table.getvalue())
+        os.replace(temp_filename, path)
+    except (IOError, OSError) as e:
+        output.write(f"Error writing to file: {e}\n")
+        return False, output.getvalue()
+    output.write(f"Wrote {path}\n")
+    return True, output.getvalue()
+
+
+class LogWatcher:
+    """Finds settled logs in the folders and runs their jobs on a bounded pool of worker processes"""
+
+    def __init__(self, folders, players, names, tanks, jobs=1, queue_size=None, settle=default_settle):
+        self.folders = folders
+        self.players = players
+        self.names = names
+        self.tanks = tanks
+        self.jobs = jobs
+        self.settle = settle
+        self.states = {}  # LogState by path
+        # (order + size_bucket, order, path, stat) of the logs waiting for a worker
+        self.queue = asyncio.PriorityQueue(maxsize=queue_size or jobs * 2)
+        self.order = itertools.count()
+        self.failures = 0
+
+    def find_logs(self):
+        """(path, (size, modification time)) of the logs in the folders"""
+        for folder in self.folders:
+            try:
+                entries = list(os.scandir(folder))
+            except OSError as e:
+                print(f"Error reading folder {folder}: {e}")
+                continue
+            for entry in entries:
+                if not log_input.is_log_name(entry.name):
+                    continue
+                try:
+                    if not entry.is_file():
+                        continue
+                    stat = entry.stat()
+                except OSError:
+                    # removed while listing
+                    continue
+                yield os.path.abspath(entry.path), (stat.st_size, stat.st_mtime_ns)
+
+    async def scan(self):
+        """Queue the logs that settled since they were last processed, waiting while the queue is full"""
+        now = time.monotonic()
+        seen = set()
+        for path, stat in list(self.find_logs()):
+            seen.add(path)
+            state = self.states.get(path)
+            if state is None:
+                # unchanged since it was last modified, logs that were already there don't wait for --settle again
+                changed = now - max(0.0, time.time() - stat[1] / 1e9)
+                state = self.states[path] = LogState(stat, changed, stat if up_to_date(path, stat) else None)
+            elif stat != state.stat:
+                state.stat, state.changed = stat, now
+            if state.queued or state.processed == state.stat or stat[0] == 0 or now - state.changed < self.settle:
+                continue
+            state.queued = True
+            order = next(self.order)
+            await self.queue.put((order + size_bucket(stat[0]), order, path, stat))
+        for path in self.states.keys() - seen:
+            if not self.states[path].queued:
+                del self.states[path]
+
+    def idle(self):
+        """Whether every log has been processed since it last changed"""
+        return all(not state.queued and (state.processed == state.stat or state.stat[0] == 0)
+                   for state in self.states.values())
+
+    def job(self, path):
+        """(job for a worker process, description) of a log, None if there's nothing to do with it"""
+        if log_input.is_raw_log_name(os.path.basename(path)):
+            return functools.partial(sunders_job, path, self.names, self.tanks), "sunders"
+        player_name = log_player(path, self.players)
+        if player_name is None:
+            print(f"[SKIPPED] {path}: no --player given for it")
+            return None
+        return functools.partial(format_log_job, player_name, path, stream_zip=True), f"format+zip as {player_name}"
+
+    async def worker(self, executor):
+        loop = asyncio.get_running_loop()
+        while True:
+            _, _, path, stat = await self.queue.get()
+            try:
+                job = self.job(path)
+                if job is not None:
+                    function, description = job
+                    started = time.monotonic()
+                    try:
+                        success, output = await loop.run_in_executor(executor, function)
+                    except Exception as e:
+                        success, output = False, f"Worker failed: {e}\n"
+                    print(f"[{'OK' if success else 'FAILED'}] {path} ({description}, {stat[0] / 1024 / 1024:.1f} MB "
+                          f"in {time.monotonic() - started:.1f}s)")
+                    for line in output.splitlines():
+                        print(f"    {line}")
+                    if not success:
+                        self.failures += 1
+            finally:
+                # a failed log is tried again once it changes
+                state = self.states.get(path)
+                if state is not None:
+                    state.processed = stat
+                    state.queued = False
+                self.queue.task_done()
+
+    async def run(self, once=False):
+        """Watch until cancelled, or with once until every log there is has been processed"""
+        with ProcessPoolExecutor(max_workers=self.jobs) as executor:
+            workers = [asyncio.create_task(self.worker(executor)) for _ in range(self.jobs)]
+            try:
+                while True:
+                    await self.scan()
+                    if once and self.idle():
+                        break
+                    await asyncio.sleep(poll_interval)
+            finally:
+                for worker in workers:
+                    worker.cancel()
+                await asyncio.gather(*workers, return_exceptions=True)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Format and zip every new or grown combat log in the folders, and "
+                                                 "count the wasted sunders of every raw log, once they stop changing.")
+    parser.add_argument("folders", nargs="+", metavar="FOLDER", help="folders the logs are dropped into")
+    parser.add_argument("--player", dest="players", action="append", type=parse_player, default=[],
+                        metavar="NAME[=GLOB]",
+                        help="player name the logs are formatted for, NAME=GLOB only for logs whose file name "
+                             "matches GLOB like WoWCombatLog-Qcb*.txt, the first match is used")
+    parser.add_argument("--tanks", nargs="*", default=[], help="tanks to exclude from the Landed/Wasted ranking")
+    parser.add_argument("--debuffs", type=parse_debuffs, default=["Sunder Armor"],
+                        help=f"comma separated debuffs to analyze, or all (default Sunder Armor): {', '.join(DEBUFFS)}")
+    parser.add_argument("-j", "--jobs", type=int, default=os.cpu_count() or 1,
+                        help="number of logs processed at once (default the number of CPUs)")
+    parser.add_argument("--queue-size", type=int, help="logs waiting for a worker before the folders aren't checked "
+                                                       "anymore until one is free (default twice --jobs)")
+    parser.add_argument("--settle", type=float, default=default_settle,
+                        help=f"seconds a log has to stay unchanged before it's processed (default {default_settle})")
+    parser.add_argument("--once", action="store_true", help="process the logs there are and exit instead of watching")
+    args = parser.parse_args()
+    for folder in args.folders:
+        if not os.path.isdir(folder):
+            parser.error(f"{folder} is not a folder")
+
+    watcher = LogWatcher(args.folders, args.players, args.debuffs, args.tanks, max(1, args.jobs),
+                         args.queue_size and max(1, args.queue_size), max(0.0, args.settle))
+    print(f"Watching {', '.join(args.folders)} with {watcher.jobs} workers, logs are processed "
+          f"{watcher.settle:g}s after they stop changing, Ctrl+C to stop")
+    try:
+        asyncio.run(watcher.run(args.once))
+    except KeyboardInterrupt:
+        pass
+    if args.once and watcher.failures:
+        raise SystemExit(1)
+
+
+if __name__ == "__main__":
+    main()